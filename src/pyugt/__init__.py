@@ -1,4 +1,8 @@
-from .pyugt import main
 from ._version import __version__
 
+def main(*args, **kwargs):
+    """Launch the hotkeys front end. The GUI and hotkeys modules are imported on call, so that the headless tools (pyugt-batch, pyugt-daemon) can import the package without them."""
+    from .pyugt import main
+    return main(*args, **kwargs)
+
 __all__ = ['main', '__version__']
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Allow to launch pyugt with: python -m pyugt
+
+import sys
+
+from .pyugt import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Auto-tuning of the preprocessing parameters: a grid of candidate filters, binarization thresholds and inversion is tried on a capture in parallel worker threads, each candidate is scored by the mean confidence of the words recognized by Tesseract, and the best candidate is memorized per capture region in config_internal.ini, so that the next captures of the same region (ie, the same game) reuse it without searching again, until the OCR confidence drops.
+# Usage to tune an image from the commandline: python -m pyugt.autotune [-c config.ini] screenshot.png
+
+
+### Imports
+
+## Native python imports
+# To parse the memorized parameters
+import ast
+# To run the candidates in parallel threads
+import concurrent.futures
+import optparse
+import os
+import sys
+# To tune in the background without blocking the captures
+import threading
+import time
+# To gracefully print stack trace in console in case of an exception
+import traceback
+
+## External modules
+from PIL import Image
+import pytesseract
+
+## Local modules
+try:
+    from . import ocrengine
+    from . import preprocessing
+    from . import textblocks
+except ImportError:
+    import ocrengine
+    import preprocessing
+    import textblocks
+
+### Candidates
+
+# Grid of candidate preprocessing parameters, with the same meaning as the preprocessing_* parameters of the config file
+GRID_FILTERS = [None, ['SHARPEN'], ['SMOOTH', 'SHARPEN'], ['UnsharpMask'], ['MedianFilter']]
+GRID_THRESHOLDS = [None, 100, 140, 180, 220]
+GRID_INVERT = [True, False]
+
+def candidates():
+    """All the combinations of the grid of preprocessing parameters"""
+    return [{'filters': filters, 'threshold': threshold, 'invert': invert} for filters in GRID_FILTERS for threshold in GRID_THRESHOLDS for invert in GRID_INVERT]
+
+def words_confidence(tsv):
+    """Mean confidence (0-100) and number of characters of the words recognized by Tesseract, from its TSV output"""
+    words = [w for w in textblocks.parse_tsv(tsv) if w['conf'] >= 0]
+    if not words:
+        return 0.0, 0
+    return sum(w['conf'] for w in words) / len(words), sum(len(w['text']) for w in words)
+
+### Workers
+
+class CandidateScorer(object):
+    """Score the candidates on a screenshot, from several threads: Tesseract releases the GIL, both in-process and as a subprocess, so threads run the candidates in parallel without starting any process (a process pool would relaunch the frozen executable of the GUI app on Windows, and fork the Tk and hotkeys threads on Linux).
+    Each thread gets its own in-process engine, closed by close(), so that the tuning does not hold the warm engines of the captures."""
+    def __init__(self, img, params):
+        self.img = img
+        self.params = params
+        self.local = threading.local()
+        self.engines = []
+        self.lock = threading.Lock()
+
+    def get_engine(self):
+        """In-process engine of the current thread, or None to use pytesseract"""
+        if self.params['engine'] == 'pytesseract' or not ocrengine.tesserocr_available():
+            return None
+        engine = getattr(self.local, 'engine', False)
+        if engine is False:
+            try:
+                engine = ocrengine.TesseractEngine(self.params['lang'], tessdata=self.params['tessdata'])
+                with self.lock:
+                    self.engines.append(engine)
+            except Exception as exc:
+                # Same fallback as the captures
+                engine = None
+            self.local.engine = engine
+        return engine
+
+    def score(self, candidate):
+        """Preprocess the screenshot with a candidate and OCR it. Returns (candidate, mean confidence, number of characters)."""
+        pipeline = preprocessing.PreprocessingPipeline(filters=candidate['filters'], threshold=candidate['threshold'], invert=candidate['invert'])
+        try:
+            img = pipeline(self.img)
+            engine = self.get_engine()
+            tsv = engine.image_to_data(img) if engine is not None else ocrengine.image_to_data(img, self.params['lang'], tessdata=self.params['tessdata'], engine='pytesseract')
+        except Exception as exc:
+            # A candidate that makes Tesseract fail is just a bad candidate
+            return candidate, 0.0, 0
+        confidence, chars = words_confidence(tsv)
+        return candidate, confidence, chars
+
+    def close(self):
+        with self.lock:
+            for engine in self.engines:
+                engine.close()
+            self.engines = []
+
+### Tuning
+
+def tune(img, config, workers=None):
+    """Try all the candidates on a screenshot in parallel threads. Returns the list of (score, candidate, mean confidence, number of characters), best first.
+    The score is the mean words confidence, weighted by the number of characters recognized relatively to the best candidate, so that a candidate recognizing a single word with high confidence does not win over one recognizing the whole text."""
+    params = {'lang': config['USER']['lang_source_ocr'],
+              'tessdata': ocrengine.tessdata_from_bin(config['USER']['PATH_tesseract_bin']),
+              'engine': config['USER'].get('ocr_engine', 'auto')}
+    pytesseract.pytesseract.tesseract_cmd = config['USER']['PATH_tesseract_bin']
+    grid = candidates()
+    workers = min(workers or os.cpu_count() or 1, len(grid))
+    scorer = CandidateScorer(img.convert('RGB'), params)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pyugt-autotune') as executor:
+            results = list(executor.map(scorer.score, grid))
+    finally:
+        scorer.close()
+    max_chars = max(chars for _, _, chars in results) or 1
+    ranking = [(confidence * chars / float(max_chars), candidate, confidence, chars) for candidate, confidence, chars in results]
+    ranking.sort(key=lambda r: r[0], reverse=True)
+    return ranking
+
+def region_key(region):
+    """Key of a capture region in the AUTOTUNE section of config_internal.ini"""
+    return ','.join(str(int(c)) for c in region)
+
+def get_tuned(config_internal, region):
+    """Get the memorized best preprocessing parameters for this capture region, or None if it was not tuned yet"""
+    if region is None or 'AUTOTUNE' not in config_internal:
+        return None
+    value = config_internal['AUTOTUNE'].get(region_key(region))
+    if not value:
+        return None
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return None
+
+class AutoTuner(object):
+    """Tune the preprocessing parameters of the capture regions in a background thread, at most one tuning at a time, and memorize the winners in the internal config file"""
+    # Minimum delay in seconds before a region is tuned again when its OCR confidence is low, so that a region with text that is just hard to read is not tuned continuously
+    retune_interval = 120
+
+    def __init__(self, config_internal_service):
+        self.config_internal_service = config_internal_service
+        self.lock = threading.Lock()
+        self.running = False
+        self.last_tuning = {}  # region -> time of the last tuning
+
+    def get(self, region):
+        """Get the memorized parameters for this region, or None"""
+        return get_tuned(self.config_internal_service.get(), region)
+
+    def needs_tuning(self, region, confidence, config):
+        """Should this region be (re)tuned, given the mean OCR confidence of its last capture (None if unknown)?"""
+        if time.monotonic() - self.last_tuning.get(region, -self.retune_interval) < self.retune_interval:
+            return False
+        if self.get(region) is None:
+            return True
+        return confidence is not None and confidence < float(config['USER'].get('preprocessing_autotune_min_confidence', '60'))
+
+    def submit(self, img, region, config):
+        """Start tuning this region on this screenshot in the background, unless a tuning is already running. Returns True if started."""
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.last_tuning[region] = time.monotonic()
+        thread = threading.Thread(target=self._run, args=(img, region, config), name='pyugt-autotune')
+        thread.daemon = True  # always close thread along with parent process
+        thread.start()
+        return True
+
+    def _run(self, img, region, config):
+        try:
+            start = time.time()
+            ranking = tune(img, config)
+            score, best, confidence, chars = ranking[0]
+            if chars:
+                best = dict(best, confidence=round(confidence, 1))
+                self.config_internal_service.set(region_key(region), repr(best), section='AUTOTUNE')
+                if config['USER']['debug'] == 'True':
+                    print('Auto-tuning of the region %s done in %.1fs, best preprocessing parameters: %r' % (region_key(region), time.time() - start, best))
+        except Exception as exc:
+            print('ERROR: the auto-tuning of the preprocessing parameters failed:')
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                self.running = False
+
+### Main
+
+def main(argv=None):
+    """Tune the preprocessing parameters on a screenshot and print the best candidates"""
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="usage: %prog [options] screenshot.png", description="Find the best preprocessing parameters to OCR a screenshot, to copy into config.ini.")
+    parser.add_option("-c", "--config", dest="config", default=None,
+                        help="Path to the configuration file (default: config.ini)", metavar="FILE")
+    parser.add_option("-w", "--workers", dest="workers", type="int", default=None,
+                        help="Number of worker threads (default: number of CPU cores)")
+    parser.add_option("-n", "--top", dest="top", type="int", default=5,
+                        help="Number of candidates to show (default: 5)")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('Please specify one screenshot to tune.')
+
+    try:
+        from . import configservice
+    except ImportError:
+        import configservice
+    config = configservice.ConfigService(options.config or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')).get()
+    start = time.time()
+    ranking = tune(Image.open(args[0]), config, workers=options.workers)
+    print('Tuned %i candidates in %.1fs, best first:' % (len(ranking), time.time() - start))
+    for score, candidate, confidence, chars in ranking[:options.top]:
+        print('score %.1f (confidence %.1f, %i characters): preprocessing_filters = %s, preprocessing_binarize_threshold = %s, preprocessing_invert = %s' % (score, confidence, chars, candidate['filters'], candidate['threshold'], candidate['invert']))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Machine translator backends, as lazily loaded plugins: the heavy translation libraries (translators and its network stack, deepl, argostranslate with ctranslate2 and sentencepiece/stanza) are only imported when the backend selected by translator_lib is first used or preloaded in the background, so that pyugt starts fast and does not hold in memory the backends that are not used.
+# Third-party backends can be registered with register_backend(), or with an entry point in the pyugt.backends group.
+
+
+### Imports
+
+## Native python imports
+# To import the translation libraries on first use
+import importlib
+# To protect the lazy loading and the registries, and to check the DeepL usage in the background
+import threading
+import time
+# To gracefully print stack trace in console in case of an exception
+import traceback
+
+## Local modules
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+### Backends
+
+class Backend(object):
+    """Base class of the translator backends. Subclasses list the modules to import in `modules`, they are imported once by load(), and implement translate()."""
+    # Modules to import on load, they are then available in self.libs by their full name
+    modules = ()
+    # Can this backend translate a batch of sentences faster than one by one (eg, in a single inference of an offline model)? If so, the captures with several sentences are split into sentences and sent as a batch.
+    batched = False
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.libs = {}
+
+    def load(self):
+        """Import the translation libraries of this backend, only the first time"""
+        if self.loaded:
+            return self
+        with self.lock:
+            if not self.loaded:
+                for name in self.modules:
+                    self.libs[name] = importlib.import_module(name)
+                self.loaded = True
+        return self
+
+    def translate(self, text, langsource, langtarget, config):
+        """Translate a text, config is the USER section of the config file"""
+        raise NotImplementedError
+
+    def translate_batch(self, texts, langsource, langtarget, config):
+        """Translate a list of texts, returns the list of translations. By default they are translated one by one."""
+        return [self.translate(text, langsource, langtarget, config) for text in texts]
+
+    def preload(self, langsource, langtarget, config):
+        """Load the backend in advance, so that the first translation does not pay for the import"""
+        self.load()
+
+class OnlineFreeBackend(Backend):
+    """Free online APIs via the translators module (eg, Google Translate, DeepL free, Baidu, etc), can be throttled: the failures are not retried here, the router skips the backend with a circuit breaker and hedges to the fallback backends"""
+    modules = ('translators',)
+
+    def translate(self, text, langsource, langtarget, config):
+        self.load()
+        # Network timeout, so that a hung request does not hold its thread forever (the router stops waiting for it after translator_timeout anyway)
+        return self.libs['translators'].translate_text(text, translator=config['translator_lib_online_free_service'], from_language=langsource, to_language=langtarget, timeout=float(config.get('translator_timeout', '10')))
+
+class DeepLBackend(Backend):
+    """DeepL API, not throttled but may require payments if too many requests. Currently best in class japaneses -> english translator.
+    A single long-lived client is kept, with its pool of HTTP connections, so that the translations do not pay for a new TCP and TLS connection each time. It is rebuilt only when the authkey or the server change in the config file. A batch of sentences is sent in a single request. The characters usage of the account is checked in the background, to warn before the quota is reached."""
+    modules = ('deepl',)
+    batched = True
+    # Minimum delay in seconds between two checks of the account usage
+    usage_interval = 60.0
+
+    def __init__(self):
+        Backend.__init__(self)
+        self.client = None
+        self.client_params = None
+        self.client_lock = threading.Lock()
+        # Latest known characters usage of the account, (count, limit)
+        self.usage = None
+        self.usage_checked = 0.0
+        self.usage_warned = False
+
+    def get_client(self, config):
+        """Get the client for the authkey and server set in the config file"""
+        self.load()
+        server_url = config.get('translator_lib_deepl_server_url', 'None')
+        params = (config['translator_lib_deepl_authkey'], server_url if server_url != 'None' else None)
+        with self.client_lock:
+            # Network timeout of the requests, without retries: the router already hedges to the fallback backends and skips the failing ones (these settings are global to the deepl library)
+            http_client = self.libs['deepl'].http_client
+            http_client.min_connection_timeout = float(config.get('translator_timeout', '10'))
+            http_client.max_network_retries = 0
+            if self.client is None or params != self.client_params:
+                if self.client is not None and hasattr(self.client, 'close'):
+                    # Close the connections of the previous client, the translations in progress with it can still complete
+                    self.client.close()
+                self.client = self.libs['deepl'].Translator(params[0], server_url=params[1])
+                self.client_params = params
+                self.usage = None
+                self.usage_checked = 0.0
+                self.usage_warned = False
+            return self.client
+
+    def translate(self, text, langsource, langtarget, config):
+        return self.translate_batch([text], langsource, langtarget, config)[0]
+
+    def translate_batch(self, texts, langsource, langtarget, config):
+        client = self.get_client(config)
+        # A list of texts is sent in a single request
+        results = client.translate_text(texts, source_lang=langsource, target_lang=langtarget)
+        metrics.inc('pyugt_translator_characters_total', sum(len(text) for text in texts), backend='deepl')
+        self.check_usage_later(client, config)
+        return [result.text for result in results]
+
+    def check_usage_later(self, client, config):
+        """Check the account usage in a background thread if it was not checked recently, so that the translations do not wait for it"""
+        now = time.monotonic()
+        with self.client_lock:
+            if self.usage_checked and now - self.usage_checked < self.usage_interval:
+                return
+            self.usage_checked = now
+        thread = threading.Thread(target=self.check_usage, args=(client, config), name='pyugt-deepl-usage')
+        thread.daemon = True  # always close thread along with parent process
+        thread.start()
+
+    def check_usage(self, client, config):
+        """Get the characters usage of the account, report it in the metrics and warn once if it is above the translator_lib_deepl_usage_warning ratio of the quota. Returns (count, limit), or None if unknown."""
+        try:
+            usage = client.get_usage()
+        except Exception as exc:
+            print('WARNING: cannot get the DeepL account usage: %s' % exc)
+            return None
+        if not usage.character.valid:
+            return None
+        count, limit = usage.character.count, usage.character.limit
+        self.usage = (count, limit)
+        metrics.set_gauge('pyugt_deepl_characters_used', count)
+        metrics.set_gauge('pyugt_deepl_characters_limit', limit)
+        if config.get('debug', 'False') == 'True':
+            print('DeepL usage: %i of %i characters' % (count, limit))
+        if limit and count >= float(config.get('translator_lib_deepl_usage_warning', '0.9')) * limit and not self.usage_warned:
+            self.usage_warned = True
+            print('WARNING: %i of the %i characters of the DeepL quota are used (%i%%). Consider setting translator_lib_fallback to another translator.' % (count, limit, 100 * count // limit))
+        return self.usage
+
+class ArgosModelRegistry(object):
+    """Registry of Argos Translate models: each language pair is resolved and installed only once (the package index is only queried if the pair is not already installed), and the loaded translation object is kept resident, so that the CTranslate2 model is not reloaded at each translation"""
+    def __init__(self, backend):
+        self.backend = backend
+        self.translations = {}
+        self.lock = threading.Lock()
+        # One lock per language pair, so that installing a model does not block translations with other already loaded pairs
+        self.pair_locks = {}
+        # CTranslate2 models and SentencePiece tokenizers used for the batched translations, by language pair, None if the pair cannot be batched
+        self.batch_models = {}
+
+    def _find_installed(self, from_code, to_code):
+        """Get the translation object for this language pair among the installed packages, or None if not installed"""
+        installed_languages = self.backend.libs['argostranslate.translate'].get_installed_languages()
+        from_lang = next((lang for lang in installed_languages if lang.code == from_code), None)
+        to_lang = next((lang for lang in installed_languages if lang.code == to_code), None)
+        if from_lang is None or to_lang is None:
+            return None
+        return from_lang.get_translation(to_lang)
+
+    def _install(self, from_code, to_code):
+        """Download and install the Argos Translate package for this language pair, this requires an internet connection but is done only once"""
+        package = self.backend.libs['argostranslate.package']
+        package.update_package_index()
+        available_packages = package.get_available_packages()
+        try:
+            package_to_install = next(
+                filter(
+                    lambda x: x.from_code == from_code and x.to_code == to_code, available_packages
+                )
+            )
+        except StopIteration as exc:
+            raise ValueError('ERROR: no matching language found for either the target language %s or source language %s, please check if they are valid for the selected translator!' % (to_code, from_code))
+        package.install_from_path(package_to_install.download())
+
+    def get(self, from_code, to_code):
+        """Get the loaded translation object for this language pair, installing the package if necessary"""
+        key = (from_code, to_code)
+        translation = self.translations.get(key)
+        if translation is not None:
+            return translation
+        self.backend.load()
+        with self.lock:
+            pair_lock = self.pair_locks.setdefault(key, threading.Lock())
+        with pair_lock:
+            # Check again now that we hold the lock, another thread may have loaded the model in the meantime
+            if key in self.translations:
+                return self.translations[key]
+            translation = self._find_installed(from_code, to_code)
+            if translation is None:
+                self._install(from_code, to_code)
+                translation = self._find_installed(from_code, to_code)
+                if translation is None:
+                    raise ValueError('ERROR: could not load the Argos Translate model from %s to %s after installing it!' % (from_code, to_code))
+            self.translations[key] = translation
+            return translation
+
+    def get_batch_model(self, from_code, to_code):
+        """Get the (CTranslate2 translator, SentencePiece processor, target prefix) of this language pair, to translate batches of sentences in a single inference. The CTranslate2 model is shared with the Argos translation object, so it is loaded only once. Returns None if the pair cannot be batched (eg, translation through a pivot language), then the sentences must be translated one by one."""
+        key = (from_code, to_code)
+        if key in self.batch_models:
+            return self.batch_models[key]
+        translation = self.get(from_code, to_code)
+        model = None
+        # Argos may wrap the translation of the package in a cache
+        underlying = getattr(translation, 'underlying', translation)
+        pkg = getattr(underlying, 'pkg', None)
+        if pkg is not None and hasattr(underlying, 'translator'):
+            try:
+                ctranslate2 = importlib.import_module('ctranslate2')
+                sentencepiece = importlib.import_module('sentencepiece')
+                with self.lock:
+                    if underlying.translator is None:
+                        # Load the model as Argos would on the first translation
+                        underlying.translator = ctranslate2.Translator(str(pkg.package_path / 'model'), device=importlib.import_module('argostranslate.settings').device)
+                model = (underlying.translator, sentencepiece.SentencePieceProcessor(model_file=str(pkg.package_path / 'sentencepiece.model')), getattr(pkg, 'target_prefix', '') or '')
+            except Exception as exc:
+                print('WARNING: cannot batch the Argos Translate translations from %s to %s, the sentences will be translated one by one:' % (from_code, to_code))
+                traceback.print_exc()
+        self.batch_models[key] = model
+        return model
+
+    def preload(self, from_code, to_code):
+        """Install and load the model for this language pair in advance, including the CTranslate2 model which is only loaded on the first translation, so that the first translation only pays the inference cost"""
+        try:
+            self.get(from_code, to_code).translate('.')
+        except Exception as exc:
+            print('WARNING: could not preload the Argos Translate model from %s to %s:' % (from_code, to_code))
+            traceback.print_exc()
+
+class ArgosBackend(Backend):
+    """Offline translation using Argos Translate, based on OpenNMT, free and unlimited"""
+    modules = ('argostranslate.package', 'argostranslate.translate')
+    batched = True
+
+    def __init__(self):
+        Backend.__init__(self)
+        # Argos models are resident for the whole life of the process
+        self.registry = ArgosModelRegistry(self)
+
+    def translate(self, text, langsource, langtarget, config):
+        # Get the resident translation model, it is downloaded and installed only the first time a language pair is used
+        return self.registry.get(langsource, langtarget).translate(text)
+
+    def translate_batch(self, texts, langsource, langtarget, config):
+        """Translate all the sentences in a single batched inference of the CTranslate2 model, instead of decoding them one after the other, with the same decoding parameters as Argos Translate"""
+        model = self.registry.get_batch_model(langsource, langtarget)
+        if model is None or len(texts) <= 1:
+            return Backend.translate_batch(self, texts, langsource, langtarget, config)
+        translator, tokenizer, target_prefix = model
+        tokenized = [tokenizer.encode(text, out_type=str) for text in texts]
+        results = translator.translate_batch(tokenized,
+                                             target_prefix=[[target_prefix]] * len(tokenized) if target_prefix else None,
+                                             replace_unknowns=True, max_batch_size=32, beam_size=4, length_penalty=0.2)
+        translations = []
+        for result in results:
+            tokens = result.hypotheses[0]
+            if target_prefix and tokens and tokens[0] == target_prefix:
+                tokens = tokens[1:]
+            translations.append(''.join(tokens).replace('\u2581', ' ').strip())
+        return translations
+
+    def preload(self, langsource, langtarget, config):
+        self.load()
+        if config.get('translator_lib_offline_argos_preload', 'True') == 'True':
+            self.registry.preload(langsource, langtarget)
+
+### Registry
+
+# Backend classes by translator_lib name, either a class or a 'module:class' string for the backends that are imported only when selected
+BACKENDS = {
+    'online_free': OnlineFreeBackend,
+    'deepl': DeepLBackend,
+    'offline_argos': ArgosBackend,
+    }
+# Backend instances, created on first use
+_instances = {}
+_instances_lock = threading.Lock()
+_entry_points_loaded = False
+
+def register_backend(name, cls):
+    """Register a translator backend class, selectable with translator_lib = name"""
+    BACKENDS[name] = cls
+
+def _load_entry_points():
+    """Register the backends provided by other packages through the pyugt.backends entry point group"""
+    global _entry_points_loaded
+    _entry_points_loaded = True
+    try:
+        from importlib.metadata import entry_points
+        eps = entry_points()
+        group = eps.select(group='pyugt.backends') if hasattr(eps, 'select') else eps.get('pyugt.backends', [])
+        for ep in group:
+            BACKENDS.setdefault(ep.name, ep.load())
+    except Exception as exc:
+        print('WARNING: could not load the translator backends plugins:')
+        traceback.print_exc()
+
+def get_backend(name):
+    """Get the backend instance for this translator_lib name. The backend libraries are not imported yet, they are on first translation or preload."""
+    backend = _instances.get(name)
+    if backend is not None:
+        return backend
+    with _instances_lock:
+        if name not in _instances:
+            if name not in BACKENDS and not _entry_points_loaded:
+                _load_entry_points()
+            if name not in BACKENDS:
+                raise ValueError('Specified translator_lib in config.ini does not exist! Please specify one of the following: %s.' % ', '.join(sorted(BACKENDS)))
+            cls = BACKENDS[name]
+            if isinstance(cls, str):
+                # Import the module of the backend, relatively to this package if any
+                module, attr = cls.split(':')
+                cls = getattr(importlib.import_module('%s.%s' % (__package__, module) if __package__ else module), attr)
+            _instances[name] = cls()
+        return _instances[name]
+
+def preload(config):
+    """Load the backend selected by translator_lib (and its model for offline backends), to be called in a background thread"""
+    try:
+        get_backend(config['translator_lib']).preload(config['lang_source_trans'], config['lang_target'], config)
+    except Exception as exc:
+        print('WARNING: could not preload the translator backend %s:' % config['translator_lib'])
+        traceback.print_exc()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Headless batch mode: OCR and translate a folder of screenshots or the frames sampled from a video, without any GUI nor hotkey. The OCR runs in a pool of processes (one per core), identical texts are translated only once, and the results are streamed to a JSONL or CSV file which can be resumed if the batch is interrupted.
+#
+# Usage: pyugt-batch [-c config.ini] [-o results.jsonl] [--every 30] <folder_or_image_or_video> [...]
+
+
+### Imports
+
+## Native python imports
+# For the output files
+import csv
+import json
+# For the pool of OCR processes
+import concurrent.futures
+import multiprocessing
+# for commandline arguments handling
+import optparse
+import os
+import sys
+# To report the progress
+import time
+# To keep the results in order while they are being translated
+from collections import deque
+
+## External modules
+from PIL import Image
+# For Optical Character Recognition
+import pytesseract
+# To extract frames from videos, optional (pip install opencv-python)
+try:
+    import cv2
+except ImportError:  # pragma: no cover
+    cv2 = None
+
+## Local modules
+try:
+    from . import ocrengine
+    from . import preprocessing
+except ImportError:
+    import ocrengine
+    import preprocessing
+
+### Configuration
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+VIDEO_EXTS = ('.mp4', '.avi', '.mkv', '.webm', '.mov', '.wmv', '.flv')
+
+# Number of results to write between two flushes of the output file to disk (checkpoints)
+CHECKPOINT_EVERY = 50
+
+### Inputs
+
+def iter_inputs(paths, every=30):
+    """Generate (item_id, source) couples from a list of images, videos or folders of images. For images, source is the path. For videos, source is a RGB frame array, one frame every `every` frames, and item_id is path#frame."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTS:
+                    filepath = os.path.join(path, name)
+                    yield filepath, filepath
+        elif os.path.splitext(path)[1].lower() in VIDEO_EXTS:
+            for item in iter_video_frames(path, every=every):
+                yield item
+        else:
+            yield path, path
+
+def iter_video_frames(path, every=30):
+    """Sample one frame every `every` frames from a video"""
+    if cv2 is None:
+        raise ImportError('opencv is required to process videos, please install it with: pip install opencv-python')
+    video = cv2.VideoCapture(path)
+    try:
+        index = 0
+        while True:
+            # grab() only demuxes the frame, it is decoded by retrieve() only for the sampled frames
+            if not video.grab():
+                break
+            if index % every == 0:
+                ok, frame = video.retrieve()
+                if not ok:
+                    break
+                yield '%s#%i' % (path, index), cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            index += 1
+    finally:
+        video.release()
+
+### OCR workers
+
+# Config of the worker processes, set by the pool initializer
+_worker_config = None
+
+def init_worker(config):
+    """Initialize an OCR worker process"""
+    global _worker_config
+    _worker_config = config
+    pytesseract.pytesseract.tesseract_cmd = config['USER']['PATH_tesseract_bin']
+
+def ocr_item(item):
+    """OCR one input in a worker process, with the same preprocessing as the interactive mode. Returns (item_id, ocrtext, error), error being None or the message of the exception if the input could not be read or OCR'ed, so that a single bad input does not abort the whole batch."""
+    item_id, source = item
+    config = _worker_config
+    try:
+        if isinstance(source, str):
+            img = Image.open(source).convert('RGB')
+        else:
+            img = Image.fromarray(source)
+        img = preprocessing.preprocess(img, config)
+        ocrtext = ocrengine.image_to_string(img, config['USER']['lang_source_ocr'], tessdata=ocrengine.tessdata_from_bin(config['USER']['PATH_tesseract_bin']), engine=config['USER'].get('ocr_engine', 'auto'))
+    except Exception as exc:
+        return item_id, '', '%s: %s' % (type(exc).__name__, exc)
+    return item_id, ocrtext.strip(), None
+
+### Outputs
+
+class ResultWriter(object):
+    """Stream the results to a JSONL or CSV file, in append mode so that an interrupted batch can be resumed"""
+    fields = ('id', 'ocr', 'translation', 'error')
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.format = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        self.count = 0
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'a', encoding='utf-8', newline='')
+        if self.format == 'csv':
+            self.csv = csv.DictWriter(self.file, fieldnames=self.fields)
+            if not exists:
+                self.csv.writeheader()
+
+    @staticmethod
+    def failed(record):
+        """Did the OCR or the translation of this record fail? Then it is not considered as processed, so that a resumed batch retries it."""
+        return bool(record.get('error')) or record.get('translation') == 'ERROR'
+
+    @classmethod
+    def done_ids(cls, path, fmt=None):
+        """Get the ids already successfully processed in an existing output file, to resume a batch. The failed inputs are processed again, and their new result is appended (the last record of an id is the latest)."""
+        done = set()
+        if not os.path.exists(path):
+            return done
+        fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            if fmt == 'csv':
+                records = csv.DictReader(f)
+            else:
+                records = []
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # Last line may be truncated if the batch was killed while writing, it will be processed again
+                        pass
+            for record in records:
+                if 'id' in record and not cls.failed(record):
+                    done.add(record['id'])
+        return done
+
+    def write(self, item_id, ocrtext, transtext, error=None):
+        record = {'id': item_id, 'ocr': ocrtext, 'translation': transtext, 'error': error}
+        if self.format == 'csv':
+            self.csv.writerow(record)
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.count += 1
+        if self.count % CHECKPOINT_EVERY == 0:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+### Batch
+
+def run_batch(config, inputs, output, fmt=None, workers=None, translate_workers=4, every=30, translate=None, verbose=True):
+    """OCR and translate all the inputs and stream the results to the output file. translate is a callable taking a text and returning its translation, or None to only OCR. Returns the number of processed inputs."""
+    done = ResultWriter.done_ids(output, fmt)
+    if done and verbose:
+        print('Resuming: %i input(s) already processed in %s' % (len(done), output))
+    items = (item for item in iter_inputs(inputs, every=every) if item[0] not in done)
+    workers = workers or os.cpu_count() or 1
+    writer = ResultWriter(output, fmt)
+    # Translations are deduplicated: each distinct text is translated only once, the other occurrences reuse the same future
+    translations = {}
+    pending = deque()
+    start = time.time()
+    count = 0
+    errors = 0
+    try:
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(config,)) as pool, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=translate_workers) as translator:
+            # imap keeps the inputs order, while the processes OCR the next inputs in the background
+            for item_id, ocrtext, error in pool.imap(ocr_item, items, chunksize=4):
+                if error is not None:
+                    print('ERROR: cannot OCR %s: %s' % (item_id, error))
+                    errors += 1
+                    future = None
+                elif translate is not None and ocrtext:
+                    future = translations.get(ocrtext)
+                    if future is None:
+                        future = translator.submit(translate, ocrtext)
+                        translations[ocrtext] = future
+                else:
+                    future = None
+                pending.append((item_id, ocrtext, future, error))
+                # Write all the results at the head of the queue that are ready, in order
+                while pending and (pending[0][2] is None or pending[0][2].done()):
+                    count += write_result(writer, *pending.popleft())
+                if verbose and count and count % 100 == 0:
+                    print('%i input(s) processed (%.1f/s)' % (count, count / (time.time() - start)))
+            while pending:
+                count += write_result(writer, *pending.popleft())
+    finally:
+        writer.close()
+    if verbose:
+        print('Done: %i input(s) processed in %.1fs, %i distinct text(s) translated.' % (count, time.time() - start, len(translations)))
+        if errors:
+            print('%i input(s) could not be OCR\'ed, they will be retried if the batch is run again with the same output file.' % errors)
+    return count
+
+def write_result(writer, item_id, ocrtext, future, error=None):
+    transtext = ''
+    if future is not None:
+        try:
+            transtext = future.result()
+        except Exception as exc:
+            print('ERROR: cannot translate %s: %s' % (item_id, exc))
+            transtext, error = 'ERROR', '%s: %s' % (type(exc).__name__, exc)
+    writer.write(item_id, ocrtext, transtext, error)
+    return 1
+
+def main(argv=None):
+    # Commandline arguments
+    parser = optparse.OptionParser(usage='%prog [options] <folder_or_image_or_video> [...]')
+    parser.add_option("-c", "--config", dest="config", default=None,
+                        help="Path to the config file with user specified parameters (default: config.ini)", metavar="FILE")
+    parser.add_option("-o", "--output", dest="output", default='pyugt_batch.jsonl',
+                        help="Path to the output file, a .csv extension selects the CSV format, else JSONL. If the file already exists, the inputs already processed are skipped (default: pyugt_batch.jsonl)", metavar="FILE")
+    parser.add_option("-f", "--format", dest="format", default=None, choices=['jsonl', 'csv'],
+                        help="Output format: jsonl or csv (default: from the output file extension)")
+    parser.add_option("-w", "--workers", dest="workers", type="int", default=None,
+                        help="Number of OCR processes (default: number of cores)")
+    parser.add_option("--translate-workers", dest="translate_workers", type="int", default=4,
+                        help="Number of concurrent translations (default: 4)")
+    parser.add_option("--every", dest="every", type="int", default=30,
+                        help="For videos, OCR one frame every N frames (default: 30)")
+    parser.add_option("--ocr-only", dest="ocr_only", action="store_true", default=False,
+                        help="Only OCR, do not translate (also enabled by ocr_only in the config file)")
+    (options, args) = parser.parse_args(argv)
+    if not args:
+        parser.error('Please specify at least one folder, image or video to process.')
+
+    # Reuse the interactive mode config and translators, imported here so that the OCR worker processes do not need to load the translators modules. The core module does not load the GUI nor the hotkeys.
+    try:
+        from . import core
+    except ImportError:
+        import core
+    configparsed = core.read_config(options.config, default_path='config.ini')
+    # Convert to plain dicts, to be sent to the worker processes
+    config = dict((name, dict(configparsed[name])) for name in configparsed.sections())
+    if not os.path.exists(config['USER']['PATH_tesseract_bin']):
+        print("ERROR: can't find Tesseract v5 binaries, please update the config.ini file to point to the binaries!")
+        return 1
+
+    translate = None
+    if not options.ocr_only and config['USER']['ocr_only'] != 'True':
+        langsource, langtarget = config['USER']['lang_source_trans'], config['USER']['lang_target']
+        def translate(text):
+            if config['USER']['remove_line_returns'] == 'True':
+                text = text.replace("\n", "")
+            return core.translate_any(config, text, langsource, langtarget)
+
+    run_batch(config, args, options.output, fmt=options.format, workers=options.workers, translate_workers=options.translate_workers, every=options.every, translate=translate)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Reproducible benchmark of the capture-to-translation pipeline: synthetic dialogue boxes are rendered with PIL at several resolutions and over several backgrounds (including translucent boxes over a busy game scene), and each stage of translateRegion is timed separately. Runs offline and without any display, the translation stage uses a local stub translator.
+#
+# Usage: python -m pyugt.benchmark [-o results.json] [-b baseline.json] [-t 0.2]
+# The exit code is 1 if a stage is slower than in the baseline by more than the tolerance, so that it can be used in CI.
+
+
+### Imports
+
+## Native python imports
+# For the results files
+import json
+# for commandline arguments handling
+import optparse
+import os
+import platform
+# For the reproducible synthetic scenes
+import random
+# For the statistics of the timings
+import statistics
+# To measure the startup in a fresh interpreter
+import subprocess
+import sys
+import time
+
+## External modules
+import PIL
+from PIL import Image, ImageDraw, ImageFont
+
+## Local modules
+try:
+    from . import capture
+    from . import ocrengine
+    from . import preprocessing
+    from . import transcache
+except ImportError:
+    import capture
+    import ocrengine
+    import preprocessing
+    import transcache
+# The local stub translator of the tests, so that the translation stage is measured offline and deterministically. The benchmark is run from the source tree (see the Makefile), the stubs are not installed with pyugt.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'tests'))
+import stubs
+
+### Configuration
+
+# Sizes of the rendered dialogue boxes (width, height), from a small window game to a full HD dialogue box
+RESOLUTIONS = [(640, 160), (1280, 320), (1920, 480)]
+# Backgrounds of the dialogue box: solid (opaque box), gradient (opaque box with a vertical gradient), translucent (semi-transparent box over a busy game scene, the hardest case for OCR)
+BACKGROUNDS = ['solid', 'gradient', 'translucent']
+# Dialogues to render, for each language
+TEXTS = {
+    'jpn': ['勇者よ、よくぞ戻った。', '魔王の城は北の山の向こうにある。', 'この剣を持っていけ。'],
+    'eng': ['Welcome back, hero.', 'The demon castle lies beyond the northern mountains.', 'Take this sword with you.'],
+    }
+# Fonts supporting japanese, searched in this order, else the default PIL font is used (then japanese glyphs are not rendered properly, but the timings of the preprocessing are still meaningful)
+CJK_FONTS = ['NotoSansCJK-Regular.ttc', 'NotoSansJP-Regular.otf', 'NotoSansJP-Regular.ttf', 'msgothic.ttc', 'meiryo.ttc', 'YuGothM.ttc', 'ヒラギノ角ゴシック W3.ttc', 'ipag.ttf', 'fonts-japanese-gothic.ttf', 'DroidSansFallbackFull.ttf']
+FONT_DIRS = ['C:/Windows/Fonts', '/usr/share/fonts', '/usr/local/share/fonts', '/System/Library/Fonts', '/Library/Fonts', os.path.expanduser('~/.fonts')]
+
+# Preprocessing parameters, same as the defaults of config.ini
+FILTERS = ['SHARPEN']
+THRESHOLD = 180
+
+# Default tolerance for the regression comparison: a stage is considered slower if its best time (the least affected by the noise of other processes) increased by more than 20% and by more than 0.5 ms (to ignore the noise on the very fast stages)
+TOLERANCE = 0.2
+MIN_DIFF_MS = 0.5
+
+### Synthetic scenes
+
+def find_font(names=CJK_FONTS, dirs=FONT_DIRS):
+    """Find the path to a font supporting japanese, or None"""
+    for fontdir in dirs:
+        if not os.path.isdir(fontdir):
+            continue
+        for root, _, files in os.walk(fontdir):
+            for name in names:
+                if name in files:
+                    return os.path.join(root, name)
+    return None
+
+def load_font(path, size):
+    if path is not None:
+        return ImageFont.truetype(path, size)
+    try:
+        # PILLOW >= 10.1 provides a scalable default font
+        return ImageFont.load_default(size)
+    except TypeError:
+        return ImageFont.load_default()
+
+def render_scene(size, background, lang, fontpath=None, seed=0):
+    """Render a synthetic dialogue box, returned as the raw BGRA bytes as they come from the screen grabber, so that the frame conversion can be timed too"""
+    rng = random.Random(seed)
+    width, height = size
+    if background == 'translucent':
+        # Busy game scene: random colored shapes
+        scene = Image.new('RGB', size, (40, 90, 40))
+        draw = ImageDraw.Draw(scene)
+        for _ in range(60):
+            x, y = rng.randrange(width), rng.randrange(height)
+            r = rng.randrange(5, height // 2)
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        # Semi-transparent dark dialogue box over it
+        box = Image.new('RGBA', size, (0, 0, 40, 160))
+        img = Image.alpha_composite(scene.convert('RGBA'), box).convert('RGB')
+    elif background == 'gradient':
+        img = Image.new('RGB', size)
+        draw = ImageDraw.Draw(img)
+        for y in range(height):
+            c = 20 + 80 * y // height
+            draw.line((0, y, width, y), fill=(c // 2, c // 2, c))
+    else:
+        img = Image.new('RGB', size, (10, 10, 60))
+    # White dialogue text, on 3 lines
+    draw = ImageDraw.Draw(img)
+    font = load_font(fontpath, max(12, height // 6))
+    lines = TEXTS[lang]
+    for i, line in enumerate(lines):
+        draw.text((width // 20, height // 10 + i * height * 3 // 10), line, fill=(255, 255, 255), font=font)
+    # Convert to BGRA, the format of the screen grabber
+    r, g, b = img.split()
+    return Image.merge('RGBA', (b, g, r, Image.new('L', size, 255))).tobytes(), '\n'.join(lines)
+
+### Timings
+
+def timeit(func, repeat=5, warmup=1):
+    """Time a function, returns the list of timings in milliseconds and the last result"""
+    result = None
+    for _ in range(warmup):
+        result = func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, result
+
+def summarize(timings):
+    return {'median_ms': round(statistics.median(timings), 4), 'min_ms': round(min(timings), 4), 'mean_ms': round(statistics.mean(timings), 4), 'runs': len(timings)}
+
+def ocr_available():
+    """Is Tesseract available (in-process or as a binary)?"""
+    if ocrengine.tesserocr_available():
+        return True
+    try:
+        ocrengine.pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def bench_case(size, background, lang, fontpath=None, repeat=5, ocr=True, translator=None):
+    """Time each stage of the capture-to-translation pipeline on one synthetic scene. Returns a dict of stage -> summary."""
+    results = {}
+    raw, text = render_scene(size, background, lang, fontpath=fontpath)
+    frame = capture.Frame(raw, size)
+
+    # Frame conversion from the raw BGRA buffer of the grabber into a PIL image, with a new image and with a reused buffer (watch mode)
+    timings, img = timeit(frame.to_image, repeat=repeat)
+    results['frame_conversion'] = summarize(timings)
+    buffer = frame.to_image()
+    timings, _ = timeit(lambda: frame.to_image(into=buffer), repeat=repeat)
+    results['frame_conversion_reuse'] = summarize(timings)
+
+    # Preprocessing, stage by stage: greyscale conversion + upscale + filters, then binarization, then inversion
+    pipe = preprocessing.PreprocessingPipeline(filters=FILTERS, threshold=None, invert=False, threads=1)
+    timings, filtered = timeit(lambda: pipe.process(img.convert('L'))[0], repeat=repeat)
+    results['preprocessing_filters'] = summarize(timings)
+    lut = preprocessing.binarize_lut(THRESHOLD)
+    timings, _ = timeit(lambda: filtered.point(lut, mode='1'), repeat=repeat)
+    results['binarization'] = summarize(timings)
+    timings, _ = timeit(lambda: filtered.point(preprocessing.INVERT_LUT), repeat=repeat)
+    results['inversion'] = summarize(timings)
+    fused = preprocessing.binarize_invert_lut(THRESHOLD)
+    timings, _ = timeit(lambda: filtered.point(fused), repeat=repeat)
+    results['binarization_inversion_fused'] = summarize(timings)
+    # Whole preprocessing as done by the OCR stage, with the default parameters of config.ini
+    fullpipe = preprocessing.PreprocessingPipeline(filters=FILTERS, threshold=THRESHOLD, invert=True, threads=1)
+    timings, preprocessed = timeit(lambda: fullpipe(img), repeat=repeat)
+    results['preprocessing_total'] = summarize(timings)
+
+    # OCR, only if Tesseract is installed
+    if ocr:
+        timings, ocrtext = timeit(lambda: ocrengine.image_to_string(preprocessed, lang), repeat=repeat)
+        results['ocr'] = summarize(timings)
+    else:
+        ocrtext = text
+
+    # Translation against the stub backend: cold (cache miss, only the translator call is timed) and warm (hit of the translation cache, created beforehand)
+    translator = translator or stubs.StubBackend()
+    cache = transcache.TranslationCache(maxsize=16)
+    timings, transtext = timeit(lambda: translator.translate(ocrtext, lang, 'en', {}), repeat=repeat)
+    results['translation'] = summarize(timings)
+    cache.put(ocrtext, lang, 'en', 'stub', transtext)
+    timings, _ = timeit(lambda: cache.get(ocrtext, lang, 'en', 'stub'), repeat=repeat)
+    results['translation_cached'] = summarize(timings)
+    return results
+
+def run(resolutions=RESOLUTIONS, backgrounds=BACKGROUNDS, langs=('jpn', 'eng'), repeat=5, ocr=None, latency=0.0, fontpath=None, verbose=True):
+    """Run the whole benchmark suite, returns a dict with the environment metadata and the results keyed by case/stage"""
+    if ocr is None:
+        ocr = ocr_available()
+    if fontpath is None:
+        fontpath = find_font()
+    translator = stubs.StubBackend(latency=latency)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': repeat,
+            'ocr': ocr,
+            'font': os.path.basename(fontpath) if fontpath else 'default',
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            },
+        'results': {},
+        }
+    for lang in langs:
+        for size in resolutions:
+            for background in backgrounds:
+                case = '%s/%ix%i/%s' % (lang, size[0], size[1], background)
+                stages = bench_case(size, background, lang, fontpath=fontpath, repeat=repeat, ocr=ocr, translator=translator)
+                for stage, summary in stages.items():
+                    report['results']['%s/%s' % (case, stage)] = summary
+                if verbose:
+                    print('%s: %s' % (case, ', '.join('%s %.2f ms' % (stage, summary['median_ms']) for stage, summary in stages.items())))
+    return report
+
+# Script run in a fresh interpreter to measure the startup: import of the main module (which is what `python -m pyugt` does before registering the hotkeys), then optionally load translator backends (the ones whose libraries are not installed or fail to import are skipped), and report the elapsed time and peak resident memory
+STARTUP_SCRIPT = r"""
+import json, sys, time
+start = time.perf_counter()
+import pyugt.pyugt
+from pyugt import backends
+imported = time.perf_counter()
+loaded_backends, missing = [], []
+for name in sys.argv[1:]:
+    try:
+        backends.get_backend(name).load()
+        loaded_backends.append(name)
+    except Exception as exc:
+        missing.append('%s (%s)' % (name, type(exc).__name__))
+loaded = time.perf_counter()
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+except ImportError:
+    import psutil
+    rss = psutil.Process().memory_info().peak_wset / (1024.0 * 1024)
+print(json.dumps({'import_ms': 1000 * (imported - start), 'backends_ms': 1000 * (loaded - imported), 'total_ms': 1000 * (loaded - start), 'rss_mb': rss, 'loaded': loaded_backends, 'missing': missing}))
+"""
+
+def bench_startup(repeat=3, eager=('online_free', 'deepl', 'offline_argos'), verbose=True):
+    """Measure the startup time and peak memory of pyugt in fresh interpreters: lazy (the translator backends are not loaded, as with the lazy plugins) versus eager (all the backends are loaded, as when they were imported with the main module)"""
+    results = {}
+    for case, names in (('lazy', ()), ('eager', eager)):
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT] + list(names), check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results['startup/%s' % case] = summarize([run['total_ms'] for run in runs])
+        results['startup/%s' % case]['rss_mb'] = round(max(run['rss_mb'] for run in runs), 1)
+        results['startup/%s' % case]['backends'] = runs[-1]['loaded']
+        if verbose:
+            print('startup %s: %.0f ms, peak RSS %.1f MB%s' % (case, results['startup/%s' % case]['median_ms'], results['startup/%s' % case]['rss_mb'], ' (backends loaded: %s)' % ', '.join(runs[-1]['loaded']) if runs[-1]['loaded'] else ''))
+            if runs[-1]['missing']:
+                print('startup %s: skipped the backends that could not be loaded: %s' % (case, ', '.join(runs[-1]['missing'])))
+    return results
+
+def compare(report, baseline, tolerance=TOLERANCE, min_diff_ms=MIN_DIFF_MS):
+    """Compare the results with a baseline, returns the list of regressions as (key, baseline time, new time) tuples. The best times are compared, as they are the most reproducible."""
+    regressions = []
+    for key, summary in report['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        old, new = base['min_ms'], summary['min_ms']
+        if new > old * (1 + tolerance) and new - old > min_diff_ms:
+            regressions.append((key, old, new))
+    return regressions
+
+def main(argv=None):
+    # Commandline arguments
+    parser = optparse.OptionParser()
+    parser.add_option("-o", "--output", dest="output", default='benchmark.json',
+                        help="Path to the JSON file where to save the results (default: benchmark.json)", metavar="FILE")
+    parser.add_option("-b", "--baseline", dest="baseline", default=None,
+                        help="Path to the JSON results of a previous run to compare with, the exit code is 1 if a regression is found", metavar="FILE")
+    parser.add_option("-t", "--tolerance", dest="tolerance", type="float", default=TOLERANCE,
+                        help="Relative slowdown of the best time above which a stage is considered a regression (default: %.2f)" % TOLERANCE)
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=5,
+                        help="Number of timed runs per stage (default: 5)")
+    parser.add_option("--latency", dest="latency", type="float", default=0.0,
+                        help="Simulated latency of the stub translator in seconds (default: 0)")
+    parser.add_option("--no-ocr", dest="ocr", action="store_false", default=None,
+                        help="Skip the OCR stage (it is skipped automatically if Tesseract is not installed)")
+    parser.add_option("--font", dest="font", default=None,
+                        help="Path to a font supporting japanese to render the dialogues (default: autodetect)", metavar="FILE")
+    parser.add_option("--quick", dest="quick", action="store_true", default=False,
+                        help="Only benchmark the smallest resolution, for a quick check")
+    parser.add_option("--startup", dest="startup", action="store_true", default=False,
+                        help="Also measure the startup time and memory of pyugt, with the translator backends loaded lazily versus all loaded at import (requires pyugt to be importable, the translators libraries that are not installed are skipped)")
+    (options, args) = parser.parse_args(argv)
+
+    report = run(resolutions=RESOLUTIONS[:1] if options.quick else RESOLUTIONS, repeat=options.repeat, ocr=options.ocr, latency=options.latency, fontpath=options.font)
+    if options.startup:
+        report['results'].update(bench_startup())
+    if not report['meta']['ocr']:
+        print('Note: OCR stage skipped (Tesseract not found).')
+    with open(options.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    print('Results saved in %s' % options.output)
+
+    if options.baseline:
+        if not os.path.exists(options.baseline):
+            print('No baseline found at %s, skipping the comparison (copy %s there to create one).' % (options.baseline, options.output))
+            return 0
+        with open(options.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, tolerance=options.tolerance)
+        if regressions:
+            print('%i regression(s) compared to the baseline:' % len(regressions))
+            for key, old, new in regressions:
+                print('  %s: %.2f ms -> %.2f ms (%+.0f%%)' % (key, old, new, 100 * (new - old) / old))
+            return 1
+        print('No regression compared to the baseline.')
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
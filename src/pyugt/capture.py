@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Screen capture subsystem: one reusable screen grabber per thread (mss is not thread-safe, see https://github.com/BoboTiG/python-mss/issues/273), frames exposed as views over the raw BGRA pixels, and optional reuse of the converted images for high-rate captures without allocation churn.
+
+
+### Imports
+
+## Native python imports
+# For the per-thread grabbers and buffers
+import threading
+
+## External modules
+# For (cross-platform) screenshots
+import mss
+from PIL import Image
+
+### Frames
+
+class Frame(object):
+    """A captured frame, holding the raw BGRA pixels as returned by the screen grabber, without any copy. It is converted to a PIL image only on demand."""
+    def __init__(self, raw, size):
+        self.raw = raw
+        self.size = size
+
+    @property
+    def bgra(self):
+        """Zero-copy view of the raw BGRA pixels"""
+        return memoryview(self.raw)
+
+    def to_image(self, into=None):
+        """Convert to a RGB PIL image. If into is a RGB PIL image of the same size, the pixels are decoded in place into it instead of allocating a new image."""
+        if into is not None and into.size == self.size:
+            into.frombytes(self.bgra, 'raw', 'BGRX')
+            return into
+        return Image.frombytes('RGB', self.size, self.bgra, 'raw', 'BGRX')
+
+### Grabbers
+
+class ScreenGrabber(object):
+    """Screen grabber that can be shared between threads: each thread lazily gets its own mss instance, which is then reused for all the captures of this thread (it's much faster than creating a new one at each capture, per https://python-mss.readthedocs.io/examples.html#benchmark)"""
+    def __init__(self):
+        self._local = threading.local()
+
+    def _sct(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = mss.mss()
+            self._local.sct = sct
+            # Buffers of converted images, reused across high-rate captures, one per region size
+            self._local.images = {}
+        return sct
+
+    @property
+    def monitors(self):
+        """List of monitors, the first one being all monitors combined, then the monitors are 1-indexed"""
+        return self._sct().monitors
+
+    def grab(self, region):
+        """Capture a region of the screen (a dict with top, left, width, height or a monitor from self.monitors) and return a Frame"""
+        sct_img = self._sct().grab(region)
+        # Use the raw buffer directly, ScreenShot.bgra would make a copy
+        return Frame(sct_img.raw, sct_img.size)
+
+    def grab_image(self, region, reuse=False):
+        """Capture a region of the screen and return a RGB PIL image.
+        If reuse is True, the same image object is reused for all captures of the same size in this thread, to avoid allocating a new image at each capture in high-rate captures: the image is then only valid until the next capture in this thread, so it must be copied if it needs to be kept."""
+        frame = self.grab(region)
+        if not reuse:
+            return frame.to_image()
+        images = self._local.images
+        img = frame.to_image(into=images.get(frame.size))
+        images[frame.size] = img
+        return img
+
+    def close(self):
+        """Close the grabber of the current thread"""
+        sct = getattr(self._local, 'sct', None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+            self._local.images = {}
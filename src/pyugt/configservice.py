@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Config files service: the config files are re-parsed only when they change on disk (mtime or size), and are handed out as immutable snapshots with precomputed typed values. Writes to the internal config file are debounced and atomic.
+
+
+### Imports
+
+## Native python imports
+# To parse lists and tuples values
+import ast
+# To flush pending writes on exit
+import atexit
+# To parse config files
+import configparser
+# To detect changes and write atomically
+import os
+import tempfile
+# To share the services between threads and debounce writes
+import threading
+# To overlay parameters over the USER section
+from collections import ChainMap
+# For the immutable snapshots
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
+### Helpers
+
+def parse_value(value):
+    """Convert a raw config string into a typed value: booleans, None, integers, floats, lists/tuples/dicts, else the string itself"""
+    if value in ('True', 'False'):
+        return value == 'True'
+    if value == 'None':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    if value[:1] in ('[', '(', '{'):
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+    return value
+
+### Snapshots
+
+class FrozenSection(Mapping):
+    """Read-only section of a config snapshot, with case-insensitive keys like configparser"""
+    def __init__(self, items):
+        self._items = dict((key.lower(), value) for key, value in items)
+
+    def __getitem__(self, key):
+        return self._items[key.lower()]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key.lower() in self._items
+
+class ConfigSnapshot(Mapping):
+    """Immutable parsed view of a config file. Sections can be accessed like with configparser (eg, config['USER']['debug'] returns the raw string 'True'), and the region to capture is parsed once in config.region."""
+    def __init__(self, sections, fullpath):
+        self.fullpath = fullpath
+        self._sections = dict((name, FrozenSection(items.items())) for name, items in sections.items())
+        # Parsed region to capture (x0, y0, x1, y1), or None if not set
+        region = parse_value(self._sections['INTERNAL'].get('region', 'None')) if 'INTERNAL' in self._sections else None
+        self.region = tuple(region) if isinstance(region, (tuple, list)) else None
+
+    def __getitem__(self, section):
+        return self._sections[section]
+
+    def __iter__(self):
+        return iter(self._sections)
+
+    def __len__(self):
+        return len(self._sections)
+
+class OverlayConfig(Mapping):
+    """View of a config snapshot where some parameters of the USER section are overridden (eg, by the profile of a named region, or by the parameters of a request to the daemon), so that it can be used anywhere a config is expected"""
+    def __init__(self, config, overrides):
+        self.config = config
+        # Both are case-insensitive mappings, like configparser
+        self.user = ChainMap(overrides if isinstance(overrides, FrozenSection) else FrozenSection(dict(overrides).items()), config['USER'])
+
+    def __getitem__(self, section):
+        if section == 'USER':
+            return self.user
+        return self.config[section]
+
+    def __iter__(self):
+        return iter(self.config)
+
+    def __len__(self):
+        return len(self.config)
+
+### Services
+
+class ConfigService(object):
+    """Serve snapshots of a config file, re-parsing it only when it was modified on disk, so that the user can still edit it on-the-fly without paying for the parsing at each hotkey"""
+    def __init__(self, path):
+        self.fullpath = os.path.abspath(path)
+        self.lock = threading.Lock()
+        self._stamp = None
+        self._sections = None
+        self._snapshot = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.fullpath)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _parse(self):
+        """Parse the config file into a dict of dicts of raw strings"""
+        parser = configparser.ConfigParser()
+        parser.read(self.fullpath)
+        return dict((name, dict(parser[name])) for name in parser.sections())
+
+    def _build_snapshot(self):
+        return ConfigSnapshot(self._sections, self.fullpath)
+
+    def get(self):
+        """Get a snapshot of the config file, re-parsed only if the file changed since the last call"""
+        stamp = self._stat()
+        with self.lock:
+            if self._snapshot is None or (stamp is not None and stamp != self._stamp):
+                if stamp is None and self._sections is None:
+                    raise IOError('Specified configuration file (%s) does not exist!' % self.fullpath)
+                if stamp is not None:
+                    self._sections = self._parse()
+                    self._stamp = stamp
+                self._snapshot = self._build_snapshot()
+            return self._snapshot
+
+class InternalConfigService(ConfigService):
+    """Config service for the internal config file, which the program also writes to. Writes are applied immediately to the served snapshots, but are coalesced and written to disk atomically only after a delay without new writes (eg, the translation box position is updated dozens of times per second while the window is being dragged)."""
+    def __init__(self, path, write_delay=1.0):
+        ConfigService.__init__(self, path)
+        self.write_delay = write_delay
+        self._pending = {}
+        self._timer = None
+        # Write pending values on exit
+        atexit.register(self.flush)
+
+    def _build_snapshot(self):
+        sections = dict((name, dict(items)) for name, items in (self._sections or {}).items())
+        for (section, key), value in self._pending.items():
+            sections.setdefault(section, {})[key] = value
+        return ConfigSnapshot(sections, self.fullpath)
+
+    def set(self, key, value, section='INTERNAL', flush=False):
+        """Set a value, the file will be written after write_delay seconds without new writes, or immediately if flush is True"""
+        # Load the current state first, so that the pending value is overlaid over it
+        current = self.get()
+        with self.lock:
+            if section in current and current[section].get(key) == value:
+                # Nothing changed, avoid any write
+                return
+            self._pending[(section, key.lower())] = value
+            self._snapshot = None  # will be rebuilt with the pending value on the next get()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not flush:
+                self._timer = threading.Timer(self.write_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Write the pending values to disk atomically (write to a temporary file and then rename it over the config file, so that the file is never left half written)"""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            # Re-read the file from disk, in case it was modified externally in the meantime
+            parser = configparser.ConfigParser()
+            parser.read(self.fullpath)
+            for (section, key), value in self._pending.items():
+                if not parser.has_section(section):
+                    parser.add_section(section)
+                parser[section][key] = value
+            dirpath = os.path.dirname(self.fullpath)
+            fd, tmppath = tempfile.mkstemp(prefix='.pyugt_', suffix='.ini', dir=dirpath)
+            try:
+                with os.fdopen(fd, 'w') as cfg:
+                    parser.write(cfg)
+                os.replace(tmppath, self.fullpath)
+            except Exception:
+                os.remove(tmppath)
+                raise
+            self._pending.clear()
+            self._sections = dict((name, dict(parser[name])) for name in parser.sections())
+            self._stamp = self._stat()
+            self._snapshot = None
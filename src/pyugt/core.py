@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Core of the OCR and translation, without any GUI nor hotkey: config files reading, preprocessing and OCR of the screenshots, translation with the translators, caches and translation memory. Shared by the hotkeys front end (pyugt.py), the headless batch mode and the daemon, which can import it without loading tkinter nor keyboard.
+
+
+### Imports
+
+## Native python imports
+# To parse config file
+import configparser
+# For path handling
+import os
+# To share the caches, translators and OCR slots between the threads
+import threading
+# To gracefully print stack trace in console in case of an exception
+import traceback
+
+## Local modules
+# Fallback to absolute imports when launched directly as a script (eg, for the pyInstaller build)
+try:
+    from . import autotune  # auto-tuning of the preprocessing parameters per capture region
+except ImportError:
+    import autotune
+try:
+    from . import daemon  # client of the daemon mode, sharing warm OCR engines, translators and caches between processes
+except ImportError:
+    import daemon
+try:
+    from . import framehandoff  # asynchronous debug screenshots
+except ImportError:
+    import framehandoff
+try:
+    from . import metrics  # per-stage latency histograms and counters, exported in the Prometheus format
+except ImportError:
+    import metrics
+try:
+    from . import ocrengine  # warm in-process Tesseract engines, with pytesseract as a fallback
+except ImportError:
+    import ocrengine
+try:
+    from . import preprocessing  # compiled screenshots preprocessing before OCR
+except ImportError:
+    import preprocessing
+try:
+    from . import router  # machine translators, imported lazily on first use, with hedging between translators and circuit breakers
+except ImportError:
+    import router
+try:
+    from . import segmenter  # sentence segmentation, to translate the sentences of a capture as a batch
+except ImportError:
+    import segmenter
+try:
+    from . import textblocks  # structured OCR results and per-block incremental translation
+except ImportError:
+    import textblocks
+try:
+    from . import transmemory  # fuzzy translation memory, tolerating OCR noise
+except ImportError:
+    import transmemory
+try:
+    from . import transcache  # two-tier translation cache (in-memory LRU + on-disk SQLite)
+except ImportError:
+    import transcache
+
+### Config
+
+def read_config(configFileArg=None, default_path='config.ini'):
+    """Read a config file, either in the default path or in the provided path. Raises IOError if the config file does not exist."""
+    # Path to current script (to find the config file)
+    curpath = os.path.dirname(os.path.abspath(__file__))
+    # Load config file
+    config = configparser.ConfigParser()
+    if configFileArg:
+        # Specified by user
+        configFile = os.path.abspath(configFileArg)
+    else:
+        # Default path
+        configFile = os.path.join(curpath, default_path)
+    # Check the path exists
+    if not os.path.exists(configFile):
+        raise IOError('Specified configuration file (%s) does not exist!' % configFile)
+    # Load up the config file in memory
+    config.read(configFile)
+    # Add an attribute to the config object to store the fullpath, so that we can overwrite the config file later
+    config.fullpath = configFile
+    # Return the fully loaded config file
+    return config
+
+### Translation
+
+# Translation cache, created on first use from the config file parameters, and recreated if these parameters change
+_translation_cache = None
+_translation_cache_params = None
+_translation_cache_lock = threading.Lock()
+
+def get_translation_cache(config):
+    """Get the translation cache configured in the config file, or None if the cache is disabled"""
+    global _translation_cache, _translation_cache_params
+    if config['USER'].get('translation_cache', 'True') != 'True':
+        return None
+    params = (int(config['USER'].get('translation_cache_size', '1024')),
+              config['USER'].get('translation_cache_path', 'None'),
+              float(config['USER'].get('translation_cache_max_mb', '64')))
+    with _translation_cache_lock:
+        if _translation_cache is None or params != _translation_cache_params:
+            if _translation_cache is not None:
+                # The translations in progress may still use the previous cache, once closed it only misses and does not store anymore
+                _translation_cache.close()
+            maxsize, path, max_mb = params
+            _translation_cache = transcache.TranslationCache(maxsize=maxsize, path=path if path != 'None' else None, max_bytes=int(max_mb * 1024 * 1024))
+            _translation_cache_params = params
+        return _translation_cache
+
+# Fuzzy translation memory, created on first use and seeded from the logs, recreated if the logs change in the config file
+_translation_memory = None
+_translation_memory_params = None
+_translation_memory_lock = threading.Lock()
+
+def get_translation_memory(config):
+    """Get the fuzzy translation memory, or None if it is disabled"""
+    global _translation_memory, _translation_memory_params
+    if config['USER'].get('translation_memory', 'True') != 'True':
+        return None
+    params = (config['USER']['log_ocr'], config['USER']['log_translation'], config['USER'].get('log_store', 'None'))
+    with _translation_memory_lock:
+        if _translation_memory is None or params != _translation_memory_params:
+            _translation_memory = transmemory.TranslationMemory()
+            _translation_memory_params = params
+            # Seed with the translations of the previous sessions from the logs, in the background as the logs can be big
+            transmemory.seed_in_background(_translation_memory, config)
+        return _translation_memory
+
+def translator_backend_name(config, translator_lib=None):
+    """Get a name identifying the currently selected translator (or translator_lib if provided), used to avoid mixing up cached translations from different translators"""
+    if translator_lib is None:
+        translator_lib = config['USER']['translator_lib']
+    if translator_lib == 'online_free':
+        return '%s:%s' % (translator_lib, config['USER']['translator_lib_online_free_service'])
+    return translator_lib
+
+# Router of the translations between the primary and fallback translators
+TRANSLATOR_ROUTER = router.BackendRouter()
+
+# Client of the daemon, rebuilt if its url changes in the config file
+_daemon_client = None
+_daemon_client_params = None
+_daemon_client_lock = threading.Lock()
+
+def get_daemon_client(config):
+    """Get the client of the daemon set in the config file, or None to process everything in this process"""
+    global _daemon_client, _daemon_client_params
+    params = config['USER'].get('daemon_url', 'None')
+    with _daemon_client_lock:
+        if params != _daemon_client_params:
+            _daemon_client = daemon.DaemonClient(params) if params != 'None' else None
+            _daemon_client_params = params
+        return _daemon_client
+
+def translate_any(config, ocrtext, langsource_trans, langtarget, use_cache=True, trace=None, fuzzy=None):
+    """Helper function to select a translator according to config file and return a translation, and manage exceptions gracefully.
+    Translations are cached, set use_cache=False to bypass the cache lookup and force a new translation (the new translation will still be stored in the cache).
+    If a metrics.Trace is provided, the timings of the cache lookup and translation are added to it.
+    If a list is provided as fuzzy, the similarity is appended to it when the translation is the translation of a similar text from the fuzzy translation memory."""
+    client = get_daemon_client(config)
+    if client is not None:
+        # Thin client: the daemon translates with its own warm translators, cache and translation memory
+        try:
+            with metrics.span('translate', trace):
+                transtext, score = client.translate(ocrtext, langsource_trans, langtarget, use_cache=use_cache)
+            if fuzzy is not None and score is not None:
+                fuzzy.append(score)
+            return transtext
+        except daemon.DaemonError as exc:
+            print('ERROR: %s, translating locally instead.' % exc)
+    # Lookup the translation cache first, games repeat the same dialogues and menus constantly
+    cache = get_translation_cache(config)
+    backend = translator_backend_name(config)
+    if cache is not None and use_cache:
+        with metrics.span('cache_lookup', trace):
+            transtext = cache.get(ocrtext, langsource_trans, langtarget, backend)
+        if transtext is not None:
+            metrics.inc('pyugt_translation_cache_hits_total')
+            if config['USER']['debug'] == 'True':
+                print('Translation cache hit (%i hits, %i misses)' % (cache.hits, cache.misses))
+            return transtext
+        metrics.inc('pyugt_translation_cache_misses_total')
+    # Then lookup the fuzzy translation memory, the same text often comes back from the OCR with a few wrong characters
+    memory = get_translation_memory(config)
+    if memory is not None and use_cache:
+        with metrics.span('memory_lookup', trace):
+            match = memory.lookup(ocrtext, langsource_trans, langtarget, threshold=float(config['USER'].get('translation_memory_threshold', '0.9')))
+        if match is not None:
+            transtext, score, matched = match
+            metrics.inc('pyugt_translation_memory_hits_total')
+            if config['USER']['debug'] == 'True':
+                print('Translation memory fuzzy match (similarity %.2f) with: %s' % (score, matched))
+            if fuzzy is not None and score < 1.0:
+                fuzzy.append(score)
+            return transtext
+    # Send ocr text to the machine translator, but first select which translator we want
+    transtext = ''
+    metrics.inc('pyugt_translations_total', backend=backend)
+    try:
+        with metrics.span('translate', trace):
+            # Split the text into sentences for the translators that translate a batch of sentences faster than a long text (eg, offline models)
+            segments = None
+            if config['USER'].get('translator_split_sentences', 'True') == 'True' and TRANSLATOR_ROUTER.batched(config['USER']):
+                segments = segmenter.split_sentences(ocrtext)
+            if segments and sum(1 for sentence, _ in segments if sentence.strip()) > 1:
+                transtext, answered = translate_sentences(config, segments, langsource_trans, langtarget, use_cache=use_cache)
+            else:
+                # The router sends the text to translator_lib, and hedges to the fallback translators if it is too slow, failing or throttled. The backends are imported on first use, if they were not preloaded.
+                transtext, answered = TRANSLATOR_ROUTER.translate(config['USER'], ocrtext, langsource_trans, langtarget)
+    except router.AllBackendsFailed as exc:
+        print('ERROR: %s' % exc)
+        transtext = 'ERROR'
+    except Exception as exc:
+        # When querying online services, we can always run into exceptions and availability issues, then this may crash the app, so we need to catch the exception
+        print('ERROR: an exception occurred while trying to translate text:')
+        traceback.print_exc()
+        transtext = 'ERROR'
+    else:
+        if answered != config['USER']['translator_lib'] and config['USER']['debug'] == 'True':
+            print('Translated by the fallback translator %s' % answered)
+        if cache is not None and transtext:
+            # Cache under the translator that actually answered, so that a fallback translation does not shadow the primary translator once it is available again
+            cache.put(ocrtext, langsource_trans, langtarget, translator_backend_name(config, answered), transtext)
+        if memory is not None and transtext:
+            memory.add(ocrtext, langsource_trans, langtarget, transtext)
+    return transtext
+
+def translate_sentences(config, segments, langsource_trans, langtarget, use_cache=True):
+    """Translate a text split into sentences (as returned by segmenter.split_sentences): each sentence is cached independently, the sentences repeated in the text or already in the cache are reused, and only the others are sent to the translator, as a single batch. Returns (translation, name of the backend that answered)."""
+    cache = get_translation_cache(config)
+    backend = translator_backend_name(config)
+    translations = {}
+    for sentence, _ in segments:
+        sentence = sentence.strip()
+        if sentence and sentence not in translations:
+            translations[sentence] = cache.get(sentence, langsource_trans, langtarget, backend) if cache is not None and use_cache else None
+    missing = [sentence for sentence, transtext in translations.items() if transtext is None]
+    if config['USER']['debug'] == 'True':
+        print('Translating %i new sentence(s) out of %i' % (len(missing), len(translations)))
+    answered = config['USER']['translator_lib']
+    if missing:
+        results, answered = TRANSLATOR_ROUTER.translate_batch(config['USER'], missing, langsource_trans, langtarget)
+        for sentence, transtext in zip(missing, results):
+            translations[sentence] = transtext
+            if cache is not None and transtext:
+                cache.put(sentence, langsource_trans, langtarget, translator_backend_name(config, answered), transtext)
+    return segmenter.join_sentences(segments, [translations[sentence.strip()] if sentence.strip() else sentence for sentence, _ in segments], langtarget), answered
+
+
+### OCR
+
+# Background writer of the debug screenshots, created on first use
+_debug_writer = None
+_debug_writer_lock = threading.Lock()
+
+def get_debug_writer():
+    global _debug_writer
+    with _debug_writer_lock:
+        if _debug_writer is None:
+            _debug_writer = framehandoff.AsyncImageWriter(min_interval=1.0)
+        return _debug_writer
+
+
+def preprocessImage(img, config, tuned=None):
+    """Preprocess screenshot to improve OCR accuracy (particularly over translucent backgrounds). The preprocessing pipeline is compiled once per config (or per auto-tuned parameters) into lookup tables, with the binarization and inversion fused in one pass."""
+    return preprocessing.preprocess(img, config, tuned)
+
+def ocrImage(img, config, autotuner=None, previewer=None, region=None, trace=None, preview=True, cancelled=None):
+    """Preprocess a screenshot and OCR it with the parameters of the config (which can be the profile of a named region). Returns (OCR'ed text, blocks), the blocks being None except in blocks mode.
+    The preprocessing parameters of the region are auto-tuned if an autotuner is provided, and the preprocessed screenshot is shown in the previewer if provided.
+    If cancelled is provided, it is called before the OCR, to skip it if the capture was superseded in the meantime (the OCR text is then empty)."""
+    client = get_daemon_client(config)
+    if client is not None:
+        # Thin client: the daemon preprocesses and OCRs the screenshot with its own warm engines, with the parameters of this config
+        try:
+            with metrics.span('ocr', trace):
+                return client.ocr(img, daemon.request_params(config))
+        except daemon.DaemonError as exc:
+            print('ERROR: %s, OCRing locally instead.' % exc)
+    lang = config['USER']['lang_source_ocr']
+    blocks_mode = config['USER'].get('ocr_mode', 'text') == 'blocks'
+    # Auto-tuned preprocessing parameters of this region, if any
+    autotuning = autotuner is not None and region is not None and config['USER']['preprocessing'] == 'True' and config['USER'].get('preprocessing_autotune', 'False') == 'True'
+    tuned = autotuner.get(region) if autotuning else None
+    with metrics.span('preprocessing', trace):
+        offset = (0, 0)
+        if config['USER'].get('preprocessing_autocrop', 'False') == 'True':
+            # Crop the captured region to its text lines, so that the upscale, filters and OCR only work on the text. The lines are stacked into a montage, except for vertical languages (the lines are columns) and in blocks mode (the positions of the text must be kept), then only the bounding box of the text is cropped.
+            img, offset = preprocessing.autocrop(img, montage=not (blocks_mode or lang.endswith('_vert')))
+        source = img
+        img = preprocessImage(img, config, tuned)
+
+    if preview:
+        # Save preprocessed screenshot if in debug mode
+        if config['USER']['debug'] == 'True':
+            get_debug_writer().save(img, 'debugtranslatepreproc.png')
+        # Refresh OCR preview image if the preview window is shown, the image is handed over in memory to the GUI thread
+        if previewer is not None and previewer.shown:
+            previewer.submit(img)
+
+    # Tesseract OCR to extract text, directly from a PIL image object in memory using a warm in-process Tesseract engine (the traineddata is loaded only once), or else via the pytesseract wrapper which saves a temporary file and launches the tesseract binary each time
+    tessdata = ocrengine.tessdata_from_bin(config['USER']['PATH_tesseract_bin'])
+    ocr_engine = config['USER'].get('ocr_engine', 'auto')
+    confidence = None
+    blocks = None
+    # Limit the number of OCRs running at the same time, whatever their origin (pipeline workers, named regions, watch mode), so that a burst of captures does not start more Tesseract instances than there are CPU cores
+    with get_ocr_slots(config):
+        if cancelled is not None and cancelled():
+            return '', None
+        if blocks_mode or autotuning:
+            # Word-level OCR, grouped into blocks with their bounding boxes (in the coordinates of the captured region, so that they can later be placed back on screen) and confidences, each block will be translated separately
+            # The auto-tuning also needs the words confidences, to detect when the tuned parameters do not fit the region anymore
+            with metrics.span('ocr', trace):
+                tsv = ocrengine.image_to_data(img, lang, tessdata=tessdata, engine=ocr_engine)
+        else:
+            with metrics.span('ocr', trace):
+                ocrtext = ocrengine.image_to_string(img, lang, tessdata=tessdata, engine=ocr_engine)
+    if blocks_mode:
+        # The autocrop never builds a montage in blocks mode, so the offset maps the blocks back to the captured region
+        pipe = preprocessing.get_pipeline(config, tuned)
+        blocks = textblocks.blocks_from_tsv(tsv, lang, scale=pipe.scale if pipe.enabled else 1, offset=offset)
+        ocrtext = textblocks.blocks_text(blocks)
+    elif autotuning:
+        # Only the words confidences are needed, the whole text is translated at once as in text mode, so the blocks positions are not computed (they are meaningless on an autocrop montage anyway)
+        ocrtext = textblocks.tsv_text(tsv, lang)
+    if blocks_mode or autotuning:
+        confidence = autotune.words_confidence(tsv)[0]
+    if autotuning and autotuner.needs_tuning(region, confidence, config):
+        # Region never tuned or the OCR confidence dropped (eg, another game or scene): tune it in the background on this capture, the next captures will use the winner
+        if autotuner.submit(source.copy(), region, config) and config['USER']['debug'] == 'True':
+            print('Auto-tuning the preprocessing parameters of the region (OCR confidence: %s)' % ('%.1f' % confidence if confidence is not None else 'unknown'))
+    return ocrtext, blocks
+
+# Semaphore limiting the number of concurrent OCRs, rebuilt if the limit changes in the config file
+_ocr_slots = None
+_ocr_slots_params = None
+_ocr_slots_lock = threading.Lock()
+
+def get_ocr_slots(config):
+    """Get the semaphore limiting the number of OCRs running at the same time"""
+    global _ocr_slots, _ocr_slots_params
+    params = int(config['USER'].get('ocr_max_concurrency', '0')) or os.cpu_count() or 1
+    with _ocr_slots_lock:
+        if params != _ocr_slots_params:
+            # The OCRs holding the previous semaphore release it when they are done
+            _ocr_slots = threading.BoundedSemaphore(params)
+            _ocr_slots_params = params
+        return _ocr_slots
+
+
+### Blocks
+
+# Memo of the blocks translated in the previous capture
+BLOCKS_TRANSLATOR = textblocks.IncrementalTranslator()
+
+
+# Memos of the blocks translated in the previous capture of each named region
+_regions_blocks_translators = {}
+_regions_blocks_translators_lock = threading.Lock()
+
+def get_blocks_translator(name=None):
+    """Get the memo of the blocks translated in the previous capture of this named region (or of the single region if name is None)"""
+    if name is None:
+        return BLOCKS_TRANSLATOR
+    with _regions_blocks_translators_lock:
+        return _regions_blocks_translators.setdefault(name, textblocks.IncrementalTranslator())
+
+def translateText(config, ocrtext, blocks=None, trace=None, fuzzy=None, blocks_translator=None):
+    """Translate an OCR'ed text (or its blocks in blocks mode) with the parameters of the config (which can be the profile of a named region). Returns (the text as sent to the translator, the translation)."""
+    if config['USER']['ocr_only'] == 'True':
+        # Do not translate if ocr_only is enabled
+        transtext = ''
+    elif blocks is not None:
+        # Translate each block separately, only the blocks that changed since the previous capture are sent to the translator
+        langsource, langtarget = config['USER']['lang_source_trans'], config['USER']['lang_target']
+        def translate_block(text):
+            if config['USER']['remove_line_returns'] == 'True':
+                # Join the lines of a block, which usually form a single sentence or paragraph
+                text = text.replace("\n", "")
+            return translate_any(config, text, langsource, langtarget, trace=trace, fuzzy=fuzzy)
+        sent = (blocks_translator or BLOCKS_TRANSLATOR).translate(blocks, translate_block, key=(langsource, langtarget, translator_backend_name(config), config['USER']['remove_line_returns']))
+        if config['USER']['debug'] == 'True':
+            print('Translated %i changed block(s) out of %i' % (sent, len(blocks)))
+        transtext = '\n\n'.join(block.transtext for block in blocks)
+    else:
+        if config['USER']['remove_line_returns'] == 'True':
+            # If enabled, remove line returns automatically, so that we consider all sentences to be one (this can help the translator make more sense because it will have more context to work with).
+            ocrtext = ocrtext.replace("\n", "")
+        # Send ocr text to the machine translator
+        transtext = translate_any(config, ocrtext, config['USER']['lang_source_trans'], config['USER']['lang_target'], trace=trace, fuzzy=fuzzy)
+    return ocrtext, transtext
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Daemon mode: a single process keeps the OCR engines, the translators (and their offline models) and the translation caches warm, and serves the preprocessing -> OCR -> translation pipeline over a localhost HTTP API, so that several tools (the pyugt hotkeys front end, batch scripts, a text hooker...) share them instead of each loading its own copy.
+# Usage: pyugt-daemon [-c config.ini] [--port 8750] [--workers 4]
+# Endpoints (all the answers are JSON):
+# - POST /ocr: the body is an image file (any format readable by PIL). Answers {"text": ..., "blocks": [...]}, the blocks being only given if ocr_mode = blocks.
+# - POST /translate: the body is a JSON object {"text": ..., "source": ..., "target": ..., "use_cache": true} (source and target default to lang_source_trans and lang_target), sent as application/json. Answers {"translation": ..., "fuzzy": similarity or null}.
+# - POST /pipeline: the body is an image file. Answers {"ocr": ..., "translation": ...}.
+# - GET /health: status of the daemon.
+# The OCR and translation parameters of the config file (eg, lang_source_ocr, preprocessing_*) can be overridden per request in the query string, eg: POST /ocr?lang_source_ocr=eng&preprocessing_invert=False
+# The images must be sent as application/octet-stream or image/*: the requests with the content types that any web page can send to localhost without a CORS preflight (text/plain, forms) are rejected, so that a web page opened in the browser cannot use the translators (and their quotas) through the daemon.
+
+
+### Imports
+
+## Native python imports
+# For the bounded pool of workers
+import concurrent.futures
+# For the HTTP API
+from http.server import BaseHTTPRequestHandler, HTTPServer
+# To send the images to the daemon
+import io
+import json
+import optparse
+import os
+import sys
+import threading
+import time
+# To gracefully print stack trace in console in case of an exception
+import traceback
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import Request, urlopen
+
+## External modules
+from PIL import Image
+
+## Local modules
+try:
+    from ._version import __version__
+except ImportError:
+    from _version import __version__
+try:
+    from . import configservice
+    from . import metrics
+    from . import textblocks
+except ImportError:
+    import configservice
+    import metrics
+    import textblocks
+
+### Parameters
+
+# Default port of the daemon
+DEFAULT_PORT = 8750
+# Maximum size of a request body, in bytes
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+# Parameters of the USER section that can be overridden per request, the other ones (eg, the translators and their keys, the caches) are those of the daemon
+OVERRIDABLE_KEYS = ('lang_source_ocr', 'lang_source_trans', 'lang_target', 'ocr_mode', 'ocr_only', 'remove_line_returns', 'preprocessing')
+OVERRIDABLE_PREFIXES = ('preprocessing_',)
+# Content types accepted for the images. The content types of the CORS simple requests (text/plain, application/x-www-form-urlencoded, multipart/form-data) are not, because the browsers send them cross-origin without asking the daemon first.
+IMAGE_CONTENT_TYPES = ('application/octet-stream', 'image/')
+
+def overridable(key):
+    key = key.lower()
+    return key in OVERRIDABLE_KEYS or key.startswith(OVERRIDABLE_PREFIXES)
+
+def request_params(config):
+    """Get the overridable parameters of a config, to send them with a request so that the daemon processes it like the local pipeline would"""
+    return dict((key, value) for key, value in config['USER'].items() if overridable(key))
+
+def request_config(config, params):
+    """Get the config to process a request: the config of the daemon, overridden by the overridable parameters of the request. The daemon never forwards to another daemon."""
+    overrides = dict((key, value) for key, value in params.items() if overridable(key))
+    overrides['daemon_url'] = 'None'
+    return configservice.OverlayConfig(config, overrides)
+
+def blocks_to_json(blocks):
+    return [{'text': block.text, 'bbox': list(block.bbox), 'conf': block.conf} for block in blocks]
+
+def blocks_from_json(data):
+    return [textblocks.TextBlock(block['text'], tuple(block['bbox']), block['conf']) for block in data]
+
+### Server
+
+class DaemonError(Exception):
+    """The daemon could not be reached, or failed to process a request"""
+    pass
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """Handler of the daemon API. The processing itself is done by the functions of the core module (the same ones as the hotkeys front end)."""
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', '0'))
+        if length > MAX_BODY_SIZE:
+            raise DaemonError('request body too big (%i bytes, maximum %i)' % (length, MAX_BODY_SIZE))
+        return self.rfile.read(length) if length else b''
+
+    def content_type(self):
+        return self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+    def read_json(self, body):
+        try:
+            data = json.loads(body.decode('utf-8') or '{}')
+        except ValueError as exc:
+            raise DaemonError('invalid JSON body: %s' % exc)
+        if not isinstance(data, dict):
+            raise DaemonError('the JSON body must be an object, not %s' % type(data).__name__)
+        return data
+
+    def read_image(self, body):
+        try:
+            img = Image.open(io.BytesIO(body))
+            img.load()
+        except Exception as exc:
+            raise DaemonError('cannot read the image: %s' % exc)
+        return img
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/health':
+            return self.send_json(404, {'error': 'not found'})
+        self.send_json(200, self.server.health())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        server = self.server
+        start = time.perf_counter()
+        if url.path not in ('/translate', '/ocr', '/pipeline'):
+            return self.send_json(404, {'error': 'not found'})
+        # Check the content type before reading the body, the requests that a web page could send cross-origin are never processed
+        content_type = self.content_type()
+        if url.path == '/translate' and content_type != 'application/json':
+            return self.send_json(415, {'error': 'the body of /translate must be sent as application/json'})
+        if url.path != '/translate' and not content_type.startswith(IMAGE_CONTENT_TYPES):
+            return self.send_json(415, {'error': 'the image must be sent as application/octet-stream or image/*'})
+        try:
+            body = self.read_body()
+            if url.path == '/translate':
+                params.update(self.read_json(body))
+                result = server.translate(params)
+            elif url.path == '/ocr':
+                result = server.ocr(self.read_image(body), params)
+            else:
+                result = server.pipeline(self.read_image(body), params)
+        except (DaemonError, ValueError, KeyError) as exc:
+            return self.send_json(400, {'error': str(exc)})
+        except Exception as exc:
+            traceback.print_exc()
+            return self.send_json(500, {'error': '%s: %s' % (type(exc).__name__, exc)})
+        duration = time.perf_counter() - start
+        metrics.REGISTRY.observe('pyugt_daemon_request_seconds', duration, endpoint=url.path)
+        result['seconds'] = duration
+        self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        # Do not print each request in the console
+        pass
+
+class DaemonServer(HTTPServer):
+    """Localhost HTTP server processing the requests in a bounded pool of workers: at most workers requests are processed at the same time, and at most backlog more wait for a worker, beyond that the requests are rejected immediately (503) instead of piling up."""
+    # Answer of the rejected requests, sent without parsing the request
+    BUSY_RESPONSE = b'HTTP/1.0 503 Service Unavailable\r\nContent-Type: application/json\r\nContent-Length: 23\r\nConnection: close\r\n\r\n{"error": "overloaded"}'
+
+    def __init__(self, config_service, port=DEFAULT_PORT, host='127.0.0.1', workers=4, backlog=16):
+        HTTPServer.__init__(self, (host, port), DaemonHandler)
+        self.config_service = config_service
+        self.workers = workers
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pyugt-daemon')
+        self.slots = threading.BoundedSemaphore(workers + backlog)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.active = 0
+        self.requests = 0
+        self.rejected = 0
+        # The core module is imported here, so that the clients importing this module do not load the translators and OCR modules
+        try:
+            from . import core
+        except ImportError:
+            import core
+        self.core = core
+
+    @property
+    def url(self):
+        return 'http://%s:%i' % self.server_address[:2]
+
+    def process_request(self, request, client_address):
+        """Hand the connection over to the pool of workers, or reject it if the pool and its backlog are full"""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            metrics.inc('pyugt_daemon_rejected_total')
+            try:
+                request.sendall(self.BUSY_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        with self.lock:
+            self.active += 1
+            self.requests += 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.lock:
+                self.active -= 1
+            self.slots.release()
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.executor.shutdown(wait=False)
+
+    ## Processing
+
+    def ocr(self, img, params):
+        config = request_config(self.config_service.get(), params)
+        ocrtext, blocks = self.core.ocrImage(img, config)
+        result = {'text': ocrtext}
+        if blocks is not None:
+            result['blocks'] = blocks_to_json(blocks)
+        return result
+
+    def translate(self, params):
+        config = request_config(self.config_service.get(), params)
+        text = params['text']
+        fuzzy = []
+        translation = self.core.translate_any(config, text, params.get('source') or config['USER']['lang_source_trans'], params.get('target') or config['USER']['lang_target'], use_cache=params.get('use_cache', True) not in (False, 'False', 'false', '0'), fuzzy=fuzzy)
+        return {'translation': translation, 'fuzzy': min(fuzzy) if fuzzy else None}
+
+    def pipeline(self, img, params):
+        config = request_config(self.config_service.get(), params)
+        ocrtext, blocks = self.core.ocrImage(img, config)
+        if not ocrtext.strip():
+            return {'ocr': ocrtext, 'translation': ''}
+        ocrtext, transtext = self.core.translateText(config, ocrtext, blocks)
+        return {'ocr': ocrtext, 'translation': transtext}
+
+    def health(self):
+        config = self.config_service.get()
+        with self.lock:
+            return {'status': 'ok',
+                    'version': __version__,
+                    'uptime': time.time() - self.started,
+                    'workers': self.workers,
+                    'active': self.active,
+                    'requests': self.requests,
+                    'rejected': self.rejected,
+                    'ocr_engine': 'tesserocr' if config['USER'].get('ocr_engine', 'auto') != 'pytesseract' and self.core.ocrengine.tesserocr_available() else 'pytesseract',
+                    'translator': config['USER']['translator_lib']}
+
+    def warmup(self):
+        """Load the OCR engine and the translator in the background, so that the first requests are as fast as the next ones"""
+        config = self.config_service.get()
+        core = self.core
+        core.ocrengine.pytesseract.pytesseract.tesseract_cmd = config['USER']['PATH_tesseract_bin']
+        if config['USER'].get('ocr_engine', 'auto') != 'pytesseract' and core.ocrengine.tesserocr_available():
+            threading.Thread(target=core.ocrengine.get_engine, args=(config['USER']['lang_source_ocr'], core.ocrengine.DEFAULT_PSM, core.ocrengine.tessdata_from_bin(config['USER']['PATH_tesseract_bin'])), daemon=True).start()
+        if config['USER']['ocr_only'] != 'True':
+            threading.Thread(target=core.TRANSLATOR_ROUTER.preload, args=(config['USER'],), daemon=True).start()
+
+def serve(config_service, port=DEFAULT_PORT, host='127.0.0.1', workers=4, backlog=16):
+    """Start a daemon in a background thread, returns the server (its url is in server.url, call server.shutdown() to stop it)"""
+    server = DaemonServer(config_service, port, host=host, workers=workers, backlog=backlog)
+    thread = threading.Thread(target=server.serve_forever, name='pyugt-daemon')
+    thread.daemon = True  # always close thread along with parent process
+    thread.start()
+    return server
+
+### Client
+
+class DaemonClient(object):
+    """Client of a pyugt daemon. Each request opens a new connection, which costs only a fraction of a millisecond on localhost."""
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, path, body=None, params=None, content_type='application/octet-stream'):
+        """Send a request and return the decoded JSON answer. Raises DaemonError if the daemon is unreachable or fails."""
+        url = self.url + path
+        if params:
+            url += '?' + urlencode(params)
+        request = Request(url, data=body, headers={'Content-Type': content_type} if body is not None else {})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except HTTPError as exc:
+            try:
+                message = json.loads(exc.read().decode('utf-8')).get('error')
+            except Exception:
+                message = exc.reason
+            raise DaemonError('the daemon at %s failed to process %s: %s' % (self.url, path, message))
+        except (URLError, OSError) as exc:
+            raise DaemonError('cannot reach the daemon at %s: %s' % (self.url, getattr(exc, 'reason', exc)))
+
+    def encode_image(self, img):
+        # BMP is not compressed, so it is the fastest to encode and decode, the size does not matter on localhost
+        buf = io.BytesIO()
+        img.convert('RGB').save(buf, format='BMP')
+        return buf.getvalue()
+
+    def health(self):
+        return self.request('/health')
+
+    def ocr(self, img, params=None):
+        """OCR a PIL image. Returns (OCR'ed text, blocks), the blocks being None except in blocks mode."""
+        result = self.request('/ocr', self.encode_image(img), params)
+        return result['text'], blocks_from_json(result['blocks']) if 'blocks' in result else None
+
+    def translate(self, text, source=None, target=None, use_cache=True, params=None):
+        """Translate a text. Returns (translation, similarity of the fuzzy match if the translation comes from the fuzzy translation memory, else None)."""
+        data = dict(params or {}, text=text, use_cache=use_cache)
+        if source:
+            data['source'] = source
+        if target:
+            data['target'] = target
+        result = self.request('/translate', json.dumps(data).encode('utf-8'), content_type='application/json')
+        return result['translation'], result.get('fuzzy')
+
+    def pipeline(self, img, params=None):
+        """Preprocess, OCR and translate a PIL image. Returns (OCR'ed text, translation)."""
+        result = self.request('/pipeline', self.encode_image(img), params)
+        return result['ocr'], result['translation']
+
+### Main
+
+def main(argv=None):
+    """Run the daemon until interrupted"""
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="usage: %prog [options]", description="Keep the OCR engine, translators and caches loaded, and serve OCR and translation requests on a localhost HTTP API. Set daemon_url in the config file of pyugt to use it from the hotkeys front end.")
+    parser.add_option("-c", "--config", dest="config", default=None,
+                        help="Path to the configuration file (default: config.ini)", metavar="FILE")
+    parser.add_option("-p", "--port", dest="port", type="int", default=DEFAULT_PORT,
+                        help="Port to listen on, only on localhost (default: %i)" % DEFAULT_PORT)
+    parser.add_option("-w", "--workers", dest="workers", type="int", default=None,
+                        help="Number of requests processed at the same time (default: daemon_workers in the config file)")
+    (options, args) = parser.parse_args(argv)
+
+    config_service = configservice.ConfigService(options.config or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini'))
+    config = config_service.get()
+    if not os.path.exists(config['USER']['PATH_tesseract_bin']):
+        print("ERROR: can't find Tesseract v5 binaries, please update the config file to point to the binaries!")
+        return 1
+    workers = options.workers or int(config['USER'].get('daemon_workers', '4'))
+    server = DaemonServer(config_service, options.port, workers=workers)
+    server.warmup()
+    print('pyugt daemon listening on %s with %i workers, set daemon_url = %s in the config file of the clients. Press CTRL+C to stop.' % (server.url, workers, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# In-memory handoff of frames between threads: a latest-frame-wins slot to pass the preprocessed screenshots to the OCR preview window without any temporary file, and an asynchronous rate-limited writer for the debug screenshots, so that the PNG encoding is not done on the capture and OCR path.
+
+
+### Imports
+
+## Native python imports
+# For the background writer
+import threading
+import time
+# To gracefully print stack trace in console in case of an exception
+import traceback
+
+### Slots
+
+class LatestFrameSlot(object):
+    """Thread-safe slot holding only the latest frame: a new frame replaces the previous one if it was not consumed yet, so a slow consumer (eg, the GUI) always gets the freshest frame and never accumulates a backlog"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frame = None
+
+    def put(self, frame):
+        """Store a frame, returns True if the slot was empty (ie, the consumer needs to be notified), False if a pending frame was replaced (the consumer is already notified)"""
+        with self.lock:
+            was_empty = self.frame is None
+            self.frame = frame
+            return was_empty
+
+    def take(self):
+        """Get the latest frame and empty the slot, returns None if there is no new frame"""
+        with self.lock:
+            frame = self.frame
+            self.frame = None
+            return frame
+
+### Writers
+
+class AsyncImageWriter(object):
+    """Write images to disk from a background thread, at most once every min_interval seconds per file: when images are submitted faster, only the latest one is written (eg, the debug screenshots in watch mode)"""
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self.cond = threading.Condition()
+        self.slots = {}  # path -> latest image waiting to be written
+        self.last_write = {}  # path -> time of the last write
+        self.thread = threading.Thread(target=self._run, name='pyugt-imagewriter')
+        self.thread.daemon = True  # always close thread along with parent process
+        self.thread.start()
+
+    def save(self, img, path):
+        """Submit an image to be written, never blocks. The image must not be modified afterwards (copy it first if it is a reused buffer)."""
+        with self.cond:
+            self.slots[path] = img
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    now = time.monotonic()
+                    # Files that are not rate-limited anymore
+                    ready = [path for path in self.slots if now - self.last_write.get(path, 0) >= self.min_interval]
+                    if ready:
+                        break
+                    if self.slots:
+                        # Wait until the first rate limit expires, or a new image arrives
+                        self.cond.wait(min(self.min_interval - (now - self.last_write[path]) for path in self.slots))
+                    else:
+                        self.cond.wait()
+                batch = [(path, self.slots.pop(path)) for path in ready]
+                for path, _ in batch:
+                    self.last_write[path] = now
+            # Encode and write outside of the lock, so that save() never waits for the disk
+            for path, img in batch:
+                try:
+                    img.save(path, 'PNG')
+                except Exception as exc:
+                    print('ERROR: cannot write the debug image %s:' % path)
+                    traceback.print_exc()
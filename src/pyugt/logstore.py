@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Log store of the OCR'ed texts and translations: each capture is a structured record (timestamp, region, OCR text, translation, backend, confidence, latency) written by a background buffered writer into an append-only JSONL file or an indexed SQLite database, so that the hotkeys and pipeline threads never wait on disk I/O. The legacy plain text logs (log_ocr and log_translation) are written by the same background writer.
+# Query and export of corpora from the commandline: python -m pyugt.logstore --help
+
+
+### Imports
+
+## Native python imports
+# To flush the pending records on exit
+import atexit
+# For the legacy plain text logs, with a BOM so that they open correctly on Windows
+import codecs
+# For the exports
+import csv
+import datetime
+import json
+# for commandline arguments handling
+import optparse
+import os
+# For the background writer
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+### Records
+
+# Identifier of the current session (process), to be able to export a single play session
+SESSION = '%s-%i' % (time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+
+FIELDS = ('time', 'session', 'region', 'ocr', 'translation', 'backend', 'lang_source', 'lang_target', 'confidence', 'latency')
+
+def make_record(ocr, translation, region=None, backend=None, lang_source=None, lang_target=None, confidence=None, latency=None, timestamp=None):
+    """Build a log record, a dict with the FIELDS keys"""
+    return {
+        'time': timestamp if timestamp is not None else time.time(),
+        'session': SESSION,
+        'region': repr(tuple(region)) if region is not None else None,
+        'ocr': ocr,
+        'translation': translation,
+        'backend': backend,
+        'lang_source': lang_source,
+        'lang_target': lang_target,
+        'confidence': confidence,
+        'latency': latency,
+        }
+
+### Stores
+
+class TextLogStore(object):
+    """Legacy plain text log, with either the OCR'ed text or the translation of each capture and its datetime"""
+    def __init__(self, path, field='ocr', title='OCR'):
+        self.path = path
+        self.field = field
+        self.title = title
+
+    def write_batch(self, records):
+        # Only write the BOM at the start of the file, not at each append
+        encoding = 'utf-8-sig' if not os.path.exists(self.path) or os.path.getsize(self.path) == 0 else 'utf-8'
+        with codecs.open(self.path, 'a', encoding) as f:
+            for record in records:
+                f.write("-> %s at %s:\n" % (self.title, datetime.datetime.fromtimestamp(record['time']).strftime("%Y-%m-%d %H:%M:%S")))
+                f.write(record[self.field] or '')
+                f.write("\n---------------------\n")
+
+    def close(self):
+        pass
+
+class JSONLLogStore(object):
+    """Append-only JSON lines log, one record per line"""
+    def __init__(self, path):
+        self.path = path
+
+    def write_batch(self, records):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def query(self, since=None, until=None, contains=None, session=None):
+        """Iterate over the records matching the filters, in chronological order"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Truncated last line if the program was killed while writing
+                    continue
+                if match(record, since, until, contains, session):
+                    yield record
+
+    def close(self):
+        pass
+
+class SQLiteLogStore(object):
+    """Log in a SQLite database, indexed on the time and the OCR'ed text, so that queries and deduplicated exports stay fast even with hundreds of thousands of captures"""
+    def __init__(self, path):
+        self.path = path
+        # Used only by the background writer thread, or by the query command
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS captures (id INTEGER PRIMARY KEY, %s)' % ', '.join(('time REAL NOT NULL', 'session TEXT', 'region TEXT', 'ocr TEXT', 'translation TEXT', 'backend TEXT', 'lang_source TEXT', 'lang_target TEXT', 'confidence REAL', 'latency REAL')))
+        self.conn.execute('CREATE INDEX IF NOT EXISTS captures_time ON captures (time)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS captures_ocr ON captures (ocr)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS captures_session ON captures (session)')
+        self.conn.commit()
+
+    def write_batch(self, records):
+        # One transaction per batch, much faster than one commit per record
+        with self.conn:
+            self.conn.executemany('INSERT INTO captures (%s) VALUES (%s)' % (', '.join(FIELDS), ', '.join('?' * len(FIELDS))), [tuple(record[field] for field in FIELDS) for record in records])
+
+    def _where(self, since=None, until=None, contains=None, session=None):
+        clauses, params = [], []
+        if since is not None:
+            clauses.append('time >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('time < ?')
+            params.append(until)
+        if contains:
+            clauses.append('(instr(ocr, ?) > 0 OR instr(translation, ?) > 0)')
+            params.extend((contains, contains))
+        if session:
+            clauses.append('session = ?')
+            params.append(session)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def query(self, since=None, until=None, contains=None, session=None):
+        """Iterate over the records matching the filters, in chronological order"""
+        where, params = self._where(since, until, contains, session)
+        cursor = self.conn.execute('SELECT %s FROM captures%s ORDER BY time' % (', '.join(FIELDS), where), params)
+        for row in cursor:
+            yield dict(zip(FIELDS, row))
+
+    def query_dedup(self, since=None, until=None, contains=None, session=None):
+        """Iterate over the distinct OCR'ed texts matching the filters, with their latest translation and number of occurrences, in order of first appearance. Done by the database using the index on the text."""
+        where, params = self._where(since, until, contains, session)
+        cursor = self.conn.execute('SELECT %s, g.count FROM (SELECT MAX(id) AS last, MIN(time) AS first, COUNT(*) AS count FROM captures%s GROUP BY ocr) g JOIN captures c ON c.id = g.last ORDER BY g.first' % (', '.join('c.' + field for field in FIELDS), where), params)
+        for row in cursor:
+            record = dict(zip(FIELDS, row))
+            record['count'] = row[len(FIELDS)]
+            yield record
+
+    def close(self):
+        self.conn.close()
+
+def open_store(path):
+    """Open a structured log store, the format is selected by the file extension: .jsonl for JSON lines, else SQLite"""
+    if path.lower().endswith(('.jsonl', '.json')):
+        return JSONLLogStore(path)
+    return SQLiteLogStore(path)
+
+def match(record, since=None, until=None, contains=None, session=None):
+    if since is not None and record['time'] < since:
+        return False
+    if until is not None and record['time'] >= until:
+        return False
+    if contains and contains not in (record.get('ocr') or '') and contains not in (record.get('translation') or ''):
+        return False
+    if session and record.get('session') != session:
+        return False
+    return True
+
+def dedup(records):
+    """Deduplicate records on the OCR'ed text, for stores without an index (JSONL), keeping the order of first appearance, the latest translation and the number of occurrences"""
+    seen = {}
+    for record in records:
+        previous = seen.get(record['ocr'])
+        if previous is None:
+            record['count'] = 1
+            seen[record['ocr']] = record
+        else:
+            count = previous['count'] + 1
+            previous.update(record)
+            previous['count'] = count
+    return list(seen.values())
+
+### Background writer
+
+class BufferedLogWriter(object):
+    """Write records to one or several stores from a background thread, in batches: log() never blocks on disk I/O. Pending records are flushed every flush_interval seconds, or as soon as max_batch records are waiting, and on exit."""
+    def __init__(self, stores, flush_interval=1.0, max_batch=256):
+        self.stores = stores
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name='pyugt-logwriter')
+        self.thread.daemon = True  # always close thread along with parent process, the pending records are flushed by atexit
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, record):
+        self.queue.put(record)
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if record is None:
+                break
+            # Wait a bit for more records, to write them in a single batch
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    record = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self._write(batch)
+            if stop:
+                break
+
+    def _write(self, batch):
+        for store in self.stores:
+            try:
+                store.write_batch(batch)
+            except Exception as exc:
+                print('ERROR: cannot write %i log record(s) to %s: %s' % (len(batch), getattr(store, 'path', store), exc))
+
+    def close(self):
+        """Flush the pending records and stop the writer"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        for store in self.stores:
+            store.close()
+
+### Commandline query and export
+
+def parse_time(value):
+    """Parse a date or datetime (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS) into a timestamp"""
+    if value is None:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(datetime.datetime.strptime(value, fmt).timetuple())
+        except ValueError:
+            pass
+    raise ValueError('Invalid date: %s, expected YYYY-MM-DD or YYYY-MM-DD HH:MM:SS' % value)
+
+def export(records, out, fmt='jsonl'):
+    """Write records to a file object, in jsonl, csv or txt (OCR'ed text and translation separated by a tab, one record per line) format"""
+    count = 0
+    writer = None
+    for record in records:
+        if fmt == 'csv':
+            if writer is None:
+                writer = csv.DictWriter(out, fieldnames=list(record.keys()))
+                writer.writeheader()
+            writer.writerow(record)
+        elif fmt == 'txt':
+            out.write('%s\t%s\n' % ((record['ocr'] or '').replace('\n', ' '), (record['translation'] or '').replace('\n', ' ')))
+        else:
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+def main(argv=None):
+    # Commandline arguments
+    parser = optparse.OptionParser(usage='%prog [options] <log_store.sqlite|log_store.jsonl>\nQuery and export the OCR and translation records of a log store.')
+    parser.add_option("--since", dest="since", default=None, help="Only records from this date (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS)")
+    parser.add_option("--until", dest="until", default=None, help="Only records before this date (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS)")
+    parser.add_option("--contains", dest="contains", default=None, help="Only records whose OCR'ed text or translation contains this string")
+    parser.add_option("--session", dest="session", default=None, help="Only records from this session")
+    parser.add_option("-d", "--dedup", dest="dedup", action="store_true", default=False, help="Deduplicate on the OCR'ed text, with the number of occurrences")
+    parser.add_option("-f", "--format", dest="format", default='jsonl', choices=['jsonl', 'csv', 'txt'], help="Export format: jsonl, csv or txt (default: jsonl)")
+    parser.add_option("-o", "--output", dest="output", default=None, help="Output file (default: print to the console)", metavar="FILE")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('Please specify one log store.')
+    if not os.path.exists(args[0]):
+        parser.error('Log store %s does not exist.' % args[0])
+
+    store = open_store(args[0])
+    filters = dict(since=parse_time(options.since), until=parse_time(options.until), contains=options.contains, session=options.session)
+    if options.dedup:
+        records = store.query_dedup(**filters) if hasattr(store, 'query_dedup') else dedup(store.query(**filters))
+    else:
+        records = store.query(**filters)
+    out = open(options.output, 'w', encoding='utf-8', newline='') if options.output else sys.stdout
+    try:
+        count = export(records, out, fmt=options.format)
+    finally:
+        if options.output:
+            out.close()
+        store.close()
+    if options.output:
+        print('%i record(s) exported to %s' % (count, options.output))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Lightweight latency instrumentation: timing spans around each stage of the capture-to-translation pipeline, aggregated into rolling histograms (p50/p95/p99), and counters (retries, errors, cache hits). Metrics can be exported in the Prometheus text format, either to a file (eg, for the node_exporter textfile collector) or on a localhost HTTP endpoint.
+
+
+### Imports
+
+## Native python imports
+# For the rolling windows of the histograms
+from collections import deque
+# For the localhost endpoint
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+import tempfile
+# To share the registry between the hotkeys and pipeline threads
+import threading
+import time
+
+### Configuration
+
+# Number of most recent observations kept by each histogram to compute the percentiles
+WINDOW = 1024
+# Reported percentiles
+QUANTILES = (0.5, 0.95, 0.99)
+
+### Metrics
+
+def percentile(sorted_values, q):
+    """Percentile of an already sorted list, with linear interpolation between the closest ranks"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+class Histogram(object):
+    """Rolling histogram of the last observations of a value (eg, durations in seconds), plus the total count and sum since startup"""
+    def __init__(self, window=WINDOW):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self, quantiles=QUANTILES):
+        values = sorted(self.values)
+        return [(q, percentile(values, q)) for q in quantiles]
+
+class Registry(object):
+    """Thread-safe registry of the histograms, counters and gauges, keyed by (name, labels) where labels is a tuple of (key, value) couples"""
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(self.window)
+                self.histograms[key] = histogram
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set the current value of a gauge"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def span(self, stage, trace=None):
+        """Context manager timing a stage, recorded in the pyugt_stage_seconds histogram and in the trace if provided"""
+        return Span(self, stage, trace)
+
+    def summary(self, name, **labels):
+        """One line summary of the rolling percentiles of a histogram, in milliseconds"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                return '%s: no data' % name
+            quantiles = histogram.quantiles()
+            count = len(histogram.values)
+        return '%s over the last %i: %s' % (name, count, ', '.join('p%g %.1f ms' % (100 * q, 1000 * value) for q, value in quantiles))
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def render(self):
+        """Render all the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            declared = set()
+            for (name, labels), histogram in histograms:
+                if name not in declared:
+                    lines.append('# TYPE %s summary' % name)
+                    declared.add(name)
+                for q, value in histogram.quantiles():
+                    lines.append('%s%s %.6f' % (name, format_labels(labels + (('quantile', str(q)),)), value))
+                lines.append('%s_count%s %i' % (name, format_labels(labels), histogram.count))
+                lines.append('%s_sum%s %.6f' % (name, format_labels(labels), histogram.sum))
+            for (name, labels), value in counters:
+                if name not in declared:
+                    lines.append('# TYPE %s counter' % name)
+                    declared.add(name)
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+            for (name, labels), value in gauges:
+                if name not in declared:
+                    lines.append('# TYPE %s gauge' % name)
+                    declared.add(name)
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Write the metrics to a file atomically, so that a collector never reads a half written file"""
+        path = os.path.abspath(path)
+        fd, tmppath = tempfile.mkstemp(prefix='.pyugt_metrics_', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.render())
+            os.replace(tmppath, path)
+        except Exception:
+            os.remove(tmppath)
+            raise
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels)
+
+class Span(object):
+    """Timing of a stage, to be used as a context manager"""
+    def __init__(self, registry, stage, trace=None):
+        self.registry = registry
+        self.stage = stage
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        self.registry.observe('pyugt_stage_seconds', self.duration, stage=self.stage)
+        if self.trace is not None:
+            self.trace.add(self.stage, self.duration)
+        return False
+
+class Trace(object):
+    """Timings of the stages of a single capture (eg, one hotkey press), to print a summary in debug mode"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages = []
+
+    def add(self, stage, duration):
+        with self.lock:
+            self.stages.append((stage, duration))
+
+    def summary(self):
+        total = time.perf_counter() - self.start
+        with self.lock:
+            stages = list(self.stages)
+        return 'Timings: %s, total %.1f ms' % (', '.join('%s %.1f ms' % (stage, 1000 * duration) for stage, duration in stages), 1000 * total)
+
+# Global registry
+REGISTRY = Registry()
+
+def span(stage, trace=None):
+    return REGISTRY.span(stage, trace)
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+def set_gauge(name, value, **labels):
+    REGISTRY.set(name, value, **labels)
+
+### Exports
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Do not spam the console at each scrape
+        pass
+
+def serve(port, registry=REGISTRY, host='127.0.0.1'):
+    """Serve the metrics on http://host:port/metrics in a background thread, only on localhost by default. Returns the server, call shutdown() to stop it."""
+    server = HTTPServer((host, port), MetricsHandler)
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever, name='pyugt-metrics')
+    thread.daemon = True  # always close thread along with parent process
+    thread.start()
+    return server
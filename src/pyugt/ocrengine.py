@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# OCR engine layer: keeps warm Tesseract instances loaded in-process (via tesserocr) so that the traineddata files (eg, jpn) are not reloaded from scratch on every capture, with pytesseract (one tesseract subprocess per call) as a fallback.
+
+
+### Imports
+
+## Native python imports
+import os
+import sys
+# To protect the engines registry and the non thread-safe Tesseract API objects
+import threading
+# To measure the latency of each OCR path
+import time
+# To gracefully print stack trace in console in case of an exception
+import traceback
+
+## External modules
+# For Optical Character Recognition via a subprocess, the fallback path
+import pytesseract
+# For in-process Optical Character Recognition, optional (pip install tesserocr), much faster as the models stay loaded in memory between calls
+try:
+    import tesserocr
+except ImportError:  # pragma: no cover
+    tesserocr = None
+
+### Configuration
+
+# Default page segmentation mode, same as the default of the tesseract binary (fully automatic page segmentation, but no OSD)
+DEFAULT_PSM = 3
+
+### Engines
+
+class TesseractEngine(object):
+    """A warm in-process Tesseract instance for a given (language, page segmentation mode) couple.
+    The Tesseract API object is not thread-safe, so calls are serialized with a lock, but the model is loaded only once for the whole life of the process."""
+    def __init__(self, lang, psm=DEFAULT_PSM, tessdata=None):
+        self.lang = lang
+        self.psm = psm
+        self.tessdata = tessdata
+        self.lock = threading.Lock()
+        kwargs = {'lang': lang, 'psm': psm}
+        if tessdata:
+            # tesserocr expects a path to the tessdata folder with a trailing separator on some platforms
+            kwargs['path'] = os.path.join(tessdata, '')
+        self.api = tesserocr.PyTessBaseAPI(**kwargs)
+
+    def image_to_string(self, img):
+        """OCR a PIL image directly from memory, without any temporary file"""
+        with self.lock:
+            self.api.SetImage(img)
+            return self.api.GetUTF8Text()
+
+    def image_to_data(self, img):
+        """OCR a PIL image and return the word-level results as Tesseract TSV (bounding boxes and confidences)"""
+        with self.lock:
+            self.api.SetImage(img)
+            # Recognize() must be called before GetTSVText(), unlike GetUTF8Text() which triggers it implicitly
+            self.api.Recognize()
+            return self.api.GetTSVText(0)
+
+    def close(self):
+        with self.lock:
+            self.api.End()
+
+# Registry of warm engines, keyed by (lang, psm, tessdata), with a list of engines per key
+_engines = {}
+# Maximum number of warm engines per key, so that several captures of the same language (eg, named regions) can be OCR'ed in parallel. Each engine loads its own copy of the model, so more are only created when all the others are busy.
+max_engines = 1
+_engines_lock = threading.Lock()
+# Engines that failed to initialize (eg, missing language file), so that we don't retry at each capture and go straight to the fallback
+_engines_failed = set()
+
+def tesserocr_available():
+    """Is the in-process Tesseract engine available?"""
+    return tesserocr is not None
+
+def tessdata_from_bin(path_tesseract_bin):
+    """Get the path to the tessdata folder from the path to the tesseract binary, as done by the UB Mannheim installers. Returns None if not found, so that Tesseract will use its default path."""
+    tessdata = os.path.join(os.path.dirname(path_tesseract_bin), 'tessdata')
+    if os.path.isdir(tessdata):
+        return tessdata
+    return None
+
+def reserve_engines(count):
+    """Allow up to count warm engines per language, so that count captures of the same language can be OCR'ed in parallel"""
+    global max_engines
+    max_engines = max(max_engines, int(count))
+
+def _pick_engine(engines):
+    """Pick an engine that is not busy, or the first one if all the engines are busy and no more can be created, or None to create a new one"""
+    for engine in engines:
+        if not engine.lock.locked():
+            return engine
+    if engines and len(engines) >= max_engines:
+        return engines[0]
+    return None
+
+def get_engine(lang, psm=DEFAULT_PSM, tessdata=None):
+    """Get (or create and cache) a warm Tesseract engine for this language and page segmentation mode, preferably one that is not busy. Returns None if the in-process engine is unavailable."""
+    if tesserocr is None:
+        return None
+    key = (lang, psm, tessdata)
+    engine = _pick_engine(_engines.get(key, ()))
+    if engine is not None:
+        return engine
+    with _engines_lock:
+        # Check again now that we hold the lock, another thread may have created an engine in the meantime
+        engines = _engines.setdefault(key, [])
+        engine = _pick_engine(engines)
+        if engine is not None:
+            return engine
+        if key in _engines_failed:
+            return engines[0] if engines else None
+        try:
+            engine = TesseractEngine(lang, psm=psm, tessdata=tessdata)
+        except Exception as exc:
+            print('WARNING: cannot initialize the in-process Tesseract engine for language %s, falling back to pytesseract:' % lang)
+            traceback.print_exc()
+            _engines_failed.add(key)
+            return engines[0] if engines else None
+        engines.append(engine)
+        return engine
+
+def close_engines():
+    """Release all the warm engines"""
+    with _engines_lock:
+        for engines in _engines.values():
+            for engine in engines:
+                engine.close()
+        _engines.clear()
+        _engines_failed.clear()
+
+def image_to_string(img, lang, psm=DEFAULT_PSM, tessdata=None, engine='auto'):
+    """OCR a PIL image and return the text. engine can be 'auto' (use the warm in-process engine if available, else pytesseract), 'tesserocr' or 'pytesseract'."""
+    if engine != 'pytesseract':
+        warm = get_engine(lang, psm=psm, tessdata=tessdata)
+        if warm is not None:
+            return warm.image_to_string(img)
+        elif engine == 'tesserocr':
+            raise ValueError('tesserocr engine was requested but is not available, please install it with: pip install tesserocr')
+    # Fallback: pytesseract writes a temporary image and forks the tesseract binary, which reloads the traineddata each time
+    config = '--psm %i' % psm if psm != DEFAULT_PSM else ''
+    return pytesseract.image_to_string(img, lang=lang, config=config, nice=1)
+
+def image_to_data(img, lang, psm=DEFAULT_PSM, tessdata=None, engine='auto'):
+    """OCR a PIL image and return the word-level results as Tesseract TSV, with the same engine selection as image_to_string()"""
+    if engine != 'pytesseract':
+        warm = get_engine(lang, psm=psm, tessdata=tessdata)
+        if warm is not None:
+            return warm.image_to_data(img)
+        elif engine == 'tesserocr':
+            raise ValueError('tesserocr engine was requested but is not available, please install it with: pip install tesserocr')
+    config = '--psm %i' % psm if psm != DEFAULT_PSM else ''
+    return pytesseract.image_to_data(img, lang=lang, config=config, nice=1)
+
+def compare_latency(img, lang, psm=DEFAULT_PSM, tessdata=None, repeat=5):
+    """Measure the latency of both OCR paths on the same image. Returns a dict with the list of timings in seconds for each available engine.
+    The first call of the in-process engine is reported separately, as it includes loading the model, which is paid only once per process."""
+    results = {}
+    if tesserocr_available():
+        start = time.perf_counter()
+        image_to_string(img, lang, psm=psm, tessdata=tessdata, engine='tesserocr')
+        results['tesserocr_first'] = [time.perf_counter() - start]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            image_to_string(img, lang, psm=psm, tessdata=tessdata, engine='tesserocr')
+            timings.append(time.perf_counter() - start)
+        results['tesserocr'] = timings
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image_to_string(img, lang, psm=psm, tessdata=tessdata, engine='pytesseract')
+        timings.append(time.perf_counter() - start)
+    results['pytesseract'] = timings
+    return results
+
+def main(argv=None):
+    """Commandline latency comparison: python -m pyugt.ocrengine image.png [lang] [path_tesseract_bin]"""
+    from PIL import Image
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        print('Usage: python -m pyugt.ocrengine <image> [lang] [path_tesseract_bin]')
+        return 1
+    img = Image.open(argv[0])
+    img.load()
+    lang = argv[1] if len(argv) > 1 else 'eng'
+    tessdata = None
+    if len(argv) > 2:
+        pytesseract.pytesseract.tesseract_cmd = argv[2]
+        tessdata = tessdata_from_bin(argv[2])
+    if not tesserocr_available():
+        print('tesserocr is not installed, only the pytesseract path will be measured (pip install tesserocr).')
+    results = compare_latency(img, lang, tessdata=tessdata)
+    for name, timings in results.items():
+        print('%s: mean %.1f ms, min %.1f ms over %i run(s)' % (name, 1000 * sum(timings) / len(timings), 1000 * min(timings), len(timings)))
+    if 'tesserocr' in results:
+        speedup = min(results['pytesseract']) / min(results['tesserocr'])
+        print('In-process engine is %.1fx faster than pytesseract (after the first warm-up call).' % speedup)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
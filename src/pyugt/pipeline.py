@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Pipelined processing of captures: the OCR and translation stages run in their own worker threads connected by bounded queues, so that the OCR of capture N+1 overlaps with the translation of capture N, while results are still delivered in order.
+
+
+### Imports
+
+## Native python imports
+# For the bounded queues between stages
+import queue
+# For the worker threads
+import threading
+# To drop stale jobs
+import time
+# To gracefully print stack trace in console in case of an exception
+import traceback
+
+### Pipeline
+
+class Job(object):
+    """A capture going through the pipeline. Stages can attach any attribute to it (eg, img, ocrtext, transtext)."""
+    def __init__(self, **kwargs):
+        self.seq = None  # sequence number, set by the pipeline on submission
+        self.created = time.time()
+        self.dropped = False
+        self.__dict__.update(kwargs)
+
+    def age(self):
+        return time.time() - self.created
+
+    def cancelled(self):
+        """Was this job dropped or superseded by a newer one? Stages can check it between costly steps to give up early."""
+        return self.dropped
+
+class TranslationPipeline(object):
+    """Capture -> preprocess/OCR -> translate -> deliver pipeline.
+    ocr_stage and translate_stage are callables taking a Job, they can return False to abort the job (eg, no text was found). deliver is called with each completed job, strictly in submission order.
+    The queues are bounded: when the OCR queue is full, the oldest waiting job is dropped, since a newer capture supersedes it (backpressure). Jobs older than max_age seconds are dropped too, before a stage starts working on them: once a stage produced its result, the job is only dropped if it was superseded or cancelled, so that a slow translation is still shown.
+    If supersede is True, a new job cancels all the older jobs that were not delivered yet, even those being processed: they are dropped at the next stage boundary, and the newer jobs are not held back in the reordering buffer waiting for them."""
+    def __init__(self, ocr_stage, translate_stage, deliver, ocr_workers=2, translate_workers=2, queue_size=2, max_age=None, supersede=False):
+        self.ocr_stage = ocr_stage
+        self.translate_stage = translate_stage
+        self.deliver = deliver
+        self.max_age = max_age
+        self.supersede = supersede
+        self.ocr_queue = queue.Queue(maxsize=queue_size)
+        self.translate_queue = queue.Queue(maxsize=queue_size)
+        # Reordering buffer, so that results are delivered in submission order even if a later job finishes first
+        self.lock = threading.Lock()
+        self.deliver_lock = threading.Lock()
+        self.next_seq = 0  # next sequence number to assign
+        self.next_deliver = 0  # next sequence number to deliver
+        self.done = {}
+        # Jobs submitted but not completed yet, to cancel them when superseded
+        self.unfinished = {}
+        self.superseded = 0  # number of jobs cancelled by a newer one
+        # Launch the workers
+        self.threads = []
+        for i in range(ocr_workers):
+            self._start_worker(self.ocr_queue, self._run_ocr, 'pyugt-ocr-%i' % i)
+        for i in range(translate_workers):
+            self._start_worker(self.translate_queue, self._run_translate, 'pyugt-translate-%i' % i)
+
+    def _start_worker(self, inqueue, func, name):
+        thread = threading.Thread(target=self._worker, args=(inqueue, func), name=name)
+        thread.daemon = True  # always close thread along with parent process
+        thread.start()
+        self.threads.append(thread)
+
+    def submit(self, job):
+        """Submit a new job to the pipeline, this never blocks: if the pipeline is saturated, the oldest waiting job is dropped"""
+        with self.lock:
+            job.seq = self.next_seq
+            self.next_seq += 1
+            self.unfinished[job.seq] = job
+            older = [oldjob for oldjob in self.unfinished.values() if oldjob.seq < job.seq] if self.supersede else []
+        for oldjob in older:
+            # The work already started on these jobs cannot be interrupted, but their results will be ignored, and the stages can stop early by checking job.cancelled()
+            self.superseded += 1
+            self._drop(oldjob)
+        while True:
+            try:
+                self.ocr_queue.put_nowait(job)
+                break
+            except queue.Full:
+                # Backpressure: drop the oldest waiting capture, it is stale anyway since we now have a newer one
+                try:
+                    self._drop(self.ocr_queue.get_nowait())
+                except queue.Empty:
+                    pass
+        return job
+
+    def drop_pending(self):
+        """Drop all jobs that are still waiting in the queues (eg, when the user requests a new capture and the old ones are not wanted anymore)"""
+        for inqueue in (self.ocr_queue, self.translate_queue):
+            while True:
+                try:
+                    self._drop(inqueue.get_nowait())
+                except queue.Empty:
+                    break
+
+    def _is_stale(self, job):
+        return job.dropped or (self.max_age is not None and job.age() > self.max_age)
+
+    def _worker(self, inqueue, func):
+        while True:
+            job = inqueue.get()
+            if self._is_stale(job):
+                self._drop(job)
+                continue
+            try:
+                func(job)
+            except Exception as exc:
+                print('ERROR: an exception occurred while processing a capture:')
+                traceback.print_exc()
+                self._drop(job)
+
+    def _run_ocr(self, job):
+        # The max_age is checked again before the translation starts, by the worker
+        if self.ocr_stage(job) is False or job.cancelled():
+            self._drop(job)
+        else:
+            # Blocks if the translation stage is saturated, which propagates the backpressure up to the OCR queue
+            self.translate_queue.put(job)
+
+    def _run_translate(self, job):
+        if self.translate_stage(job) is False or job.cancelled():
+            self._drop(job)
+        else:
+            self._complete(job)
+
+    def _drop(self, job):
+        job.dropped = True
+        self._complete(job)
+
+    def _complete(self, job):
+        """Store the finished (or dropped) job in the reordering buffer, and deliver all the jobs that are next in order"""
+        # Delivery is serialized, so that results are delivered in order even when several workers complete at the same time
+        with self.deliver_lock:
+            if job.seq < self.next_deliver or job.seq in self.done:
+                # Already completed, eg a superseded job whose worker finished after it was dropped
+                return
+            with self.lock:
+                self.unfinished.pop(job.seq, None)
+            self.done[job.seq] = job
+            while self.next_deliver in self.done:
+                readyjob = self.done.pop(self.next_deliver)
+                self.next_deliver += 1
+                if readyjob.dropped:
+                    continue
+                try:
+                    self.deliver(readyjob)
+                except Exception as exc:
+                    print('ERROR: an exception occurred while delivering a result:')
+                    traceback.print_exc()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Compiled preprocessing of screenshots before OCR: the preprocessing_* parameters are compiled once into precomputed lookup tables and filter objects, and the binarization and inversion are fused into a single pass, with an output identical to the original step by step preprocessing.
+
+
+### Imports
+
+## Native python imports
+# To parse the list of filters from the config file
+import ast
+# To process big screenshots in parallel strips
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+# To protect the compiled pipelines cache
+import threading
+
+## External modules
+from PIL import Image, ImageChops, ImageFilter
+
+### Lookup tables
+
+# Inversion lookup table, for a greyscale image
+INVERT_LUT = [255 - p for p in range(256)]
+
+def binarize_lut(thresh):
+    """Lookup table for the fake binarization: pixels above the threshold get 100 added to them, this helps keep some of the variation in the pixels intensities which can be helpful to recognize the letters, the others are set to 0. From: https://stackoverflow.com/questions/51688973/image-preprocessing-for-ocr-tessaract"""
+    return [p + 100 if p > thresh else 0 for p in range(256)]
+
+def binarize_invert_lut(thresh):
+    """Lookup table fusing the binarization and the inversion in one pass: once inverted, the pixels above the threshold are black and all the others white"""
+    return [0 if p > thresh else 255 for p in range(256)]
+
+def filter_radius(imfilter):
+    """Number of neighbouring pixels on each side that a filter reads to compute one pixel, used to compute the overlap between parallel strips"""
+    if isinstance(imfilter, ImageFilter.Kernel):
+        return imfilter.filterargs[0][1] // 2
+    if isinstance(imfilter, (ImageFilter.GaussianBlur, ImageFilter.UnsharpMask)):
+        # Gaussian blurs are approximated by several box blurs, which read further than the radius
+        return int(math.ceil(imfilter.radius * 3)) + 1
+    if isinstance(imfilter, ImageFilter.BoxBlur):
+        return int(math.ceil(imfilter.radius)) + 1
+    if hasattr(imfilter, 'size'):
+        # Rank filters (median, min, max, mode)
+        return imfilter.size // 2
+    # Unknown filter, take a safe margin
+    return 8
+
+# Pool of threads to preprocess big screenshots in parallel strips (PILLOW releases the GIL in its resampling and filtering routines)
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor._max_workers < workers:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pyugt-preproc')
+        return _executor
+
+### Pipeline
+
+class PreprocessingPipeline(object):
+    """Preprocessing of a screenshot to improve OCR accuracy (particularly over translucent backgrounds), compiled once for a given set of parameters"""
+    # Minimum height in pixels of a strip, under which parallelization is not worth it
+    min_strip_height = 64
+
+    def __init__(self, enabled=True, filters=None, threshold=None, invert=False, scale=2, threads=1):
+        self.enabled = enabled
+        self.scale = scale
+        self.threads = threads if threads > 0 else (os.cpu_count() or 1)
+        self.threshold = threshold
+        self.invert = invert
+        # The filters should be part of PILLOW.ImageFilter. Some are classes (eg, UnsharpMask), instanciate them once with their default parameters, as Image.filter() would do at each call.
+        self.filters = []
+        for name in (filters or []):
+            imfilter = getattr(ImageFilter, name)
+            if isinstance(imfilter, type):
+                imfilter = imfilter()
+            self.filters.append(imfilter)
+        # Precompute the lookup tables
+        if threshold is not None:
+            self.lut = binarize_invert_lut(threshold) if invert else binarize_lut(threshold)
+        else:
+            self.lut = None
+        # Overlap in source pixels needed between parallel strips so that the result is identical to processing the whole image at once: the support of the LANCZOS kernel (3 pixels) plus the radius of each filter, rounded up
+        self.margin = 4 + int(math.ceil(sum(filter_radius(f) for f in self.filters) / float(scale)))
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a pipeline from the preprocessing_* parameters of the config file"""
+        user = config['USER']
+        filters = user['preprocessing_filters']
+        threshold = user['preprocessing_binarize_threshold']
+        return cls(enabled=user['preprocessing'] == 'True',
+                   filters=ast.literal_eval(filters) if filters != 'None' else None,
+                   threshold=int(threshold) if threshold != 'None' else None,
+                   invert=user['preprocessing_invert'] == 'True',
+                   threads=int(user.get('preprocessing_threads', '0')))
+
+    def __call__(self, img):
+        if not self.enabled:
+            return img
+        # Convert to greyscale
+        img = img.convert('L')
+        nstrips = min(self.threads, img.size[1] // self.min_strip_height)
+        if nstrips <= 1:
+            img, binarized = self.process(img)
+        else:
+            # Big screenshot: process horizontal strips in parallel, each strip overlapping its neighbours so that the kernels at the junctions read the same pixels as with the whole image, the overlaps are then cropped out
+            width, height = img.size
+            bounds = [height * i // nstrips for i in range(nstrips + 1)]
+            def process_strip(i):
+                top = max(bounds[i] - self.margin, 0)
+                bottom = min(bounds[i + 1] + self.margin, height)
+                strip, binarized = self.process(img.crop((0, top, width, bottom)))
+                offset = (bounds[i] - top) * self.scale
+                return strip.crop((0, offset, strip.size[0], offset + (bounds[i + 1] - bounds[i]) * self.scale)), binarized
+            strips = list(get_executor(nstrips).map(process_strip, range(nstrips)))
+            binarized = all(b for _, b in strips)
+            if not binarized:
+                # Mixed results, process the whole image at once instead (should not happen, as the binarization fails only on tiny screenshots)
+                img, binarized = self.process(img)
+            else:
+                img = Image.new(strips[0][0].mode, (width * self.scale, height * self.scale))
+                for i, (strip, _) in enumerate(strips):
+                    img.paste(strip, (0, bounds[i] * self.scale))
+        if self.invert and not binarized:
+            # Invert image so that the text is black and background white, this works better with Tesseract according to doc: https://tesseract-ocr.github.io/tessdoc/ImproveQuality
+            # Without binarization, the greyscale image is first dithered to a binary image, as was done historically. Dithering diffuses errors across the whole image, so this cannot be done by strips.
+            img = img.convert('1').convert('L').point(INVERT_LUT)
+        return img
+
+    def process(self, img):
+        """Upscale, filter and binarize a greyscale image (or a strip of it). Returns the processed image and whether it was binarized (and inverted if enabled, both are fused in one pass)."""
+        # Upscale image to artificially increase resolution
+        if self.scale != 1:
+            img = img.resize((self.scale * img.size[0], self.scale * img.size[1]), resample=Image.LANCZOS)
+        # Apply filters (remove translucent background, increase contrast of the letters, etc)
+        for imfilter in self.filters:
+            img = img.filter(imfilter)
+        if self.lut is not None:
+            try:
+                if self.invert:
+                    # Binarize and invert in one pass, directly as a greyscale image (a binary image cannot be saved and is buggy for PILLOW and maybe for Tesseract)
+                    return img.point(self.lut), True
+                else:
+                    # Binarize
+                    return img.point(self.lut, mode='1'), True
+            except ValueError as exc:
+                # Exception when the screenshot is too small, then it is not binarized
+                pass
+        return img, False
+
+# Compiled pipelines, keyed by the raw preprocessing parameters from the config file, so that they are compiled only once per config
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+def get_pipeline(config, tuned=None):
+    """Get the compiled preprocessing pipeline for the current config. tuned is an optional dict of filters, threshold and invert parameters (eg, found by the auto-tuning) overriding the ones of the config file."""
+    user = config['USER']
+    if tuned is None:
+        key = (user['preprocessing'], user['preprocessing_filters'], user['preprocessing_binarize_threshold'], user['preprocessing_invert'], user.get('preprocessing_threads', '0'))
+    else:
+        key = ('tuned', repr(tuned.get('filters')), tuned.get('threshold'), tuned.get('invert'), user.get('preprocessing_threads', '0'))
+    pipeline = _pipelines.get(key)
+    if pipeline is None:
+        with _pipelines_lock:
+            pipeline = _pipelines.get(key)
+            if pipeline is None:
+                if tuned is None:
+                    pipeline = PreprocessingPipeline.from_config(config)
+                else:
+                    pipeline = PreprocessingPipeline(filters=tuned.get('filters'), threshold=tuned.get('threshold'), invert=tuned.get('invert', False), threads=int(user.get('preprocessing_threads', '0')))
+                _pipelines[key] = pipeline
+    return pipeline
+
+def preprocess(img, config, tuned=None):
+    """Preprocess a screenshot according to the config file parameters, or to the tuned parameters if provided"""
+    return get_pipeline(config, tuned)(img)
+
+### Text localization
+
+def find_text_boxes(img, max_width=320, edge_threshold=40, density=0.04, padding=0.3):
+    """Find the bounding boxes (left, top, right, bottom) of the text lines in a screenshot, with a fast pass on a downscaled copy: text is where the local contrast (edges) is dense, so rows with enough edges form horizontal bands, and the horizontal extent of each band is where its columns have edges. Returns the boxes in the coordinates of the screenshot, padded by a fraction of their height, in top to bottom order."""
+    grey = img.convert('L')
+    width, height = grey.size
+    ratio = min(1.0, max_width / float(width))
+    if ratio < 1.0:
+        grey = grey.resize((max(1, int(width * ratio)), max(1, int(height * ratio))), resample=Image.BILINEAR)
+    # Local contrast (morphological gradient), thresholded into an edges map
+    edges = ImageChops.subtract(grey.filter(ImageFilter.MaxFilter(3)), grey.filter(ImageFilter.MinFilter(3)))
+    edges = edges.point([255 if p > edge_threshold else 0 for p in range(256)])
+    swidth, sheight = edges.size
+    # Rows projection: BOX resampling to a single column averages each row, in C
+    rows = list(edges.resize((1, sheight), resample=Image.BOX).getdata())
+    limit = density * 255
+    bands = []
+    for y, value in enumerate(rows):
+        if value > limit:
+            # Merge with the previous band if they are separated by a small gap (eg, between the ascenders of a line and the descenders of the previous one)
+            if bands and y - bands[-1][1] <= max(1, sheight // 50):
+                bands[-1][1] = y + 1
+            else:
+                bands.append([y, y + 1])
+    boxes = []
+    for y0, y1 in bands:
+        if y1 - y0 < 2:
+            # Too thin to be text, probably a horizontal line of the background
+            continue
+        cols = list(edges.crop((0, y0, swidth, y1)).resize((swidth, 1), resample=Image.BOX).getdata())
+        active = [x for x, value in enumerate(cols) if value > limit / 2]
+        if not active:
+            continue
+        x0, x1 = active[0], active[-1] + 1
+        # Back to the screenshot coordinates, with some padding so that the glyphs are not cut
+        pad = int((y1 - y0) / ratio * padding) + 2
+        boxes.append((max(0, int(x0 / ratio) - pad), max(0, int(y0 / ratio) - pad), min(width, int(math.ceil(x1 / ratio)) + pad), min(height, int(math.ceil(y1 / ratio)) + pad)))
+    return boxes
+
+def union_box(boxes):
+    """Bounding box of a list of (x0, y0, x1, y1) boxes"""
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+def autocrop(img, montage=True, spacing=8, max_coverage=0.8):
+    """Crop a screenshot to its text content before preprocessing and OCR, so that the upscale, filters and OCR only work on the text and not on the empty or busy background around it.
+    If montage is True, the text lines are cropped separately and stacked vertically into a single image, else the screenshot is cropped to the bounding box of all the text lines (eg, for vertical languages whose lines are columns, or when the positions of the text are needed).
+    Returns the cropped image and the offset of the crop in the screenshot, or None for a montage: the lines are moved relatively to each other, so no single offset maps the positions in the montage back to the screenshot, and None makes any such use fail instead of silently returning wrong positions (use montage=False when the positions are needed). If no text is found, the screenshot is returned unchanged."""
+    boxes = find_text_boxes(img)
+    if not boxes:
+        return img, (0, 0)
+    union = union_box(boxes)
+    area = lambda b: (b[2] - b[0]) * (b[3] - b[1])
+    if not montage or len(boxes) == 1 or sum(area(b) for b in boxes) >= max_coverage * area(union):
+        # The lines fill most of their bounding box, a montage would not save much
+        return img.crop(union), (union[0], union[1])
+    # Stack the lines, separated by some background, filled with the color around the first line
+    width = max(b[2] - b[0] for b in boxes)
+    height = sum(b[3] - b[1] for b in boxes) + spacing * (len(boxes) - 1)
+    montage_img = Image.new(img.mode, (width, height), img.getpixel((boxes[0][0], boxes[0][1])))
+    y = 0
+    for box in boxes:
+        montage_img.paste(img.crop(box), (0, y))
+        y += box[3] - box[1] + spacing
+    return montage_img, None
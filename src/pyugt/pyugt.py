@@ -13,24 +13,24 @@
 ### Imports
 
 ## Native python imports
-# To store and parse lists from configparser
-import ast
-# To write UTF8 characters in log files
-import codecs
-# To parse config file
-import configparser
-# To use as IDs for each entry in OCR and translation log files
-import datetime
+# To wait for the results of the GUI thread
+import concurrent.futures
+# For the GUI thread methods decorator
+import functools
 # For path handling
 import glob
 import os
 # for commandline arguments handling
 import optparse
+# To pass work to the GUI thread
+import queue
+# To quit gracefully with CTRL+C
+import signal
 # To display screenshots
 import sys
 # For the waiting loop
 import time
-# To display Tkinter windows in a thread (and be non-blocking so that shortcuts still work)
+# To run the hotkeys, pipeline and watch mode in their own threads while the Tkinter windows are owned by a single GUI thread
 import threading
 # To gracefully print stack trace in console in case of an exception
 import traceback
@@ -40,27 +40,70 @@ if sys.version_info[0] == 2:  # the tkinter library changed it's name from Pytho
     tkinter = Tkinter #I decided to use a library reference to avoid potential naming conflicts with people's programs.
 else:
     import tkinter
-from PIL import Image, ImageTk, ImageFilter, ImageMath
+from PIL import Image, ImageTk
 # To show error message boxes and textboxes with scrollbars
 from tkinter import messagebox, scrolledtext
 
 ## External modules
 # For global hotkeys (TODO: find another library to support MacOSX)
 import keyboard
-# For (cross-platform) screenshots
-import mss
 # For Optical Character Recognition
 import pytesseract
 
-## External modules - translators
-# For free online translation (may be throttled)
-import translators
-from tenacity import retry, wait_random, wait_exponential, stop_after_delay  # to retry when throttled
-# Paid online translations via DeepL (there is a free tier)
-import deepl
-# Local offline free unthrottled translator via Argos Translate using OpenNMT
-import argostranslate.package
-import argostranslate.translate
+## Local modules
+# Fallback to absolute imports when pyugt.py is launched directly as a script (eg, for the pyInstaller build)
+try:
+    from . import autotune  # auto-tuning of the preprocessing parameters per capture region
+except ImportError:
+    import autotune
+try:
+    from . import capture  # per-thread screen grabbers
+except ImportError:
+    import capture
+try:
+    from . import configservice  # cached config files snapshots and debounced writes
+except ImportError:
+    import configservice
+try:
+    from . import core  # OCR and translation, shared with the batch mode and the daemon
+except ImportError:
+    import core
+try:
+    from . import daemon  # client of the daemon mode, sharing warm OCR engines, translators and caches between processes
+except ImportError:
+    import daemon
+try:
+    from . import framehandoff  # in-memory frames handoff between threads and asynchronous debug screenshots
+except ImportError:
+    import framehandoff
+try:
+    from . import logstore  # buffered structured logs of the OCR'ed texts and translations
+except ImportError:
+    import logstore
+try:
+    from . import metrics  # per-stage latency histograms and counters, exported in the Prometheus format
+except ImportError:
+    import metrics
+try:
+    from . import ocrengine  # warm in-process Tesseract engines, with pytesseract as a fallback
+except ImportError:
+    import ocrengine
+try:
+    from . import pipeline  # background capture processing pipeline
+except ImportError:
+    import pipeline
+try:
+    from . import preprocessing  # compiled screenshots preprocessing before OCR
+except ImportError:
+    import preprocessing
+try:
+    from . import regions  # named capture regions, each with its own parameters profile
+except ImportError:
+    import regions
+try:
+    from . import scheduler  # generations and coalescing of the hotkey requests
+except ImportError:
+    import scheduler
 
 ## Import version
 # Get version, better than importing the module because can fail if the requirements aren't met
@@ -81,31 +124,100 @@ __version__ = find_version(curpath, "_version.py")
 
 ### Auxiliary functions
 
-class showPILandSelect(threading.Thread):
-    """Display a screenshot in fullscreen and allow to select a rectangle region inside"""
+class GUIDispatcher(object):
+    """Single GUI thread owning the Tk root and all the windows. Tk is not thread-safe, so other threads (eg, hotkeys callbacks and pipeline workers) never call Tk directly, they submit work through a thread-safe queue that is polled by the GUI thread with after(), and get a Future to wait for the result if needed."""
+    # Last created dispatcher, so that error boxes can be shown from anywhere
+    current = None
+    # Interval in milliseconds between two polls of the queue, this is the maximum latency to process a request from another thread
+    poll_interval = 15
+
     def __init__(self):
-        threading.Thread.__init__(self)
-        self.setDaemon(True)  # always close thread along with parent process
-        self.start()
+        # The Tk root is created in the thread that will run the mainloop, and it is never shown: all windows are Toplevel() children of this root
+        self.root = tkinter.Tk()
+        self.root.withdraw()
+        self.thread = threading.current_thread()
+        self.queue = queue.Queue()
+        self.stopping = False
+        self.root.after(self.poll_interval, self._poll)
+        GUIDispatcher.current = self
+
+    def in_gui_thread(self):
+        return threading.current_thread() is self.thread
+
+    def call(self, func, *args, **kwargs):
+        """Run func in the GUI thread and return a Future with its result. If already in the GUI thread, func is run immediately."""
+        future = concurrent.futures.Future()
+        if self.in_gui_thread():
+            self._run(future, func, args, kwargs)
+        else:
+            self.queue.put((future, func, args, kwargs))
+        return future
+
+    def _run(self, future, func, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as exc:
+            traceback.print_exc()
+            future.set_exception(exc)
+
+    def _poll(self):
+        # Schedule the next poll before running the calls, so that a call that does not return quickly (eg, a modal error box, which runs a nested event loop until it is closed) does not stall all the other calls
+        if self.stopping:
+            self.root.quit()
+        else:
+            self.root.after(self.poll_interval, self._poll)
+        while True:
+            try:
+                future, func, args, kwargs = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self._run(future, func, args, kwargs)
 
-    def run(self):
-        # Create a Toplevel() dialog window, we can create multiple ones
-        root = tkinter.Tk()  # use Toplevel() instead of Tk() to reopen the same dialog multiple times, see also: https://github.com/dangillet/PythonFaqFr/blob/master/doc/tkinter.md and https://stackoverflow.com/questions/39458318/how-to-allow-a-tkinter-window-to-be-opened-multiple-times
+    def stop(self, *args):
+        """Stop the mainloop, can be called from any thread or from a signal handler"""
+        self.stopping = True
+
+    def mainloop(self):
+        """Run the GUI loop in the current thread until stop() is called"""
+        self.root.mainloop()
+
+def gui_thread(method):
+    """Decorator for the methods of GUI windows that must run in the GUI thread: when called from another thread, the call is dispatched to the GUI thread. A Future of the result is always returned."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self.gui.call(method, self, *args, **kwargs)
+    return wrapper
+
+class showPILandSelect(object):
+    """Display a screenshot in fullscreen and allow to select a rectangle region inside. Must be created in the GUI thread."""
+    def __init__(self, gui):
+        self.gui = gui
+        # Create a Toplevel() dialog window, we can create multiple ones, and it can be reopened multiple times, see also: https://github.com/dangillet/PythonFaqFr/blob/master/doc/tkinter.md and https://stackoverflow.com/questions/39458318/how-to-allow-a-tkinter-window-to-be-opened-multiple-times
+        root = tkinter.Toplevel(gui.root)
         self.root = root
         # Create empty canvas
         self.canvas = None
         # Create empty photoimage for reuse
         self.photoimage = None
+        # Future of the current selection
+        self.selection = None
+        self.rect = None
         # hide root dialog
         root.overrideredirect(1)
         root.withdraw()
 
-        # Launch the window
-        self.root.mainloop()
+    def select(self, pilImage, quitOnSelect=False, prompt=None):
+        """Display the screenshot and return a Future that will be resolved with the coordinates of the region selected by the user. Can be called from any thread."""
+        selection = concurrent.futures.Future()
+        self.display(pilImage, selection, quitOnSelect=quitOnSelect, prompt=prompt)
+        return selection
 
-    def display(self, pilImage, quitOnSelect=False):
-        # Setup a variable that will be used as a lock to signal to parent thread that the user is not yet done with the region selection
-        self.selectionDone = False
+    @gui_thread
+    def display(self, pilImage, selection, quitOnSelect=False, prompt=None):
+        # Future that will be resolved when the user is done with the region selection
+        self.selection = selection
         # Get screen size
         w, h = self.root.winfo_screenwidth(), self.root.winfo_screenheight()
         # Set canvas to be fullscreen
@@ -127,10 +239,10 @@ class showPILandSelect(threading.Thread):
             ratio = min(w/imgWidth, h/imgHeight)
             imgWidth = int(imgWidth*ratio)
             imgHeight = int(imgHeight*ratio)
-            pilImage = pilImage.resize((imgWidth,imgHeight), Image.ANTIALIAS)
+            pilImage = pilImage.resize((imgWidth,imgHeight), Image.LANCZOS)
         if self.photoimage is not None:
             del self.photoimage
-        image = ImageTk.PhotoImage(pilImage)
+        image = ImageTk.PhotoImage(pilImage, master=self.root)
         self.photoimage = image
         #else:
         #    image = self.photoimage.paste(pilImage)
@@ -145,8 +257,10 @@ class showPILandSelect(threading.Thread):
         canvas.bind("<ButtonPress-1>", self.on_button_press)
         canvas.bind("<B1-Motion>", self.on_move_press)
 
+        if prompt is None:
+            prompt = "Please select the region to capture text to translate\n(use mouse left click)."
         canvas.create_text(w/2,h/2,fill="red",font="Times 20 italic bold",
-                        text="Please select the region to capture text to translate\n(use mouse left click).%s" % ("\nPress ESCAPE when done." if not quitOnSelect else ""))
+                        text="%s%s" % (prompt, "\nPress ESCAPE when done." if not quitOnSelect else ""))
 
         # What do we do after the user selected a region (ie, releasing the mouse button)?
         canvas.bind("<ButtonRelease-1>", lambda event: self.on_button_release(event, quitOnSelect))
@@ -157,7 +271,7 @@ class showPILandSelect(threading.Thread):
         self.root.deiconify()
 
         # set window on foreground, on top of others
-        self.root.focus_set()
+        self.root.focus_force()
         self.root.lift()
         self.root.attributes('-topmost', 'true')
 
@@ -189,9 +303,9 @@ class showPILandSelect(threading.Thread):
         """Hides window and signal the user finished the selection of a region"""
         # Hide the window
         self.root.withdraw()
-        #event.widget.withdraw()
-        # Signal the region selection is done
-        self.selectionDone = True
+        # Signal the region selection is done, by resolving the Future with the selected region, the waiting thread is woken up immediately
+        if self.selection is not None and not self.selection.done():
+            self.selection.set_result(self.get_rect_coords())
 
     def get_rect_coords(self):
         """Returns the coordinates of the rectangle drawn by the user, by fitting a bounding box over it"""
@@ -201,6 +315,7 @@ class showPILandSelect(threading.Thread):
         else:
             return self.canvas.bbox(self.rect)
 
+    @gui_thread
     def destroy(self):
         self.root.destroy()
 
@@ -220,59 +335,70 @@ def showPIL(pilImage):
         ratio = min(w/imgWidth, h/imgHeight)
         imgWidth = int(imgWidth*ratio)
         imgHeight = int(imgHeight*ratio)
-        pilImage = pilImage.resize((imgWidth,imgHeight), Image.ANTIALIAS)
+        pilImage = pilImage.resize((imgWidth,imgHeight), Image.LANCZOS)
     image = ImageTk.PhotoImage(pilImage)
     imagesprite = canvas.create_image(w/2,h/2,image=image)
     root.mainloop()
 
-def selectRegion(sct, RegionSelector, config, config_internal, quitOnSelect=False):
+def selectRegion(sct, RegionSelector, config_service, config_internal_service, quitOnSelect=False):
     """Region-based selection: take a whole desktop screenshot and allow the user to select the region from where to take further screenshots (easier than manipulating the OS window manager to draw rectangles on the REAL screen).
     The result is saved in the config file directly."""
+    # Get the latest config, so that user can change parameters on-the-fly (the file is re-parsed only if it was modified)
+    config = config_service.get()
 
     if config['USER']['debug'] == 'True':
         print('selectRegion triggered')
 
     # Grab whole desktop screenshot
     monitor = int(config['USER']['monitor'])
-    with mss.mss() as sct2:  # TODO: workaround for the thread unsafe issue https://github.com/BoboTiG/python-mss/issues/273
-        sct_img = sct2.grab(sct2.monitors[monitor]) if monitor >= 0 else 1 # sct.shot() captures the first monitor, sct.shot(mon=-1) captures all monitors, but they cannot capture a specific region. Under the hood, sct.shot() uses sct.save(), which itself calls sct.grab(), itself calling PIL.ImageGrab.grab(), with sct.grab(1) capturing the first monitor (it's 1-indexed, not 0! sct.monitors[0] should contain the list of all monitors), etc. - note that only sct.shot() can capture automatically the first monitor or all monitors, not grab() which on the other hand can capture a specific region on screen if provided a bounding box
+    # Capture with the grabber of the current thread, it is created once per thread and then reused (mss is not thread-safe, see https://github.com/BoboTiG/python-mss/issues/273)
+    # sct.monitors[1] is the first monitor (it's 1-indexed, not 0! sct.monitors[0] contains all monitors combined)
     # Convert to a PIL Image (else we can't show it on screen)
-    img = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
+    img = sct.grab_image(sct.monitors[monitor if monitor >= 0 else 1])
 
     if config['USER']['debug'] == 'True':
-        # Get path to temporary image file (need to save to a file to pass onto Tesseract, there's no other way to directly pipe)
-        imgtemppath = 'debugselect.png'
-        # Save to the picture file
-        mss.tools.to_png(sct_img.rgb, sct_img.size, output=imgtemppath)
-
-    # Display screenshot and allow user to select a region
-    RegionSelector.display(img, quitOnSelect=quitOnSelect)
-    # Wait until the user selects a region (we launch the RegionSelector as a thread, so it's non-blocking + the thread is never stopped so we can reuse it and avoid memory leaks)
-    while RegionSelector.selectionDone is not True:  # we wait until the thread changes its lock-like variable to signal the user selected a region
-        # TODO: maybe do this more elegantly with a threading.Lock?
-        time.sleep(1)
-    # Get the selected rectangle's coordinates
-    rectcoords = RegionSelector.get_rect_coords()
-    # Need to manually destroy Tk root window, else if we try to display it twice it will fail with a weird exception
-    #appregionselect.destroy()
+        # Save to a picture file, in the background
+        core.get_debug_writer().save(img, 'debugselect.png')
+
+    # Display screenshot in the GUI thread and wait until the user selects a region, we are woken up as soon as the selection is done
+    rectcoords = RegionSelector.select(img, quitOnSelect=quitOnSelect).result()
     # Save in config
     if rectcoords is not None:
-        if not 'INTERNAL' in config_internal:
-            config_internal['INTERNAL'] = {}
-        config_internal['INTERNAL']['region'] = repr(rectcoords)  # convert to a string to be parseable by configParser
-        with open(config_internal.fullpath, 'w') as cfg:
-            config_internal.write(cfg)
-
-class TranslationBox(threading.Thread):
-    """Translation box, where the OCR'ed text will be copied to, and the translation will be displayed. It's essentially a text container, but it allows the user to manually correct the OCR'ed text before feeding it to the machine translator, and it can be done iteratively since we provide a Translate button to retry an erronous translation (also, the config file can be edited to change translator on-the-fly)."""
-    def __init__(self, config, config_internal):
-        threading.Thread.__init__(self)
-        self.config = config
-        self.config_internal = config_internal
+        config_internal_service.set('region', repr(rectcoords), flush=True)  # convert to a string to be parseable by configParser
+
+def selectNamedRegions(sct, RegionSelector, config_service, config_internal_service):
+    """Select the named regions defined in the config file (sections [REGION name]) one after the other, on the same desktop screenshot. A region is selected on mouse click release, press Escape without drawing to keep its previous coordinates.
+    The results are saved in the REGIONS section of the internal config file."""
+    config = config_service.get()
+    names = regions.region_names(config)
+    if not names:
+        show_errorbox("Error: no named region is defined, please add [REGION name] sections in the config file (see the example at the end of config.ini)")
+        return
+
+    # Grab whole desktop screenshot once for all the regions
+    monitor = int(config['USER']['monitor'])
+    img = sct.grab_image(sct.monitors[monitor if monitor >= 0 else 1])
+
+    for i, name in enumerate(names):
+        rectcoords = RegionSelector.select(img, quitOnSelect=True, prompt="Please select the region '%s' (%i/%i)\n(use mouse left click, or press ESCAPE to keep it unchanged)." % (name, i + 1, len(names))).result()
+        if rectcoords is not None:
+            config_internal_service.set(name, repr(rectcoords), section='REGIONS')
+    config_internal_service.flush()
+
+class TranslationBox(object):
+    """Translation box, where the OCR'ed text will be copied to, and the translation will be displayed. It's essentially a text container, but it allows the user to manually correct the OCR'ed text before feeding it to the machine translator, and it can be done iteratively since we provide a Translate button to retry an erronous translation (also, the config file can be edited to change translator on-the-fly).
+    Must be created in the GUI thread."""
+    def __init__(self, gui, config_service, config_internal_service):
+        self.gui = gui
+        self.config_service = config_service
+        self.config_internal_service = config_internal_service
         self.previewer = None
-        self.setDaemon(True)  # always close thread along with parent process
-        self.start()
-    
+        self.pipeline = None
+        self.autotuner = None
+        # Generation of the result shown, so that the result of an older request finishing late never overwrites the result of a newer one
+        self.latest = scheduler.LatestOnly()
+        self.build()
+
     def closeWindow(self):
         self.root.withdraw()
         #self.root.quit()
@@ -280,43 +406,64 @@ class TranslationBox(threading.Thread):
     def save_geometry(self, event):
         """Save size and position of window when moved around to reopen later at the same position"""
         # Inspired by https://stackoverflow.com/a/43160322/1121352
-        if not 'INTERNAL' in self.config_internal:
-            self.config_internal['INTERNAL'] = {}
-        self.config_internal['INTERNAL']['translationbox_position'] = self.root.geometry()
-        with open(self.config_internal.fullpath, 'w') as cfg:
-            self.config_internal.write(cfg)
+        # The write to disk is debounced, as this is called for every <Configure> event while the window is being dragged
+        self.config_internal_service.set('translationbox_position', self.root.geometry())
 
     def load_geometry(self):
         """Load size and position of window from config file"""
-        if 'INTERNAL' in self.config_internal and 'translationbox_position' in self.config_internal['INTERNAL']:
-            self.root.geometry(self.config_internal['INTERNAL']['translationbox_position'])
+        config_internal = self.config_internal_service.get()
+        if 'INTERNAL' in config_internal and 'translationbox_position' in config_internal['INTERNAL']:
+            self.root.geometry(config_internal['INTERNAL']['translationbox_position'])
 
     def translate(self):
-        # Reload config file, so that user can change parameters on-the-fly
-        self.config = read_config(self.config.fullpath)
-        self.config_internal = read_config(self.config_internal.fullpath)
+        # Get the latest config, so that user can change parameters on-the-fly (the file is re-parsed only if it was modified)
+        config = self.config_service.get()
         # Update ocrtext with the textbox input
         self.ocrtext = self.txtsrc.get("1.0","end-1c")  # end-1c trick from https://stackoverflow.com/questions/14824163/how-to-get-the-input-from-the-tkinter-text-box-widget
-        # Translate using machine translation (various several translators API are supported)
-        self.transtext = translate_any(self.config, self.ocrtext, self.config['USER']['lang_source_trans'], self.config['USER']['lang_target'])
+        # If the button is clicked again (or a new capture is translated) before this translation is done, this translation will be ignored
+        generation = scheduler.next_generation()
+        # Translate in a background thread, so that the GUI stays responsive while waiting for the translator
+        def worker(ocrtext):
+            # Translate using machine translation (various several translators API are supported), bypassing the translation cache since the user explicitly asks to translate again
+            sections = regions.parse_sections(ocrtext)
+            if sections is not None:
+                # Text of several named regions: translate each region with its own profile, in parallel
+                names = regions.region_names(config)
+                def translate_section(section):
+                    name, text = section
+                    rconfig = regions.region_config(config, name) if name in names else config
+                    return name, core.translate_any(rconfig, text, rconfig['USER']['lang_source_trans'], rconfig['USER']['lang_target'], use_cache=False) if text.strip() else ''
+                transtext = regions.format_sections(get_regions_executor(config).map(translate_section, sections))
+            else:
+                transtext = core.translate_any(config, ocrtext, config['USER']['lang_source_trans'], config['USER']['lang_target'], use_cache=False)
+            self.update_translation(transtext, generation=generation)
+        threading.Thread(target=worker, args=(self.ocrtext,), daemon=True).start()
+
+    @gui_thread
+    def update_translation(self, transtext, generation=None):
+        if not self.latest.accept(generation):
+            # A newer result is already shown
+            return
+        self.transtext = transtext
+        self.root.title("pyugt translation")
         # Clear up the translation textbox
         self.txtout.delete("1.0", tkinter.END)
         # Rewrite the translation textbox content with the new translation
         self.txtout.insert('1.0', self.transtext)
 
-    def run(self):
+    def build(self):
         # Launch GUI
-        root = tkinter.Tk()  # this is the main window, so we can use Tk() to initialize, instead of Toplevel() for others
+        root = tkinter.Toplevel(self.gui.root)  # child of the hidden Tk() root owned by the GUI thread
         self.root = root
         # Clean up window on close
         root.protocol("WM_DELETE_WINDOW", self.closeWindow)
+        # Title and default window size
+        root.title("pyugt translation")
+        root.geometry('300x500')
         # Load position if one is saved in config file
         self.load_geometry()
         # Save size and position in config on move
         root.bind("<Configure>", self.save_geometry)
-        # Title and default window size
-        root.title("pyugt translation")
-        root.geometry('300x500')
         # Make content resizable + give same weight for both textboxes so they have the same size
         root.grid_columnconfigure(0, weight=1)
         root.grid_columnconfigure(1, weight=1)
@@ -341,10 +488,17 @@ class TranslationBox(threading.Thread):
         root.focus_set()
         root.lift()
         root.attributes('-topmost', 'true')
-        # Show window
-        root.mainloop()
 
-    def update_text(self, ocrtext, transtext):
+    @gui_thread
+    def update_text(self, ocrtext, transtext, fuzzy=None, generation=None):
+        if not self.latest.accept(generation):
+            # A newer result is already shown
+            return
+        # Show in the title if the translation is a fuzzy match from the translation memory (the translation of a similar text), with the similarity
+        if fuzzy is not None:
+            self.root.title("pyugt translation (fuzzy match %i%%)" % int(fuzzy * 100))
+        else:
+            self.root.title("pyugt translation")
         # Clear up the textboxes
         self.txtsrc.delete("1.0", tkinter.END)
         self.txtout.delete("1.0", tkinter.END)
@@ -358,175 +512,309 @@ class TranslationBox(threading.Thread):
         self.root.lift()
         self.root.attributes('-topmost', 'true')
 
-@retry(wait=wait_exponential(multiplier=1, max=5) + wait_random(0, 2), stop=stop_after_delay(10))
-def translate_online_free(ocrtext, langsource_trans, langtarget='en', translator='google'):
-    """Translate using the translators module which queries web apps free interfaces, but can be denied access due to throttling, hence we retry"""
-    return translators.translate_text(ocrtext, translator=translator, from_language=langsource_trans, to_language=langtarget)
+def captureRegion(sct, config, config_internal, reuse=False):
+    """Capture a screenshot of the previously defined region and return it as a PIL image.
+    If reuse is True, the image buffer is reused across captures of the same thread to avoid allocations in high-rate captures, so the image is only valid until the next capture."""
+    img = grabBox(sct, config, config_internal.region, reuse=reuse)
 
-def translate_online_paid_deepl(ocrtext, langsource_trans, langtarget='EN-US', authkey=None):
-    """Translate using DeepL API, not throttled but may require payments if too many requests. Currently best in class japaneses -> english translator."""
-    translator = deepl.Translator(authkey)
-    return translator.translate_text(ocrtext, source_lang=langsource_trans, target_lang=langtarget).text
+    # Save screenshot if in debug mode, in the background and at most once per second (the PNG encoding is slow). A reused buffer is copied, since it will be overwritten by the next capture.
+    if config['USER']['debug'] == 'True':
+        core.get_debug_writer().save(img.copy() if reuse else img, 'debugtranslate.png')
+    return img
 
-def translate_offline_argos(ocrtext, from_code, to_code='en'):
-    """Offline translation using Argos Translate, based on OpenNMT"""
-    # Download and install Argos Translate package if necessary, otherwise will automatically reuse the one already downloaded
-    argostranslate.package.update_package_index()
-    try:
-        available_packages = argostranslate.package.get_available_packages()
-        package_to_install = next(
-            filter(
-                lambda x: x.from_code == from_code and x.to_code == to_code, available_packages
-            )
-        )
-        argostranslate.package.install_from_path(package_to_install.download())
-    except StopIteration as exc:
-        raise ValueError('ERROR: no matching language found for either the target language %s or source language %s, please check if they are valid for the selected translator!' % (to_code, from_code))
-    except Exception as exc:
-        traceback.print_exc()
-        pass
-
-    # Translate
-    return argostranslate.translate.translate(ocrtext, from_code, to_code)
-
-def translate_any(config, ocrtext, langsource_trans, langtarget):
-    """Helper function to select a translator according to config file and return a translation, and manage exceptions gracefully"""
-    # Send ocr text to the machine translator, but first select which translator we want
-    transtext = ''
-    try:
-        if config['USER']['translator_lib'] == 'online_free':
-            transtext = translate_online_free(ocrtext, langsource_trans, langtarget, translator=config['USER']['translator_lib_online_free_service'])
-        elif config['USER']['translator_lib'] == 'deepl':
-            transtext = translate_online_paid_deepl(ocrtext, langsource_trans, langtarget, authkey=config['USER']['translator_lib_deepl_authkey'])
-        elif config['USER']['translator_lib'] == 'offline_argos':
-            transtext = translate_offline_argos(ocrtext, langsource_trans, langtarget)
-        else:
-            raise ValueError('Specified translator_lib in config.ini does not exist! Please specify one of the following: online_free, deepl or offline_argos.')
-    except Exception as exc:
-        # When querying online services, we can always run into exceptions and availability issues, then this may crash the app, so we need to catch the exception
-        print('ERROR: an exception occurred while trying to translate text:')
-        traceback.print_exc()
-        transtext = 'ERROR'
-    return transtext
-
-def translateRegion(sct, TBox, config, config_internal):
-    """Capture a screenshot of a previously defined region, preprocess to increase contrast for OCR, detect text out of image using Tesseract OCR and finally translate via a machine translator"""
-    # Reload config file, so that user can change parameters on-the-fly
-    config = read_config(config.fullpath)
-    config_internal = read_config(config_internal.fullpath)
-    # Debug print
+def captureRegions(sct, config, named):
+    """Capture the named regions, given as a list of (name, coordinates), in a single screenshot of their bounding box (one grab is much faster than one grab per region). Returns the list of (name, coordinates, PIL image)."""
+    box = preprocessing.union_box([coords for name, coords in named])
+    img = grabBox(sct, config, box)
     if config['USER']['debug'] == 'True':
-        print('translateRegion triggered')
-    # First check a region was set, else raise an error
-    if 'INTERNAL' not in config_internal or 'region' not in config_internal['INTERNAL'] or ast.literal_eval(config_internal['INTERNAL']['region']) is None:
-        show_errorbox("Error: please first select a region to capture from (use hotkey %s)" % config['USER']['hotkey_set_region_capture'])
-        return
-    # Load config file into memory variables
-    langsource_ocr = config['USER']['lang_source_ocr']
-    langsource_trans = config['USER']['lang_source_trans']
-    langtarget = config['USER']['lang_target']
+        core.get_debug_writer().save(img, 'debugtranslate.png')
+    return regions.crop_regions(img, box[:2], named)
+
+def grabBox(sct, config, box, reuse=False):
+    """Grab a screenshot of a box (x0, y0, x1, y1) of the monitor selected in the config file, as a PIL image"""
     # Grab screenshot of a specific region
-    x0,y0,x1,y1 = ast.literal_eval(config_internal['INTERNAL']['region'])
+    x0,y0,x1,y1 = box
     screenregion = {'top': y0, 'left': x0, 'width': x1-x0, 'height': y1-y0}  # region to capture
     monitor = int(config['USER']['monitor'])  # get user selected monitor (-2 for first monitor, -1 for all monitors, 0 for monitor 0, etc).
     screenregion['mon'] = monitor if monitor >= 0 else 1  # if the region to capture is on another monitor than the default one, the user can specify it. Note that only sct.grab() can capture a subregion on the screen provided a bounding box, but requires a monitor, unlike sct.shot() / sct.save().
-    with mss.mss() as sct2:  # TODO: workaround for the thread unsafe issue https://github.com/BoboTiG/python-mss/issues/273
-        sct_img = sct2.grab(screenregion)  # grab screenshot of the region
-    # Convert to a PIL Image (else we can't show it on screen)
-    img = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
-
-    # Save screenshot if in debug mode
-    if config['USER']['debug'] == 'True':
-        # Get path to temporary image file (need to save to a file to pass onto Tesseract, there's no other way to directly pipe)
-        imgtemppath = 'debugtranslate.png'
-        # Save to the picture file
-        mss.tools.to_png(sct_img.rgb, sct_img.size, output=imgtemppath)
-
-    # Preprocess screenshot to improve OCR accuracy (particularly over translucent backgrounds)
-    if config['USER']['preprocessing'] == 'True':
-        # Convert to greyscale and upscale image to artificially increase resolution
-        img = img.convert('L').resize((2 * _ for _ in img.size), resample=Image.LANCZOS)
-        if config['USER']['preprocessing_filters'] != 'None':
-            # Load up the list of filters to apply, from the config file
-            # The filters should be part of PILLOW.ImageFilter
-            imfilters = ast.literal_eval(config['USER']['preprocessing_filters'])
-            # Apply filters (remove translucent background, increase contrast of the letters, etc)
-            for imfilter in imfilters:
-                img = img.filter(getattr(ImageFilter, imfilter))
-        if config['USER']['preprocessing_binarize_threshold'] != 'None':
-            # Binarize
-            #fn = lambda x : 255 if x > thresh else 0  # real binarization
-            fn = lambda p : p > thresh and p + 100  # fake binarization, we simply add 100 to the pixels above the threshold, this helps keep some of the variation in the pixels intensities which can be helpful to recognize the letters, from: https://stackoverflow.com/questions/51688973/image-preprocessing-for-ocr-tessaract
-            thresh = int(config['USER']['preprocessing_binarize_threshold'])
-            try:
-                img = img.point(fn, mode='1')
-            except ValueError as exc:
-                # Exception when the screenshot is too small
-                pass
-        if config['USER']['preprocessing_invert'] == 'True':
-            # Invert image so that the text is black and background white, this works better with Tesseract according to doc: https://tesseract-ocr.github.io/tessdoc/ImproveQuality
-            img = ImageMath.eval('255 - (a)', a=img.convert('1')).convert('L')  # convert back to greyscale, else can't save a binary image and is buggy for PILLOW and maybe for Tesseract, so better be safe
-
-    # Save preprocessed screenshot if in debug mode
-    preview_on = TBox.previewer is not None and TBox.previewer.shown
-    if config['USER']['debug'] == 'True' or preview_on:
-        # Get path to temporary image file
-        imgtemppath = 'debugtranslatepreproc.png'
-        # Save to the picture file
-        img.save(imgtemppath, 'PNG')
-        # Refresh OCR preview image is the preview window is there
-        # Since we are using threads, it's difficult to pass objects between threads, so as a workaround we save into a temporary file and reopen it in the OCR Preview window thread
-        if preview_on:
-            TBox.previewer.preview(imgtemppath)
-
-    # Tesseract OCR to extract text, directly from a PIL image object thanks to the pytesseract wrapper. Otherwise, we would need to save to a temporary file to pass onto Tesseract, as there's no other way to directly pipe without pytesseract
-    ocrtext = pytesseract.image_to_string(img, lang=langsource_ocr, nice=1)
-    # TODO: use image_to_boxes or image_to_osd or image_to_data to get position of strings and place them back in place on a screenshot, similarly to what Universal Game Translator does
-    if not ocrtext.strip():
-        show_errorbox('No text found by OCR! Make sure your capture region is properly set!')
-        return
+    # Grab screenshot of the region with the grabber of the current thread, and convert to a PIL Image directly from the raw BGRA buffer (else we can't show it on screen)
+    return sct.grab_image(screenregion, reuse=reuse)
+
+def has_region(config_internal):
+    """Check if a region to capture was set"""
+    return config_internal.region is not None
+
+def ocrStage(job):
+    """Pipeline stage: preprocess the captured screenshot and OCR it. Returns False if no text was found.
+    For named regions, the regions are OCR'ed in parallel, each with its own profile."""
+    config = job.config
+    parts = getattr(job, 'parts', None)
+    if parts:
+        # Allow one warm engine per region, so that regions with the same language are not OCR'ed one after the other
+        ocrengine.reserve_engines(len(parts))
+        def ocr_part(part):
+            part.ocrtext, part.blocks = core.ocrImage(part.img, part.config, job.TBox.autotuner, job.TBox.previewer, region=part.region, trace=job.trace, preview=part is parts[0], cancelled=job.cancelled)
+        # Wait for all the regions, the latency is the one of the slowest region
+        list(get_regions_executor(config).map(ocr_part, parts))
+        job.blocks = None
+        ocrtext = regions.format_sections((part.name, part.ocrtext.strip()) for part in parts)
+        found = any(part.ocrtext.strip() for part in parts)
+    else:
+        ocrtext, job.blocks = core.ocrImage(job.img, config, job.TBox.autotuner, job.TBox.previewer, region=job.region, trace=job.trace, cancelled=job.cancelled)
+        found = bool(ocrtext.strip())
+    if job.cancelled():
+        # Superseded by a newer capture
+        return False
+    if not found:
+        if not job.quiet:
+            show_errorbox('No text found by OCR! Make sure your capture region is properly set!')
+        return False
     if config['USER']['debug'] == 'True':
         print('OCR\'ed text:')
         print(ocrtext)
     #os.system('tesseract -l {imgpath} {srclang} {outputtxt}'.format(imgpath=os.path.abspath(imgtemppath), srclang=langsource, outputtxt='test'))  # alternative way to generate the OCR, by commandline call directly
-
-    # Translate using a machine translator
-    if config['USER']['ocr_only'] == 'True':
-        # Do not translate if ocr_only is enabled
-        transtext = ''
+    job.ocrtext = ocrtext
+    return True
+
+# Thread pool processing the named regions of a capture in parallel, rebuilt if its size changes in the config file
+_regions_executor = None
+_regions_executor_params = None
+_regions_executor_lock = threading.Lock()
+
+def get_regions_executor(config):
+    """Get the thread pool processing the named regions in parallel. Tesseract (both in-process and as a subprocess) and the translators release the GIL, so threads are enough."""
+    global _regions_executor, _regions_executor_params
+    # 0 means one thread per region: the threads are only started when needed, so the pool never has more threads than regions
+    params = int(config['USER'].get('regions_workers', '0')) or 32
+    with _regions_executor_lock:
+        if params != _regions_executor_params:
+            if _regions_executor is not None:
+                _regions_executor.shutdown(wait=False)
+            _regions_executor = concurrent.futures.ThreadPoolExecutor(max_workers=params, thread_name_prefix='pyugt-region')
+            _regions_executor_params = params
+        return _regions_executor
+
+# Background writer of the logs, rebuilt if the logs paths change in the config file
+_log_writer = None
+_log_writer_params = None
+_log_writer_lock = threading.Lock()
+
+def get_log_writer(config):
+    """Get the background writer of the logs configured in the config file, or None if all logs are disabled"""
+    global _log_writer, _log_writer_params
+    params = (config['USER']['log_ocr'], config['USER']['log_translation'], config['USER'].get('log_store', 'None'))
+    with _log_writer_lock:
+        if params != _log_writer_params:
+            if _log_writer is not None:
+                _log_writer.close()
+                _log_writer = None
+            log_ocr, log_translation, log_store = params
+            stores = []
+            if log_ocr != 'None':
+                stores.append(logstore.TextLogStore(log_ocr, field='ocr', title='OCR'))
+            if log_translation != 'None':
+                stores.append(logstore.TextLogStore(log_translation, field='translation', title='Translation'))
+            if log_store != 'None':
+                stores.append(logstore.open_store(log_store))
+            if stores:
+                _log_writer = logstore.BufferedLogWriter(stores)
+            _log_writer_params = params
+        return _log_writer
+
+def logTranslation(config, ocrtext, transtext, blocks=None, region=None, trace=None):
+    """Save OCR'ed text and translation in logs if specified, the records are written by a background writer so that we never wait on the disk"""
+    log_writer = get_log_writer(config)
+    if log_writer is not None:
+        confidences = [block.conf for block in blocks] if blocks else None
+        log_writer.log(logstore.make_record(ocrtext, transtext,
+                                            region=region,
+                                            backend=core.translator_backend_name(config) if config['USER']['ocr_only'] != 'True' else None,
+                                            lang_source=config['USER']['lang_source_ocr'],
+                                            lang_target=config['USER']['lang_target'],
+                                            confidence=sum(confidences) / len(confidences) if confidences else None,
+                                            latency=time.perf_counter() - trace.start if trace is not None else None))
+
+def translateStage(job):
+    """Pipeline stage: translate the OCR'ed text using a machine translator, and save in logs.
+    For named regions, the regions are translated in parallel, each with its own profile, and logged separately."""
+    config = job.config
+    if job.cancelled():
+        # Superseded by a newer capture while waiting for a translation worker
+        return False
+    # Similarities of the translations served by the fuzzy translation memory, if any
+    job.fuzzy = []
+    parts = getattr(job, 'parts', None)
+    if parts:
+        def translate_part(part):
+            if not part.ocrtext.strip():
+                part.transtext = ''
+                return
+            part.ocrtext, part.transtext = core.translateText(part.config, part.ocrtext, part.blocks, trace=job.trace, fuzzy=job.fuzzy, blocks_translator=core.get_blocks_translator(part.name))
+            logTranslation(part.config, part.ocrtext, part.transtext, part.blocks, region=part.region, trace=job.trace)
+        list(get_regions_executor(config).map(translate_part, parts))
+        job.ocrtext = regions.format_sections((part.name, part.ocrtext.strip()) for part in parts)
+        job.transtext = regions.format_sections((part.name, part.transtext) for part in parts)
     else:
-        if config['USER']['remove_line_returns'] == 'True':
-            # If enabled, remove line returns automatically, so that we consider all sentences to be one (this can help the translator make more sense because it will have more context to work with).
-            ocrtext = ocrtext.replace("\n", "")
-        # Send ocr text to the machine translator
-        transtext = translate_any(config, ocrtext, langsource_trans, langtarget)
+        job.ocrtext, job.transtext = core.translateText(config, job.ocrtext, job.blocks, trace=job.trace, fuzzy=job.fuzzy)
+        logTranslation(config, job.ocrtext, job.transtext, job.blocks, region=getattr(job, 'region', None), trace=job.trace)
 
     if config['USER']['debug'] == 'True':
         print('Translated text:')
-        print(transtext)
-
-    # Save OCR'ed text and translation in logs if specified. The same datetime will be written for both, so that they can be matched externally.
-    curdatetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    if config['USER']['log_ocr'] != 'None':
-        with codecs.open(config['USER']['log_ocr'], 'a', 'utf-8-sig') as f:
-            f.write("-> OCR at %s:\n" % curdatetime)
-            f.write(ocrtext)
-            f.write("\n---------------------\n")
-    if config['USER']['log_translation'] != 'None':
-        with codecs.open(config['USER']['log_translation'], 'a', 'utf-8-sig') as f:
-            f.write("-> Translation at %s:\n" % curdatetime)
-            f.write(transtext)
-            f.write("\n---------------------\n")
-
-    TBox.update_text(ocrtext, transtext)
-
-def selectAndTranslateRegion(sct, RegionSelector, TBox, config, config_internal):
+        print(job.transtext)
+    return True
+
+def deliverStage(job):
+    """Pipeline stage: show the result in the translation box"""
+    start = time.perf_counter()
+    def done(future):
+        # Called once the GUI thread updated the translation box
+        duration = time.perf_counter() - start
+        metrics.REGISTRY.observe('pyugt_stage_seconds', duration, stage='gui_update')
+        job.trace.add('gui_update', duration)
+        metrics.REGISTRY.observe('pyugt_capture_to_display_seconds', time.perf_counter() - job.trace.start)
+        if job.config['USER']['debug'] == 'True':
+            print(job.trace.summary())
+            print(metrics.REGISTRY.summary('pyugt_capture_to_display_seconds'))
+        export_metrics(job.config)
+    job.TBox.update_text(job.ocrtext, job.transtext, fuzzy=min(job.fuzzy) if getattr(job, 'fuzzy', None) else None, generation=getattr(job, 'generation', None)).add_done_callback(done)
+
+def export_metrics(config):
+    """Write the metrics to the Prometheus text file if one is set in the config"""
+    path = config['USER'].get('metrics_textfile', 'None')
+    if path != 'None':
+        try:
+            metrics.REGISTRY.write_textfile(path)
+        except Exception as exc:
+            print('ERROR: cannot write the metrics file %s: %s' % (path, exc))
+
+def translateRegion(sct, TBox, config_service, config_internal_service, img=None, quiet=False):
+    """Capture a screenshot of a previously defined region, preprocess to increase contrast for OCR, detect text out of image using Tesseract OCR and finally translate via a machine translator.
+    If img is provided, it is used instead of capturing a new screenshot. If quiet is True, no error box is shown when no text is found (useful for the watch mode).
+    Only the capture is done in the calling thread (eg, the hotkey callback), the rest is submitted to the pipeline if one is attached to the translation box, so that the OCR of the next capture can overlap with the translation of this one."""
+    # Get the latest config, so that user can change parameters on-the-fly (the files are re-parsed only if they were modified)
+    config = config_service.get()
+    config_internal = config_internal_service.get()
+    # Debug print
+    if config['USER']['debug'] == 'True':
+        print('translateRegion triggered')
+    # Timings of each stage of this capture
+    trace = metrics.Trace()
+    # Generation of this capture, its result will not be shown if the result of a newer capture was already shown
+    generation = scheduler.next_generation()
+    # Named regions, if any are defined and selected (the watch mode provides its own capture of the single region)
+    named = regions.get_regions(config, config_internal) if img is None else []
+    if named:
+        # Grab all the named regions at once, each region is then processed with its own profile
+        with metrics.span('capture', trace):
+            captures = captureRegions(sct, config, named)
+        parts = [regions.RegionPart(name, coords, part_img, regions.region_config(config, name)) for name, coords, part_img in captures]
+        job = pipeline.Job(img=None, parts=parts, config=config, TBox=TBox, quiet=quiet, trace=trace, generation=generation, region=preprocessing.union_box([coords for name, coords in named]))
+    else:
+        if img is None:
+            # First check a region was set, else raise an error
+            if not has_region(config_internal):
+                show_errorbox("Error: please first select a region to capture from (use hotkey %s)" % config['USER']['hotkey_set_region_capture'])
+                return
+            # Grab screenshot of the region
+            with metrics.span('capture', trace):
+                img = captureRegion(sct, config, config_internal)
+        job = pipeline.Job(img=img, config=config, TBox=TBox, quiet=quiet, trace=trace, generation=generation, region=config_internal.region)
+    if TBox.pipeline is not None:
+        # Process in the background pipeline
+        TBox.pipeline.submit(job)
+    else:
+        # Process sequentially in the current thread
+        if ocrStage(job) and translateStage(job):
+            deliverStage(job)
+
+def selectAndTranslateRegion(sct, RegionSelector, TBox, config_service, config_internal_service):
     """Wrapper to select a region and translate it directly after, this streamlines the process"""
-    selectRegion(sct, RegionSelector, config, config_internal, quitOnSelect=True)
-    translateRegion(sct, TBox, config, config_internal)
+    selectRegion(sct, RegionSelector, config_service, config_internal_service, quitOnSelect=True)
+    translateRegion(sct, TBox, config_service, config_internal_service)
+
+def image_dhash(img, hash_width=64, hash_height=32):
+    """Compute a difference hash of an image: a cheap perceptual hash robust to small noise, where each bit tells if a pixel is brighter than its right neighbour in a downscaled greyscale version of the image.
+    The hash is wider than tall, because text boxes usually are, and a change of just one or two characters must flip a few bits."""
+    # Downscale first and then convert to greyscale, this is a lot cheaper than the other way around on big regions
+    small = img.resize((hash_width + 1, hash_height), resample=Image.BOX).convert('L')
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_height):
+        offset = row * (hash_width + 1)
+        for col in range(hash_width):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+def hamming_distance(hash1, hash2):
+    """Number of differing bits between two hashes"""
+    return bin(hash1 ^ hash2).count('1')
+
+class RegionWatcher(threading.Thread):
+    """Watch mode: continuously capture the saved region at a configurable rate, and OCR and translate only when the region has changed and then stayed stable for a few frames (so that text that is still being typed out is skipped). Between changes, only a screenshot and a tiny hash are computed per frame, so CPU usage stays near idle."""
+    def __init__(self, sct, TBox, config_service, config_internal_service):
+        threading.Thread.__init__(self)
+        self.sct = sct
+        self.TBox = TBox
+        self.config_service = config_service
+        self.config_internal_service = config_internal_service
+        # Set when watching, cleared when paused
+        self.active = threading.Event()
+        self.daemon = True  # always close thread along with parent process
+        self.start()
+
+    def toggle(self):
+        """Start or pause watching the region"""
+        if self.active.is_set():
+            self.active.clear()
+            print('Watch mode disabled.')
+        else:
+            self.active.set()
+            print('Watch mode enabled.')
+
+    def run(self):
+        prev_hash = None  # hash of the previous frame
+        last_hash = None  # hash of the last translated frame
+        stable = 0  # number of consecutive frames without change
+        while True:
+            # Wait until watch mode is enabled, without consuming any CPU
+            self.active.wait()
+            # Get the latest config, so that user can change parameters on-the-fly (the files are re-parsed only if they were modified, so this costs only two stat calls per frame)
+            config = self.config_service.get()
+            config_internal = self.config_internal_service.get()
+            interval = float(config['USER'].get('watch_interval', '0.5'))
+            stable_frames = int(config['USER'].get('watch_stable_frames', '2'))
+            threshold = int(config['USER'].get('watch_hash_threshold', '1'))
+            if not has_region(config_internal):
+                time.sleep(interval)
+                continue
+            try:
+                # Reuse the same image buffer for all the frames, as most of them are only hashed
+                img = captureRegion(self.sct, config, config_internal, reuse=True)
+                curhash = image_dhash(img)
+                if prev_hash is not None and hamming_distance(curhash, prev_hash) <= threshold:
+                    stable += 1
+                else:
+                    stable = 0
+                prev_hash = curhash
+                # Translate only if the region changed since the last translation and is stable for enough frames
+                if stable >= stable_frames and (last_hash is None or hamming_distance(curhash, last_hash) > threshold):
+                    last_hash = curhash
+                    if config['USER']['debug'] == 'True':
+                        print('Watch mode: region changed, translating')
+                    translateRegion(self.sct, self.TBox, self.config_service, self.config_internal_service, img=img.copy(), quiet=True)
+            except Exception as exc:
+                print('ERROR: an exception occurred in watch mode:')
+                traceback.print_exc()
+            time.sleep(interval)
 
 def show_errorbox(msg):
-    """Show an error box"""
+    """Show an error box, can be called from any thread"""
+    gui = GUIDispatcher.current
+    if gui is not None:
+        # Show the error box from the GUI thread, without waiting for the user to close it
+        gui.call(messagebox.showerror, "Error", msg, parent=gui.root)
+        return
+    # No GUI thread yet (eg, error at startup)
     root = tkinter.Toplevel()  # when we want to display another window on top of the root, such as an error box, then a TopLevel() is to be used instead of Tk(), but do not ever destroy these children windows, only hide them when done, so we can reuse and show them later
     root.withdraw()
     messagebox.showerror("Error", msg)
@@ -540,42 +828,25 @@ def show_errorbox_exception(msg):
     raise Exception(msg)
 
 def read_config(configFileArg=None, default_path='config.ini'):
-    """Read a config file, either in the default path or in the provided path"""
-    # Path to current script (to find the config file)
-    curpath = os.path.dirname(os.path.abspath(__file__))
-    # Load config file
-    config = configparser.ConfigParser()
-    if configFileArg:
-        # Specified by user
-        configFile = os.path.abspath(configFileArg)
-    else:
-        # Default path
-        configFile = os.path.join(curpath, default_path)
-    # Check the path exists
-    if not os.path.exists(configFile):
-        show_errorbox_exception('Specified configuration file (%s) does not exist!' % configFile)
-    # Load up the config file in memory
-    config.read(configFile)
-    # Add an attribute to the config object to store the fullpath, so that we can overwrite the config file later
-    config.fullpath = configFile
-    # Return the fully loaded config file
-    return config
-
-class OCRPreviewer(threading.Thread):
-    """Display small window of the size of the input image, and refresh it anytime by supplying a new image"""
-    def __init__(self):
-        threading.Thread.__init__(self)
-        self.setDaemon(True)  # always close thread along with parent process
-        self.start()
-
-    def run(self):
+    """Read a config file, either in the default path or in the provided path, showing an error box if it does not exist"""
+    try:
+        return core.read_config(configFileArg, default_path=default_path)
+    except IOError as exc:
+        show_errorbox_exception(str(exc))
+
+class OCRPreviewer(object):
+    """Display small window of the size of the input image, and refresh it anytime by supplying a new image. Must be created in the GUI thread."""
+    def __init__(self, gui):
+        self.gui = gui
         # Create a Toplevel() dialog window, we can create multiple ones
-        root = tkinter.Toplevel()  # use Toplevel() instead of Tk() to reopen the same dialog multiple times and to avoid the pyimage2 does not exist error, see also: https://github.com/dangillet/PythonFaqFr/blob/master/doc/tkinter.md and https://stackoverflow.com/questions/39458318/how-to-allow-a-tkinter-window-to-be-opened-multiple-times and https://stackoverflow.com/questions/26097811/image-pyimage2-doesnt-exist -- but then there are issues with this approach, so we want each window to be separated and not interact together directly but only indirectly through files such as config files and images: https://stackoverflow.com/questions/45799121/runtimeerror-calling-tcl-from-different-appartment-tkinter-and-threading
+        root = tkinter.Toplevel(gui.root)  # use Toplevel() instead of Tk() to reopen the same dialog multiple times and to avoid the pyimage2 does not exist error, see also: https://github.com/dangillet/PythonFaqFr/blob/master/doc/tkinter.md and https://stackoverflow.com/questions/39458318/how-to-allow-a-tkinter-window-to-be-opened-multiple-times and https://stackoverflow.com/questions/26097811/image-pyimage2-doesnt-exist -- but then there are issues with this approach, so we want each window to be separated and not interact together directly but only indirectly through files such as config files and images: https://stackoverflow.com/questions/45799121/runtimeerror-calling-tcl-from-different-appartment-tkinter-and-threading
         self.root = root
         # Create empty canvas
         self.canvas = None
         # Create empty photoimage for reuse
         self.photoimage = None
+        # Latest image to display, handed over from the OCR threads
+        self.slot = framehandoff.LatestFrameSlot()
         # Save current window state (shown or hidden?)
         self.shown = False
         # Allow to be resizable
@@ -587,46 +858,59 @@ class OCRPreviewer(threading.Thread):
         # hide root dialog
         root.overrideredirect(1)
         root.withdraw()
-        # Launch the window
-        # self.root.mainloop()  # unnecessary when there is already another Tk() root, which here is the TranslationBox!
 
-    def preview(self, image_path):
-        """Load an image and display in the window, delete any previous image in the canvas, and resize the window to the image size"""
-        # Open image using Pillow
-        pilImage = Image.open(image_path)
-        # Get screen size
+    def submit(self, pilImage):
+        """Submit a new image to display, can be called from any thread. Only the latest image is kept if the GUI thread is busy."""
+        if self.slot.put(pilImage):
+            # The slot was empty, so no refresh is pending yet
+            self.gui.call(self.refresh)
+
+    def refresh(self):
+        """Display the latest submitted image, in the GUI thread"""
+        pilImage = self.slot.take()
+        if pilImage is None:
+            return
         w, h = pilImage.size
-        # Set canvas to be fullscreen
+        if self.photoimage is not None and (self.photoimage.width(), self.photoimage.height()) == (w, h):
+            # Same size: update the existing image in place, the canvas displays it directly
+            self.photoimage.paste(pilImage)
+            return
+        # Resize the window to the image size
         self.root.geometry("%dx%d+0+0" % (w, h))
         # Initialize/reset canvas
         if self.canvas is not None:
             # Clear and reuse canvas if previously created
             canvas = self.canvas
             canvas.delete('all')
+            canvas.configure(width=w, height=h)
         else:
             # Else create it
             canvas = tkinter.Canvas(self.root,width=w,height=h)  # could alternatively use a Label? https://www.tutorialspoint.com/how-can-i-display-an-image-using-pillow-in-tkinter
             self.canvas = canvas
-        # Prepare the canvas to load the screenshot image supplied as argument in pilImage
-        canvas.pack()
-        canvas.configure(background='black')
-        if self.photoimage is not None:
-            del self.photoimage
-        image = ImageTk.PhotoImage(pilImage)
-        self.photoimage = image
-        #else:
-        #    image = self.photoimage.paste(pilImage)
-        imagesprite = canvas.create_image(w/2,h/2,image=image)
+            # Prepare the canvas to load the screenshot image supplied as argument in pilImage
+            canvas.pack()
+            canvas.configure(background='black')
+        self.photoimage = ImageTk.PhotoImage(pilImage, master=self.root)
+        canvas.create_image(w/2,h/2,image=self.photoimage)
+
+    def preview(self, image_path):
+        """Load an image from a file and display it in the window"""
+        pilImage = Image.open(image_path)
+        pilImage.load()
+        self.submit(pilImage)
 
+    @gui_thread
     def show(self):
         # Show dialog if it was closed/hidden
         self.root.deiconify()  # opposite of .withdraw()
         self.shown = True
 
+    @gui_thread
     def hide(self):
         self.root.withdraw()
         self.shown = False
 
+    @gui_thread
     def switch_visibility(self):
         """Display window is currently hidden, and inversely"""
         if self.shown:
@@ -634,6 +918,7 @@ class OCRPreviewer(threading.Thread):
         else:
             self.show()
 
+    @gui_thread
     def destroy(self):
         self.root.destroy()
 
@@ -656,42 +941,93 @@ def main():
     # Load up the config file in memory
     config = read_config(configFileArg, default_path='config.ini')
     config_internal = read_config(configFileIntArg, default_path='config_internal.ini')
-
-    # Load config file into memory variables
-    PATH_tesseract_bin = config['USER']['PATH_tesseract_bin']
-    if not os.path.exists(PATH_tesseract_bin):
-        show_errorbox_exception("Can't find Tesseract v5 binaries, please update the config.ini file to point to the binaries! If it's not installed, on Windows installers are provided by UB Mannheim's at: https://github.com/UB-Mannheim/tesseract/wiki")
-    # Add Tesseract binary to the path (so that the user does not need to do it in their OS)
-    pytesseract.pytesseract.tesseract_cmd = PATH_tesseract_bin
-    # Get the list of available languages (selected by user at Tesseract install)
-    teslangs = [os.path.split(x)[1].split('.')[0] for x in glob.glob(os.path.join(os.path.dirname(PATH_tesseract_bin), 'tessdata','*.traineddata'))]
-    print('Languages available for OCR: %s' % repr(teslangs))
+    # Serve the config files through services that re-parse them only when they are modified, so that the user can still change parameters on-the-fly without any I/O at each hotkey
+    config_service = configservice.ConfigService(config.fullpath)
+    config_internal_service = configservice.InternalConfigService(config_internal.fullpath)
+    config = config_service.get()
+
+    # Use the daemon if one is set and reachable, the OCR engine and the translators are then not loaded in this process
+    client = core.get_daemon_client(config)
+    if client is not None:
+        # Still set the Tesseract binary, to OCR locally if the daemon becomes unavailable
+        pytesseract.pytesseract.tesseract_cmd = config['USER']['PATH_tesseract_bin']
+        try:
+            health = client.health()
+            print('Using the pyugt daemon at %s (OCR: %s, translator: %s).' % (client.url, health['ocr_engine'], health['translator']))
+        except daemon.DaemonError as exc:
+            print('WARNING: %s, the captures will be processed locally while it is unavailable.' % exc)
+            client = None
+    if client is None:
+        # Load config file into memory variables
+        PATH_tesseract_bin = config['USER']['PATH_tesseract_bin']
+        if not os.path.exists(PATH_tesseract_bin):
+            show_errorbox_exception("Can't find Tesseract v5 binaries, please update the config.ini file to point to the binaries! If it's not installed, on Windows installers are provided by UB Mannheim's at: https://github.com/UB-Mannheim/tesseract/wiki")
+        # Add Tesseract binary to the path (so that the user does not need to do it in their OS)
+        pytesseract.pytesseract.tesseract_cmd = PATH_tesseract_bin
+        # Get the list of available languages (selected by user at Tesseract install)
+        teslangs = [os.path.split(x)[1].split('.')[0] for x in glob.glob(os.path.join(os.path.dirname(PATH_tesseract_bin), 'tessdata','*.traineddata'))]
+        print('Languages available for OCR: %s' % repr(teslangs))
+        # Warm up the in-process OCR engine in the background, so that the first capture does not pay the cost of loading the language model
+        ocr_engine = config['USER'].get('ocr_engine', 'auto')
+        if ocr_engine != 'pytesseract' and ocrengine.tesserocr_available():
+            print('Using the in-process Tesseract engine (tesserocr) for OCR.')
+            threading.Thread(target=ocrengine.get_engine, args=(config['USER']['lang_source_ocr'], ocrengine.DEFAULT_PSM, ocrengine.tessdata_from_bin(PATH_tesseract_bin)), daemon=True).start()
+        else:
+            print('Using pytesseract for OCR (install tesserocr for faster OCR).')
 
     # Load up the screenshot capture module
-    # We need to load up mss only once, else if it's inside the functions it will fail on second call after being closed in the first call
-    # It's also faster to initialize it only once, per https://python-mss.readthedocs.io/examples.html#benchmark
-    sct = mss.mss()
-
-    # Initialize GUI windows
-    RegionSelector = showPILandSelect()
-    TBox = TranslationBox(config, config_internal)
-    OPreviewer = OCRPreviewer()
+    # The grabber lazily creates one mss instance per thread and then reuses it, as mss is not thread-safe and it's faster to initialize it only once, per https://python-mss.readthedocs.io/examples.html#benchmark
+    sct = capture.ScreenGrabber()
+
+    # Initialize GUI windows, all owned by the main thread which runs the GUI loop
+    gui = GUIDispatcher()
+    RegionSelector = showPILandSelect(gui)
+    TBox = TranslationBox(gui, config_service, config_internal_service)
+    OPreviewer = OCRPreviewer(gui)
     TBox.previewer = OPreviewer  # attach the OCR Previewer to the translation box, so that we can call the previewer when translating
+    TBox.autotuner = autotune.AutoTuner(config_internal_service)  # attach the preprocessing auto-tuner, used if preprocessing_autotune is enabled
+    if config['USER'].get('pipeline', 'True') == 'True':
+        # Attach the processing pipeline to the translation box, so that the OCR and translation are done in background workers instead of the hotkey thread
+        TBox.pipeline = pipeline.TranslationPipeline(ocrStage, translateStage, deliverStage,
+                                                     ocr_workers=int(config['USER'].get('pipeline_ocr_workers', '2')),
+                                                     translate_workers=int(config['USER'].get('pipeline_translate_workers', '2')),
+                                                     queue_size=int(config['USER'].get('pipeline_queue_size', '2')),
+                                                     max_age=float(config['USER'].get('pipeline_max_age', '10')),
+                                                     supersede=config['USER'].get('pipeline_supersede', 'True') == 'True')
+
+    # Serve the latency metrics on a localhost endpoint, if enabled
+    metrics_port = int(config['USER'].get('metrics_port', '0'))
+    if metrics_port > 0:
+        metrics.serve(metrics_port)
+        print('Metrics available at http://127.0.0.1:%i/metrics' % metrics_port)
 
     # Set global hotkeys, loading from config file
-    keyboard.add_hotkey(config['USER']['hotkey_set_region_capture'], selectRegion, args=(sct, RegionSelector, config, config_internal))  # Do NOT set suppress=True, else this may raise exceptions!
+    # The selection and capture hotkeys are run one at a time by a dedicated thread, and the presses of a hotkey made while the previous ones are still waiting are coalesced, so that mashing or holding a hotkey only processes the latest press
+    hotkeys = scheduler.CoalescingRunner()
+    keyboard.add_hotkey(config['USER']['hotkey_set_region_capture'], hotkeys.wrap(selectRegion, sct, RegionSelector, config_service, config_internal_service))  # Do NOT set suppress=True, else this may raise exceptions!
     print('Hit %s to set the region to capture.' % config['USER']['hotkey_set_region_capture'])
-    keyboard.add_hotkey(config['USER']['hotkey_translate_region_capture'], translateRegion, args=(sct, TBox, config, config_internal))
+    keyboard.add_hotkey(config['USER']['hotkey_translate_region_capture'], hotkeys.wrap(translateRegion, sct, TBox, config_service, config_internal_service))
     print('Hit %s to translate the region (make sure to close the translation window before requesting another one).' % config['USER']['hotkey_translate_region_capture'])
-    keyboard.add_hotkey(config['USER']['hotkey_set_and_translate_region_capture'], selectAndTranslateRegion, args=(sct, RegionSelector, TBox, config, config_internal))
+    keyboard.add_hotkey(config['USER']['hotkey_set_and_translate_region_capture'], hotkeys.wrap(selectAndTranslateRegion, sct, RegionSelector, TBox, config_service, config_internal_service))
     print('Hit %s to set AND translate a region.' % config['USER']['hotkey_set_and_translate_region_capture'])
     keyboard.add_hotkey(config['USER']['hotkey_show_ocr_preview'], OPreviewer.switch_visibility)
     print('Hit %s to show/hide OCR preview.' % config['USER']['hotkey_show_ocr_preview'])
-
-    # Main waiting loop (we wait for hotkeys to be pressed)
+    Watcher = RegionWatcher(sct, TBox, config_service, config_internal_service)
+    hotkey_watch = config['USER'].get('hotkey_toggle_watch_mode', 'ctrl+shift+F2')
+    keyboard.add_hotkey(hotkey_watch, Watcher.toggle)
+    print('Hit %s to enable/disable the watch mode (automatically translate the region when its content changes).' % hotkey_watch)
+    hotkey_named = config['USER'].get('hotkey_set_named_regions', 'ctrl+shift+F4')
+    keyboard.add_hotkey(hotkey_named, hotkeys.wrap(selectNamedRegions, sct, RegionSelector, config_service, config_internal_service))
+    print('Hit %s to select the named regions defined in the config file (they are then all translated at once instead of the region).' % hotkey_named)
+
+    # Now that the hotkeys are ready, preload the selected translator backend in the background (and its model for offline translators), so that the first translation does not pay for the libraries import and model loading. The other backends are never imported.
+    if client is None and config['USER']['ocr_only'] != 'True' and config['USER'].get('translator_preload', 'True') == 'True':
+        threading.Thread(target=core.TRANSLATOR_ROUTER.preload, args=(config['USER'],), daemon=True).start()
+
+    # Main loop: run the GUI in the main thread, while hotkeys are processed in their own threads and submit GUI work through the dispatcher
     print('Press CTRL+C or close this window to quit.')
-    while 1:
-        time.sleep(1)
+    signal.signal(signal.SIGINT, gui.stop)
+    gui.mainloop()
 
     # Exit gracefully if no exception until this point
     return 0
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Named capture regions: several regions of the screen (eg, the dialogue box, the speaker name plate and a menu) can be defined, each with its own profile of parameters, in sections [REGION name] of the config file that override the USER section (eg, lang_source_ocr, preprocessing_*). Their coordinates are stored in the REGIONS section of the internal config file. All the regions are captured in a single screen grab, then OCR'ed in parallel and translated together.
+
+
+### Imports
+
+## Native python imports
+# To parse the coordinates of the regions
+import ast
+import re
+
+## Local modules
+try:
+    from . import configservice  # to overlay the region profiles over the USER section
+except ImportError:
+    import configservice
+
+### Profiles
+
+# Prefix of the config file sections defining the named regions
+SECTION_PREFIX = 'REGION '
+
+def region_names(config):
+    """Names of the regions defined in the config file, in order of definition"""
+    return [section[len(SECTION_PREFIX):].strip() for section in config if section.upper().startswith(SECTION_PREFIX)]
+
+class RegionConfig(configservice.OverlayConfig):
+    """View of a config snapshot where the USER section is overlaid with the parameters of a region profile, so that it can be used anywhere a config is expected"""
+    def __init__(self, config, name):
+        self.name = name
+        section = next(section for section in config if section.upper().startswith(SECTION_PREFIX) and section[len(SECTION_PREFIX):].strip() == name)
+        configservice.OverlayConfig.__init__(self, config, config[section])
+
+def region_config(config, name):
+    """Get the config of a named region"""
+    return RegionConfig(config, name)
+
+### Coordinates
+
+def get_regions(config, config_internal):
+    """Get the named regions defined in the config file that have coordinates in the internal config file. Returns a list of (name, (x0, y0, x1, y1)) in order of definition."""
+    if 'REGIONS' not in config_internal:
+        return []
+    regions = []
+    for name in region_names(config):
+        value = config_internal['REGIONS'].get(name)
+        if not value:
+            continue
+        try:
+            coords = tuple(ast.literal_eval(value))
+        except (ValueError, SyntaxError):
+            continue
+        if len(coords) == 4:
+            regions.append((name, coords))
+    return regions
+
+def crop_regions(img, origin, regions):
+    """Crop the named regions from a screenshot of their union whose top left corner is at origin. Returns a list of (name, coordinates, image)."""
+    x0, y0 = origin
+    return [(name, coords, img.crop((coords[0] - x0, coords[1] - y0, coords[2] - x0, coords[3] - y0))) for name, coords in regions]
+
+### Display
+
+_re_header = re.compile(r'^\[([^\[\]\n]+)\]$', re.MULTILINE)
+
+def format_sections(sections):
+    """Format the texts of several regions for display, each under a [name] header line"""
+    return '\n\n'.join('[%s]\n%s' % (name, text) for name, text in sections)
+
+def parse_sections(text):
+    """Split a text formatted by format_sections() into a list of (name, text), or None if it has no region header (eg, if the user edited them out)"""
+    headers = list(_re_header.finditer(text))
+    if not headers or text[:headers[0].start()].strip():
+        return None
+    sections = []
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        sections.append((header.group(1), text[header.end():end].strip('\n')))
+    return sections
+
+### Captures
+
+class RegionPart(object):
+    """A named region of a capture going through the pipeline, with its own config profile. The stages fill its ocrtext, blocks and transtext."""
+    def __init__(self, name, region, img, config):
+        self.name = name
+        self.region = region
+        self.img = img
+        self.config = config
+        self.ocrtext = ''
+        self.blocks = None
+        self.transtext = ''
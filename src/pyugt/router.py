@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Translator backends router: a translation is sent to the primary backend (translator_lib) and, if it did not answer within a latency budget or failed, hedged to the fallback backends (translator_lib_fallback, eg offline_argos), the first answer wins. Each backend has a circuit breaker, so that a throttled or failing service is skipped for a while instead of being waited for at each capture.
+
+
+### Imports
+
+## Native python imports
+# To parse the list of fallback backends
+import ast
+# To run the backends concurrently
+import concurrent.futures
+# To protect the circuit breakers
+import threading
+import time
+
+## Local modules
+try:
+    from . import backends
+    from . import metrics
+except ImportError:
+    import backends
+    import metrics
+
+### Circuit breakers
+
+class CircuitBreaker(object):
+    """Circuit breaker of a backend: after `failures` consecutive failures, the circuit opens and the backend is skipped for `reset_timeout` seconds, then a single trial request is let through (half-open): if it succeeds the circuit closes again, else it reopens"""
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failures=3, reset_timeout=30.0):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+
+    def allow(self):
+        """Can a request be sent to the backend?"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let a single trial request through
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        """Record a failure, returns True if the circuit just opened"""
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failures:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+### Router
+
+class AllBackendsFailed(Exception):
+    pass
+
+def parse_backends(value):
+    """Parse a list of backends from the config file, either a python list or a comma separated list, None for an empty list"""
+    if not value or value == 'None':
+        return []
+    if value.startswith('['):
+        return list(ast.literal_eval(value))
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+class BackendCall(object):
+    """A request to a backend, running in its own thread"""
+    def __init__(self, name, breaker):
+        self.name = name
+        self.breaker = breaker
+        self.future = concurrent.futures.Future()
+        # Set when the router stopped waiting for this request at the translator_timeout deadline: it was counted as a failure, so its late outcome must not count again
+        self.timed_out = False
+
+class BackendRouter(object):
+    """Route translations to the primary backend, hedging to the fallback backends after a latency budget, and skipping the backends whose circuit is open"""
+    def __init__(self, max_inflight=4):
+        # Each request to a backend runs in its own thread, so that a slow backend never blocks the caller beyond the latency budget, and the hung requests never hold up the requests to the other backends (an abandoned request still completes in the background, and its outcome updates the circuit breaker). The backends are also given a network timeout.
+        # At most max_inflight requests to the same backend can be running at the same time: a backend with that many requests still hanging is skipped like a backend whose circuit is open, so that the hung requests do not pile up.
+        self.max_inflight = max_inflight
+        self.inflight = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get_breaker(self, name, config):
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            with self.lock:
+                breaker = self.breakers.setdefault(name, CircuitBreaker(failures=int(config.get('translator_breaker_failures', '3')), reset_timeout=float(config.get('translator_breaker_reset', '30'))))
+        return breaker
+
+    def chain(self, config):
+        """Backends to try, in order of preference, without duplicates"""
+        names = []
+        for name in [config['translator_lib']] + parse_backends(config.get('translator_lib_fallback', 'None')):
+            if name not in names:
+                names.append(name)
+        return names
+
+    def available(self, name):
+        """Can a new request be sent to this backend, or does it have too many requests still hanging?"""
+        with self.lock:
+            return self.inflight.get(name, 0) < self.max_inflight
+
+    def _start(self, call, method, payload, langsource, langtarget, config):
+        """Send a request to a backend in a new thread"""
+        with self.lock:
+            self.inflight[call.name] = self.inflight.get(call.name, 0) + 1
+        thread = threading.Thread(target=self._call, args=(call, method, payload, langsource, langtarget, config), name='pyugt-backend-%s' % call.name)
+        thread.daemon = True  # always close thread along with parent process
+        thread.start()
+
+    def _call(self, call, method, payload, langsource, langtarget, config):
+        try:
+            result = getattr(backends.get_backend(call.name), method)(payload, langsource, langtarget, config)
+        except Exception as exc:
+            metrics.inc('pyugt_translation_errors_total', backend=call.name)
+            if not call.timed_out:
+                self._record_failure(call)
+            call.future.set_exception(exc)
+        else:
+            if not call.timed_out:
+                call.breaker.record_success()
+            call.future.set_result(result)
+        finally:
+            with self.lock:
+                self.inflight[call.name] -= 1
+
+    def _record_failure(self, call):
+        if call.breaker.record_failure():
+            print('WARNING: translator %s is failing, throttled or not answering, it will be skipped for %g seconds.' % (call.name, call.breaker.reset_timeout))
+            metrics.inc('pyugt_circuit_opened_total', backend=call.name)
+
+    def translate(self, config, text, langsource, langtarget):
+        """Translate a text, config is the USER section of the config file. Returns (translation, name of the backend that answered). Raises AllBackendsFailed if no backend could translate within translator_timeout seconds."""
+        return self._route(config, 'translate', text, langsource, langtarget)
+
+    def translate_batch(self, config, texts, langsource, langtarget):
+        """Translate a list of texts (eg, the sentences of a capture) with the same routing, hedging and circuit breakers as translate(). Returns (list of translations, name of the backend that answered)."""
+        return self._route(config, 'translate_batch', texts, langsource, langtarget)
+
+    def batched(self, config):
+        """Can the primary backend translate batches of sentences faster than one by one?"""
+        try:
+            return backends.get_backend(config['translator_lib']).batched
+        except Exception:
+            return False
+
+    def _route(self, config, method, payload, langsource, langtarget):
+        """Send the payload to the backend method of the chain of backends, see translate()"""
+        hedge_delay = float(config.get('translator_hedge_delay', '2'))
+        timeout = float(config.get('translator_timeout', '10'))
+        deadline = time.monotonic() + timeout
+        candidates = [(name, self.get_breaker(name, config)) for name in self.chain(config)]
+        allowed = [(name, breaker) for name, breaker in candidates if self.available(name) and breaker.allow()]
+        if not allowed:
+            # All circuits are open: still try the primary backend rather than failing without trying
+            allowed = candidates[:1]
+        pending = {}
+        errors = []
+        next_hedge = 0.0
+        while True:
+            if allowed and (not pending or time.monotonic() >= next_hedge):
+                # Launch the next backend: first the primary, then a hedge each time the latency budget expires without an answer or when all launched backends failed
+                name, breaker = allowed.pop(0)
+                if pending or errors:
+                    metrics.inc('pyugt_translator_hedges_total', backend=name)
+                call = BackendCall(name, breaker)
+                self._start(call, method, payload, langsource, langtarget, config)
+                pending[call.future] = call
+                next_hedge = time.monotonic() + hedge_delay
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait = min(remaining, max(0, next_hedge - time.monotonic())) if allowed else remaining
+            done, _ = concurrent.futures.wait(list(pending), timeout=wait, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                call = pending.pop(future)
+                try:
+                    return future.result(), call.name
+                except Exception as exc:
+                    errors.append('%s: %r' % (call.name, exc))
+            if not pending and not allowed:
+                break
+        for call in pending.values():
+            # The backends that did not answer in time count as failing, so that a hung backend gets its circuit opened instead of being waited for at each capture
+            call.timed_out = True
+            if not call.future.done():
+                metrics.inc('pyugt_translation_timeouts_total', backend=call.name)
+                self._record_failure(call)
+            errors.append('%s: no answer after %g seconds' % (call.name, timeout))
+        raise AllBackendsFailed('All translators failed: %s' % '; '.join(errors))
+
+    def preload(self, config):
+        """Preload all the backends of the chain, to be called in a background thread"""
+        for name in self.chain(config):
+            backends.preload(dict(config, translator_lib=name))
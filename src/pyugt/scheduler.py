@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Scheduling of the hotkey requests: each request gets a generation number, so that a result is never displayed over the result of a newer request, and the requests of the hotkeys are run one at a time in a dedicated thread, the repeated presses made while a request is running being coalesced into the latest one, so that mashing a hotkey (or holding it down with key repeat) does not start a capture and an OCR for each press.
+
+
+### Imports
+
+## Native python imports
+# For the pending requests, in order of arrival
+from collections import OrderedDict
+import itertools
+# For the runner thread
+import threading
+# To gracefully print stack trace in console in case of an exception
+import traceback
+
+### Generations
+
+_generations = itertools.count(1)
+_generations_lock = threading.Lock()
+
+def next_generation():
+    """Get a new generation number, greater than all the previous ones. Requests made later always get a greater generation."""
+    with _generations_lock:
+        return next(_generations)
+
+class LatestOnly(object):
+    """Keep track of the generation of the latest result shown, to ignore the results of older requests that finish late (eg, a slow translation finishing after the translation of a newer capture). Thread-safe."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def accept(self, generation):
+        """Return True if a result of this generation can be shown (ie, no newer result was shown), and record it as the latest. A None generation is always accepted."""
+        if generation is None:
+            return True
+        with self.lock:
+            if generation < self.generation:
+                return False
+            self.generation = generation
+            return True
+
+### Runner
+
+class CoalescingRunner(object):
+    """Run requests one at a time in a dedicated thread, in order of arrival. A request made while an identical request (same key) is still waiting replaces it, so that repeated hotkey presses are coalesced into the latest one instead of piling up.
+    The callers (eg, the hotkeys callbacks) never wait."""
+    def __init__(self, name='pyugt-hotkeys'):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.pending = OrderedDict()  # key -> (func, args, kwargs)
+        self.coalesced = 0  # number of requests replaced by a newer one
+        thread = threading.Thread(target=self._run, name=name)
+        thread.daemon = True  # always close thread along with parent process
+        thread.start()
+        self.thread = thread
+
+    def submit(self, func, *args, **kwargs):
+        """Request to run func(*args, **kwargs). Returns immediately."""
+        key = (func,) + args
+        with self.lock:
+            if key in self.pending:
+                # Coalesce: the newer request replaces the waiting one, and goes to the end of the queue
+                del self.pending[key]
+                self.coalesced += 1
+            self.pending[key] = (func, args, kwargs)
+            self.wakeup.notify()
+
+    def wrap(self, func, *args, **kwargs):
+        """Get a callback without arguments submitting func(*args, **kwargs), eg to use as a hotkey callback"""
+        return lambda: self.submit(func, *args, **kwargs)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.wakeup.wait()
+                key, (func, args, kwargs) = self.pending.popitem(last=False)
+            try:
+                func(*args, **kwargs)
+            except Exception as exc:
+                print('ERROR: an exception occurred while processing a hotkey:')
+                traceback.print_exc()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Sentence segmentation of the OCR'ed text, for Japanese/CJK and latin scripts, so that a capture with several independent sentences (eg, a text box with several speakers) can be translated as a batch of sentences, and each sentence cached independently.
+
+
+### Imports
+
+## Native python imports
+import re
+
+### Segmentation
+
+# End of a sentence: CJK terminators (no space follows them), or latin terminators followed by a space or the end of the text (so that decimal numbers and abbreviations without spaces are not split), with the closing quotes and brackets that follow them. A paragraph break (blank line) also ends a sentence.
+_re_boundary = re.compile(r'(?:[。！？｡…]+|[.!?]+(?=[」』）)\]"”’\']*(?:\s|$)))[」』）)\]"”’\']*|\n[ \t]*\n')
+_re_spaces = re.compile(r'\s*')
+# Word before a period, to detect the abbreviations
+_re_last_word = re.compile(r'[\w.]+$')
+
+# Abbreviations that never end a sentence, lowercase and without their final period
+ABBREVIATIONS = frozenset(('mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'mt', 'capt', 'lt', 'sgt', 'gen', 'vs', 'e.g', 'i.e', 'cf'))
+
+# Translator target languages written without spaces between sentences
+NO_SPACE_TARGETS = ('ja', 'zh', 'th', 'lo', 'km', 'my')
+
+def is_sentence_end(text, m):
+    """Does a latin terminator matched by _re_boundary really end a sentence? Not if it is the period of an abbreviation (eg, Mr. Smith), nor if the text goes on in lowercase (eg, "Really?" he said.)"""
+    following = _re_spaces.match(text, m.end()).end()
+    if following < len(text) and text[following].islower():
+        return False
+    if m.group()[0] == '.' and m.group()[1:2] != '.':
+        word = _re_last_word.search(text, 0, m.start())
+        if word and word.group().lower() in ABBREVIATIONS:
+            return False
+    return True
+
+def split_sentences(text):
+    """Split a text into sentences. Returns a list of (sentence, separator), the separator being the whitespace that followed the sentence, so that the text can be rebuilt exactly by joining them."""
+    segments = []
+    pos = 0
+    for m in _re_boundary.finditer(text):
+        if m.start() < pos:
+            # Inside the separator of the previous sentence
+            continue
+        if m.group()[0] in '.!?' and not is_sentence_end(text, m):
+            continue
+        # A paragraph break is part of the separator, a terminator is part of the sentence
+        end = m.start() if m.group().startswith('\n') else m.end()
+        sep_end = _re_spaces.match(text, end).end()
+        segments.append((text[pos:end], text[end:sep_end]))
+        pos = sep_end
+    if pos < len(text):
+        rest = text[pos:]
+        sentence = rest.rstrip()
+        segments.append((sentence, rest[len(sentence):]))
+    return segments
+
+def join_sentences(segments, translations, langtarget):
+    """Rebuild a text from the translations of its sentences and their separators. Sentences that were not separated by any whitespace in the source (eg, Japanese) are separated by a space if the target language uses spaces."""
+    space = '' if langtarget.lower().replace('_', '-').split('-')[0] in NO_SPACE_TARGETS else ' '
+    parts = []
+    for i, ((sentence, separator), translation) in enumerate(zip(segments, translations)):
+        parts.append(translation)
+        if not separator and i < len(segments) - 1 and translation:
+            separator = space
+        parts.append(separator)
+    return ''.join(parts)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Structured OCR results: the word-level output of Tesseract (TSV, as returned by image_to_data) is grouped into text blocks with their bounding box and confidence, so that each block can be translated separately and only the blocks that changed since the previous capture are sent to the translator.
+
+
+### Imports
+
+## Native python imports
+# To protect the memo of the previous capture between the translation workers
+import threading
+
+### Configuration
+
+# Tesseract languages written without spaces between words, for which the words must be joined without a separator
+NO_SPACE_LANGS = ('jpn', 'jpn_vert', 'chi_sim', 'chi_sim_vert', 'chi_tra', 'chi_tra_vert', 'tha', 'lao', 'khm', 'mya')
+
+# Tesseract level of the rows that contain a recognized word (1 page, 2 block, 3 paragraph, 4 line, 5 word)
+LEVEL_WORD = 5
+
+def word_separator(lang):
+    """Separator to join the words of a line, according to the Tesseract language(s) (eg, 'jpn+eng' uses the separator of the first language)"""
+    return '' if lang.split('+')[0] in NO_SPACE_LANGS else ' '
+
+### Parsing
+
+def parse_tsv(tsv):
+    """Parse the TSV output of Tesseract into a list of words, each a dict with the integer columns (block_num, par_num, line_num, word_num, left, top, width, height), the confidence (float, 0-100) and the text. Empty words are skipped."""
+    words = []
+    for row in tsv.splitlines():
+        fields = row.split('\t')
+        # Skip the header line (as returned by pytesseract) and malformed lines
+        if len(fields) < 11 or not fields[0].isdigit():
+            continue
+        if int(fields[0]) != LEVEL_WORD:
+            continue
+        text = fields[11] if len(fields) > 11 else ''
+        if not text.strip():
+            continue
+        words.append({
+            'block_num': int(fields[2]),
+            'par_num': int(fields[3]),
+            'line_num': int(fields[4]),
+            'word_num': int(fields[5]),
+            'left': int(fields[6]),
+            'top': int(fields[7]),
+            'width': int(fields[8]),
+            'height': int(fields[9]),
+            'conf': float(fields[10]),
+            'text': text,
+            })
+    return words
+
+### Blocks
+
+class TextBlock(object):
+    """A block of text found by OCR, with its bounding box (left, top, right, bottom) in the coordinates of the captured region and the mean confidence of its words (0-100)"""
+    def __init__(self, text, bbox, conf):
+        self.text = text
+        self.bbox = bbox
+        self.conf = conf
+        self.transtext = None
+
+    def __repr__(self):
+        return 'TextBlock(%r, bbox=%r, conf=%.1f)' % (self.text, self.bbox, self.conf)
+
+def _group_lines(words):
+    """Group words into blocks of lines, in reading order. Returns a list of dicts with the lines (lists of words texts) and the words of each block."""
+    blocks = []
+    # Tesseract already outputs the words in reading order, so we only need to split when the block/line numbers change
+    current = None
+    for word in words:
+        if current is None or word['block_num'] != current['block_num']:
+            current = {'block_num': word['block_num'], 'lines': [], 'line': None, 'words': []}
+            blocks.append(current)
+        line = (word['par_num'], word['line_num'])
+        if line != current['line']:
+            current['lines'].append([])
+            current['line'] = line
+        current['lines'][-1].append(word['text'])
+        current['words'].append(word)
+    return blocks
+
+def group_words(words, separator=' ', scale=1, offset=(0, 0)):
+    """Group words into blocks, in reading order. The lines of a block are separated by line returns. The bounding boxes are divided by scale and shifted by offset, to map them back to the captured region if the image was upscaled or cropped before OCR."""
+    result = []
+    for block in _group_lines(words):
+        text = '\n'.join(separator.join(line) for line in block['lines'])
+        left = min(w['left'] for w in block['words'])
+        top = min(w['top'] for w in block['words'])
+        right = max(w['left'] + w['width'] for w in block['words'])
+        bottom = max(w['top'] + w['height'] for w in block['words'])
+        confs = [w['conf'] for w in block['words'] if w['conf'] >= 0]
+        conf = sum(confs) / len(confs) if confs else 0.0
+        result.append(TextBlock(text, (left // scale + offset[0], top // scale + offset[1], right // scale + offset[0], bottom // scale + offset[1]), conf))
+    return result
+
+def blocks_from_tsv(tsv, lang, scale=1, offset=(0, 0)):
+    """Parse the TSV output of Tesseract directly into text blocks"""
+    return group_words(parse_tsv(tsv), separator=word_separator(lang), scale=scale, offset=offset)
+
+def tsv_text(tsv, lang):
+    """Full text of the TSV output of Tesseract, with the same layout as blocks_text() but without computing the blocks positions (eg, when the words are only needed for their confidences)"""
+    separator = word_separator(lang)
+    return '\n\n'.join('\n'.join(separator.join(line) for line in block['lines']) for block in _group_lines(parse_tsv(tsv)))
+
+def blocks_text(blocks):
+    """Full text of a list of blocks, separated by blank lines like the plain text output of Tesseract"""
+    return '\n\n'.join(block.text for block in blocks)
+
+### Incremental translation
+
+class IncrementalTranslator(object):
+    """Translate text blocks one by one, reusing the translations of the blocks that are identical to the ones of the previous capture, so that in a scrolling dialogue log or a menu where a single line changed, only this line is sent to the translator.
+    translate is a callable taking a text and returning its translation."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.previous = {}
+
+    def translate(self, blocks, translate, key=None):
+        """Translate a list of blocks in place (sets block.transtext) and return the number of blocks that were sent to the translator. key identifies the translation settings (eg, languages and backend), the memo is reset when it changes."""
+        with self.lock:
+            previous = self.previous if self.previous.get(None) == key else {}
+        current = {None: key}
+        sent = 0
+        for block in blocks:
+            transtext = previous.get(block.text)
+            if transtext is None:
+                transtext = current.get(block.text)
+            if transtext is None:
+                transtext = translate(block.text)
+                sent += 1
+            block.transtext = transtext
+            # Do not memorize errors, so that they are retried at the next capture
+            if transtext != 'ERROR':
+                current[block.text] = transtext
+        with self.lock:
+            self.previous = current
+        return sent
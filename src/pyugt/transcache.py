@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Two-tier translation cache: a bounded in-memory LRU in front of a persistent SQLite store, so that the dialogues, menus and system messages that games repeat constantly are translated only once, even across restarts.
+
+
+### Imports
+
+## Native python imports
+# For the in-memory LRU
+from collections import OrderedDict
+# For the path of the on-disk store
+import os
+# For the on-disk store
+import sqlite3
+# To share the caches between the hotkeys threads
+import threading
+# To timestamp entries for the on-disk eviction
+import time
+# To normalize the text used as a key
+import re
+import unicodedata
+
+### Helpers
+
+_re_spaces = re.compile(r'\s+')
+
+def normalize_text(text):
+    """Normalize a text to be used as a cache key: unicode NFKC normalization (eg, fullwidth latin characters are converted to ascii ones, as OCR is inconsistent with them), collapse consecutive whitespaces and strip"""
+    return _re_spaces.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+### Caches
+
+class LRUCache(object):
+    """Bounded in-memory Least Recently Used cache, thread-safe"""
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                return None
+            return self.data[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+class SQLiteCache(object):
+    """Persistent on-disk cache stored in a SQLite database, with size-based eviction of the least recently used entries.
+    The access times of the hits are kept in memory and written in batches (every flush_hits hits, at each insertion and on close), so that a hit does not cost a write transaction.
+    Once closed, the cache misses and does not store anything anymore instead of raising, so that it can be closed while other threads still use it (eg, when the cache is replaced after the config file changed)."""
+    def __init__(self, path, max_bytes=64*1024*1024, flush_hits=64):
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.flush_hits = flush_hits
+        self.lock = threading.Lock()
+        # Access times of the hits not yet written to the database, key -> atime
+        self.pending_atimes = {}
+        # A single connection shared by all threads, serialized by our own lock (SQLite connections are not thread-safe by default)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, translation TEXT NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS translations_atime ON translations (atime)')
+        self.conn.commit()
+        # Keep a running total of the stored size, to avoid a full scan at each insertion
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM translations').fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            if self.conn is None:
+                return None
+            row = self.conn.execute('SELECT translation FROM translations WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            # Update the access time, so that frequently used translations are not evicted, but only write them to the database in batches
+            self.pending_atimes[key] = time.time()
+            if len(self.pending_atimes) >= self.flush_hits:
+                self._flush_atimes()
+                self.conn.commit()
+            return row[0]
+
+    def _flush_atimes(self):
+        """Write the pending access times to the database, without committing. Must be called with the lock held."""
+        if self.pending_atimes:
+            self.conn.executemany('UPDATE translations SET atime = ? WHERE key = ?', [(atime, key) for key, atime in self.pending_atimes.items()])
+            self.pending_atimes.clear()
+
+    def put(self, key, value):
+        size = len(key.encode('utf-8')) + len(value.encode('utf-8'))
+        with self.lock:
+            if self.conn is None:
+                return
+            # Before the eviction, so that it sees the latest access times
+            self._flush_atimes()
+            row = self.conn.execute('SELECT size FROM translations WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self.total_bytes -= row[0]
+            self.conn.execute('INSERT OR REPLACE INTO translations (key, translation, size, atime) VALUES (?, ?, ?, ?)', (key, value, size, time.time()))
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Delete the least recently used entries until we are back under 90% of the maximum size (so that we don't evict at every insertion). Must be called with the lock held."""
+        target = int(self.max_bytes * 0.9)
+        cursor = self.conn.execute('SELECT key, size FROM translations ORDER BY atime ASC')
+        to_delete = []
+        for key, size in cursor:
+            if self.total_bytes <= target:
+                break
+            to_delete.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany('DELETE FROM translations WHERE key = ?', to_delete)
+
+    def clear(self):
+        with self.lock:
+            self.pending_atimes.clear()
+            if self.conn is None:
+                return
+            self.conn.execute('DELETE FROM translations')
+            self.conn.commit()
+            self.total_bytes = 0
+
+    def close(self):
+        with self.lock:
+            if self.conn is None:
+                return
+            self._flush_atimes()
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+class TranslationCache(object):
+    """Two-tier translation cache: in-memory LRU first (microseconds), then the persistent SQLite store (survives restarts).
+    Entries are keyed on the normalized text, the source and target languages and the translator backend."""
+    def __init__(self, maxsize=1024, path=None, max_bytes=64*1024*1024):
+        self.memory = LRUCache(maxsize)
+        self.disk = SQLiteCache(path, max_bytes=max_bytes) if path else None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text, langsource, langtarget, backend):
+        # Use a separator that cannot appear in language codes nor in the backend name
+        return '\x1f'.join((backend, langsource, langtarget, normalize_text(text)))
+
+    def get(self, text, langsource, langtarget, backend):
+        key = self.make_key(text, langsource, langtarget, backend)
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                # Promote to the in-memory tier
+                self.memory.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, text, langsource, langtarget, backend, translation):
+        key = self.make_key(text, langsource, langtarget, backend)
+        self.memory.put(key, translation)
+        if self.disk is not None:
+            self.disk.put(key, translation)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Fuzzy translation memory: the same dialogue line often comes back from the OCR with one or two wrong characters, which misses the exact translation cache. The past OCR'ed texts are indexed by character n-grams, so that a near-duplicate of a text that was already translated is found in a fraction of a millisecond, even with hundreds of thousands of stored texts, and its translation is reused instead of calling the translator again.
+# The memory can be seeded from the logs of the previous sessions (log_ocr and log_translation text logs, and the log_store structured log).
+
+
+### Imports
+
+## Native python imports
+# For the compact posting lists of the index
+from array import array
+# To count the n-grams shared with the candidates
+from collections import Counter
+import itertools
+# To read the text logs
+import codecs
+# To score the candidates
+import difflib
+import os
+import re
+# To share the memory between threads and seed it in the background
+import threading
+# To gracefully print stack trace in console in case of an exception
+import traceback
+
+## Local modules
+try:
+    from . import logstore
+    from .transcache import normalize_text
+except ImportError:
+    import logstore
+    from transcache import normalize_text
+
+### Helpers
+
+_re_digits = re.compile(r'\d+')
+
+def ngrams(text, n=4):
+    """Set of the character n-grams of a text, padded so that short texts and the start and end of texts also have n-grams"""
+    text = '\x02' + text + '\x03'
+    return set(text[i:i+n] for i in range(max(1, len(text) - n + 1)))
+
+def similarity(a, b):
+    """Similarity between two texts, from 0 to 1 (1 for identical texts)"""
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+### Memory
+
+class TranslationMemory(object):
+    """In-memory translation memory with fuzzy lookup, thread-safe.
+    Each stored text gets an identifier, and an inverted index maps each character n-gram to the identifiers of the texts containing it. A lookup only scans the posting lists of the rarest n-grams of the query: a text within the similarity threshold differs by a few edits, each edit can only change n n-grams, so it must share at least one of these rarest n-grams with the query (prefix filtering). The few candidates found are then verified with an exact similarity.
+    4-grams are used by default: they are rarer than trigrams in languages with a small alphabet, so the posting lists to scan are much shorter."""
+    def __init__(self, n=4, min_length=8, max_candidates=50):
+        self.n = n
+        # Texts shorter than this are never fuzzy matched, short texts (eg, menus) are too different with a single wrong character
+        self.min_length = min_length
+        # Maximum number of candidates to verify per lookup
+        self.max_candidates = max_candidates
+        # Number of edits of the quick first search
+        self.quick_edits = 2
+        self.lock = threading.Lock()
+        self.texts = []  # id -> normalized text
+        self.translations = []  # id -> translation
+        self.pairs = []  # id -> (langsource, langtarget)
+        self.ids = {}  # (langsource, langtarget, normalized text) -> id, for exact duplicates
+        self.index = {}  # n-gram -> array of ids
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, text, langsource, langtarget, translation):
+        """Store the translation of a text, replacing the previous translation of the same text"""
+        text = normalize_text(text)
+        if not text or not translation:
+            return
+        key = (langsource, langtarget, text)
+        with self.lock:
+            sid = self.ids.get(key)
+            if sid is not None:
+                self.translations[sid] = translation
+                return
+            sid = len(self.texts)
+            self.texts.append(text)
+            self.translations.append(translation)
+            self.pairs.append((langsource, langtarget))
+            self.ids[key] = sid
+            for gram in ngrams(text, self.n):
+                postings = self.index.get(gram)
+                if postings is None:
+                    postings = self.index[gram] = array('I')
+                postings.append(sid)
+
+    def lookup(self, text, langsource, langtarget, threshold=0.9):
+        """Find the translation of the most similar stored text. Returns (translation, similarity, stored text), or None if no stored text is at least threshold similar.
+        Texts with different numbers never match, as games often repeat the same line with a different amount (eg, of gold or damage)."""
+        text = normalize_text(text)
+        if len(text) < self.min_length:
+            return None
+        with self.lock:
+            # Exact match
+            sid = self.ids.get((langsource, langtarget, text))
+        if sid is not None:
+            self.hits += 1
+            return self.translations[sid], 1.0, text
+        grams = ngrams(text, self.n)
+        # Maximum number of edits within the threshold
+        edits = int((1.0 - threshold) * len(text)) + 1
+        # First only look for the texts within a few edits (a few wrong characters, the most common OCR noise), which only needs the postings of a few very rare n-grams, then for all the texts within the threshold if none was found
+        best = None
+        for max_edits in sorted(set((min(edits, self.quick_edits), edits))):
+            best = self._search(text, grams, langsource, langtarget, threshold, max_edits)
+            if best is not None:
+                break
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    def _search(self, text, grams, langsource, langtarget, threshold, edits):
+        """Find the most similar text within the given number of edits. Each edit changes at most n n-grams, so such a text must share at least one of the (n * edits + 1) rarest n-grams of the query (prefix filtering)."""
+        pair = (langsource, langtarget)
+        with self.lock:
+            postings = sorted((self.index[gram] for gram in grams if gram in self.index), key=len)[:self.n * edits + 1]
+            # Count the n-grams shared by each candidate (the counting is done in C by Counter), and verify the candidates sharing the most of them first
+            counts = Counter(itertools.chain.from_iterable(postings))
+            candidates = [(self.texts[sid], self.translations[sid]) for sid, count in counts.most_common(self.max_candidates) if self.pairs[sid] == pair]
+        digits = _re_digits.findall(text)
+        best = None
+        for candidate, translation in candidates:
+            # Cheap filters first: length and n-grams overlap, before the exact similarity
+            if min(len(text), len(candidate)) < threshold * max(len(text), len(candidate)):
+                continue
+            if len(grams & ngrams(candidate, self.n)) < len(grams) - self.n * edits:
+                continue
+            if _re_digits.findall(candidate) != digits:
+                continue
+            score = similarity(text, candidate)
+            if score >= threshold and (best is None or score > best[1]):
+                best = (translation, score, candidate)
+        return best
+
+    def clear(self):
+        with self.lock:
+            del self.texts[:], self.translations[:], self.pairs[:]
+            self.ids.clear()
+            self.index.clear()
+
+### Seeding
+
+def read_text_log(path):
+    """Read a text log written by log_ocr or log_translation. Returns the list of (datetime string, text) entries."""
+    entries = []
+    with codecs.open(path, 'r', 'utf-8-sig') as f:
+        content = f.read()
+    for entry in content.split('\n---------------------\n'):
+        # The logs written by the previous versions of pyugt have a BOM at the start of each entry, as each entry was appended with the utf-8-sig codec
+        header, sep, text = entry.lstrip('\ufeff').partition('\n')
+        if not sep or not header.startswith('-> ') or ' at ' not in header:
+            continue
+        entries.append((header.rsplit(' at ', 1)[1].rstrip(':'), text))
+    return entries
+
+def pair_text_logs(log_ocr, log_translation):
+    """Pair the entries of the OCR and translation text logs, which are written for the same captures with the same datetime. Returns the list of (OCR'ed text, translation)."""
+    translations = {}
+    for stamp, text in read_text_log(log_translation):
+        translations.setdefault(stamp, []).append(text)
+    pairs = []
+    for stamp, ocrtext in read_text_log(log_ocr):
+        queue = translations.get(stamp)
+        if queue:
+            pairs.append((ocrtext, queue.pop(0)))
+    return pairs
+
+def seed(memory, config):
+    """Seed a translation memory from the logs set in the config file (log_ocr with log_translation, and log_store). Returns the number of texts added."""
+    user = config['USER']
+    langsource, langtarget = user['lang_source_trans'], user['lang_target']
+    remove_line_returns = user['remove_line_returns'] == 'True'
+    count = 0
+    def add(ocrtext, transtext, src=langsource, tgt=langtarget):
+        if not ocrtext or not transtext or transtext == 'ERROR':
+            return 0
+        if remove_line_returns:
+            # Store the text as it is sent to the translator
+            ocrtext = ocrtext.replace("\n", "")
+        memory.add(ocrtext, src, tgt, transtext)
+        return 1
+    if user['log_ocr'] != 'None' and user['log_translation'] != 'None' and os.path.exists(user['log_ocr']) and os.path.exists(user['log_translation']):
+        # The text logs do not record the languages, assume they are the current ones
+        for ocrtext, transtext in pair_text_logs(user['log_ocr'], user['log_translation']):
+            count += add(ocrtext, transtext)
+    log_store = user.get('log_store', 'None')
+    if log_store != 'None' and os.path.exists(log_store):
+        store = logstore.open_store(log_store)
+        try:
+            for record in store.query():
+                if record.get('lang_target') not in (None, langtarget):
+                    continue
+                # The structured log records the OCR language, which is not always the translation language code
+                count += add(record.get('ocr'), record.get('translation'))
+        finally:
+            store.close()
+    return count
+
+def seed_in_background(memory, config):
+    """Seed a translation memory in a background thread, so that the lookups are not blocked by reading big logs (they just miss until the seeding is done)"""
+    def run():
+        try:
+            count = seed(memory, config)
+            if config['USER']['debug'] == 'True':
+                print('Translation memory seeded with %i texts from the logs' % count)
+        except Exception as exc:
+            print('ERROR: could not seed the translation memory from the logs:')
+            traceback.print_exc()
+    thread = threading.Thread(target=run, name='pyugt-transmemory-seed')
+    thread.daemon = True  # always close thread along with parent process
+    thread.start()
+    return thread
@@ -0,0 +1,7 @@
+# Make the pyugt modules importable directly (eg, import transmemory), like when pyugt.py is launched as a script, so that the tests of the core modules do not need the GUI and hotkeys dependencies. The test doubles of this folder (eg, import stubs) are importable too.
+import os
+import sys
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(tests_dir), 'src', 'pyugt'))
+sys.path.insert(0, tests_dir)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyugt - Python Universal Game Translator
+#
+# Copyright (c) 2020 Stephen Larroque <LRQ3000@gmail.com>
+#
+# Licensed under MTI Public License
+#
+# Local stub translator backends for the tests, simulating the latency, failures and throttling of online services without any network access, to test the backends router (hedging and circuit breakers) and to benchmark offline.
+# They are not available to the users: register_stubs() registers them under the names stub, stub_slow, stub_throttled and stub_flaky, eg to test with translator_lib = stub_throttled and translator_lib_fallback = stub
+# Also provides a local stand-in of the DeepL API (translate and usage endpoints), to test the deepl backend without an account: python tests/stubs.py --deepl 8088 and set translator_lib_deepl_server_url = http://127.0.0.1:8088
+
+
+### Imports
+
+## Native python imports
+# For the DeepL API stand-in
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import optparse
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+## Local modules
+# The pyugt modules are importable directly, see conftest.py, also when this file is run as a script
+if __name__ == "__main__":
+    import os
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'pyugt'))
+import backends
+
+### Stubs
+
+class ThrottledError(Exception):
+    """Raised by a stub when it simulates a throttled service (eg, HTTP 429 Too Many Requests)"""
+    pass
+
+class StubBackend(backends.Backend):
+    """Stub translator: returns the text reversed and tagged with the languages, after a simulated latency. It can also fail randomly (failure_rate, from 0 to 1) and throttle (at most max_requests per window seconds). A batch of texts counts as one request, with the same latency."""
+    batched = True
+    latency = 0.0
+    jitter = 0.0
+    failure_rate = 0.0
+    max_requests = None
+    window = 1.0
+
+    def __init__(self, latency=None, jitter=None, failure_rate=None, max_requests=None, window=None, seed=None):
+        backends.Backend.__init__(self)
+        if latency is not None:
+            self.latency = latency
+        if jitter is not None:
+            self.jitter = jitter
+        if failure_rate is not None:
+            self.failure_rate = failure_rate
+        if max_requests is not None:
+            self.max_requests = max_requests
+        if window is not None:
+            self.window = window
+        self.random = random.Random(seed)
+        self.requests = []  # times of the recent requests, for the throttling
+        self.calls = 0
+        self.stub_lock = threading.Lock()
+
+    def translate(self, text, langsource, langtarget, config):
+        return self.translate_batch([text], langsource, langtarget, config)[0]
+
+    def translate_batch(self, texts, langsource, langtarget, config):
+        with self.stub_lock:
+            self.calls += 1
+            now = time.monotonic()
+            if self.max_requests is not None:
+                self.requests = [t for t in self.requests if now - t < self.window]
+                if len(self.requests) >= self.max_requests:
+                    raise ThrottledError('Too many requests')
+                self.requests.append(now)
+            fail = self.random.random() < self.failure_rate
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        time.sleep(delay)
+        if fail:
+            raise ThrottledError('Simulated failure')
+        return ['[%s>%s] %s' % (langsource, langtarget, text[::-1]) for text in texts]
+
+class SlowStubBackend(StubBackend):
+    """Stub of a slow service, answering after 5 seconds"""
+    latency = 5.0
+
+class ThrottledStubBackend(StubBackend):
+    """Stub of a throttled service, accepting only 1 request every 10 seconds"""
+    latency = 0.2
+    max_requests = 1
+    window = 10.0
+
+class FlakyStubBackend(StubBackend):
+    """Stub of an unreliable service, failing half of the time with a variable latency"""
+    latency = 0.2
+    jitter = 1.0
+    failure_rate = 0.5
+
+# Names of the stubs, for register_stubs()
+STUBS = {
+    'stub': StubBackend,
+    'stub_slow': SlowStubBackend,
+    'stub_throttled': ThrottledStubBackend,
+    'stub_flaky': FlakyStubBackend,
+    }
+
+def register_stubs():
+    """Register the stubs as translator backends, selectable by their names in STUBS"""
+    for name, cls in STUBS.items():
+        backends.register_backend(name, cls)
+
+### DeepL API stand-in
+
+class DeepLStubHandler(BaseHTTPRequestHandler):
+    """Handler of the DeepL API stand-in, implementing the v2/translate and v2/usage endpoints with the stub translator"""
+    # Keep the connections alive, like the real API, so that the connections pooling of the clients can be checked
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        if not self.headers.get('Authorization', '').startswith('DeepL-Auth-Key '):
+            self.send_json(403, {'message': 'Authorization failure, check auth_key'})
+            return False
+        return True
+
+    def read_params(self):
+        """Parameters of the request, sent either as JSON or as a form"""
+        length = int(self.headers.get('Content-Length', '0'))
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(body or '{}')
+        params = dict((key, values if key == 'text' else values[0]) for key, values in parse_qs(body).items())
+        params.update((key, values[0]) for key, values in parse_qs(urlparse(self.path).query).items() if key not in params)
+        return params
+
+    def do_POST(self):
+        params = self.read_params()
+        if not self.authorized():
+            return
+        if urlparse(self.path).path != '/v2/translate':
+            return self.send_json(404, {'message': 'Not found'})
+        texts = params.get('text')
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts or not params.get('target_lang'):
+            return self.send_json(400, {'message': 'Parameter text and target_lang are required'})
+        server = self.server
+        characters = sum(len(text) for text in texts)
+        with server.lock:
+            if server.character_count + characters > server.character_limit:
+                return self.send_json(456, {'message': 'Quota exceeded'})
+            server.character_count += characters
+            server.requests += 1
+        source = (params.get('source_lang') or 'JA').upper()
+        translations = server.backend.translate_batch(texts, source.lower(), params['target_lang'].lower(), {})
+        self.send_json(200, {'translations': [{'detected_source_language': source, 'text': translation, 'billed_characters': len(text)} for text, translation in zip(texts, translations)]})
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/v2/usage':
+            # Read the parameters anyway, so that the connection can be kept alive
+            self.read_params()
+            return self.send_json(404, {'message': 'Not found'})
+        self.read_params()
+        if not self.authorized():
+            return
+        with self.server.lock:
+            usage = {'character_count': self.server.character_count, 'character_limit': self.server.character_limit}
+        self.send_json(200, usage)
+
+    def log_message(self, format, *args):
+        # Do not print each request in the console
+        pass
+
+class DeepLStubServer(ThreadingHTTPServer):
+    """Local stand-in of the DeepL API, translating with a stub translator and counting the characters against a quota. Also counts the requests and the TCP connections, to check that the clients reuse their connections."""
+    daemon_threads = True
+
+    def __init__(self, port=0, host='127.0.0.1', character_limit=500000, latency=0.0):
+        ThreadingHTTPServer.__init__(self, (host, port), DeepLStubHandler)
+        self.lock = threading.Lock()
+        self.backend = StubBackend(latency=latency)
+        self.character_limit = character_limit
+        self.character_count = 0
+        self.requests = 0
+        self.connections = 0
+
+    @property
+    def url(self):
+        return 'http://%s:%i' % self.server_address[:2]
+
+def serve_deepl(port=0, host='127.0.0.1', character_limit=500000, latency=0.0):
+    """Start a DeepL API stand-in in a background thread, returns the server (its url is in server.url, call server.shutdown() to stop it)"""
+    server = DeepLStubServer(port, host=host, character_limit=character_limit, latency=latency)
+    thread = threading.Thread(target=server.serve_forever, name='pyugt-deepl-stub')
+    thread.daemon = True  # always close thread along with parent process
+    thread.start()
+    return server
+
+def main(argv=None):
+    """Run a DeepL API stand-in until interrupted"""
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="usage: %prog --deepl PORT [options]", description="Run local stand-ins of the translators online services, for testing without an account or network access.")
+    parser.add_option("--deepl", dest="deepl", type="int", default=None,
+                        help="Port of the DeepL API stand-in, 0 for any free port")
+    parser.add_option("--limit", dest="limit", type="int", default=500000,
+                        help="Characters quota of the DeepL API stand-in (default: 500000)")
+    parser.add_option("--latency", dest="latency", type="float", default=0.0,
+                        help="Simulated latency of each request in seconds (default: 0)")
+    (options, args) = parser.parse_args(argv)
+    if options.deepl is None:
+        parser.error('Please specify the port of the DeepL API stand-in with --deepl.')
+    server = DeepLStubServer(options.deepl, character_limit=options.limit, latency=options.latency)
+    print('DeepL API stand-in listening on %s, set translator_lib_deepl_server_url = %s in the config file. Press CTRL+C to stop.' % (server.url, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+import pytest
+
+import batch
+
+
+def test_ocr_item_records_errors(tmp_path, monkeypatch):
+    bad = tmp_path / 'bad.png'
+    bad.write_bytes(b'not an image')
+    monkeypatch.setattr(batch, '_worker_config', {'USER': {}})
+    item_id, ocrtext, error = batch.ocr_item((str(bad), str(bad)))
+    assert item_id == str(bad)
+    assert ocrtext == ''
+    assert error.startswith('UnidentifiedImageError')
+
+
+@pytest.mark.parametrize('fmt', ['jsonl', 'csv'])
+def test_failed_results_are_not_done(tmp_path, fmt):
+    path = str(tmp_path / ('results.' + fmt))
+    writer = batch.ResultWriter(path)
+    writer.write('ok.png', 'こんにちは', 'Hello')
+    writer.write('untranslated.png', 'こんにちは', 'ERROR')
+    writer.write('unreadable.png', '', '', 'OSError: cannot read')
+    writer.write('empty.png', '', '')
+    writer.close()
+    assert batch.ResultWriter.done_ids(path) == {'ok.png', 'empty.png'}
+
@@ -0,0 +1,69 @@
+import configparser
+import json
+import os
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+import backends
+import configservice
+import daemon
+import stubs
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'pyugt', 'config.ini')
+
+
+@pytest.fixture
+def server(tmp_path):
+    backends.register_backend('test_daemon_stub', stubs.StubBackend)
+    # Translate with the stub backend only, without the caches
+    parser = configparser.ConfigParser()
+    parser.read(CONFIG_PATH, encoding='utf-8')
+    parser['USER'].update({'translator_lib': 'test_daemon_stub', 'translator_lib_fallback': 'None', 'translation_cache': 'False', 'translation_memory': 'False'})
+    config_path = str(tmp_path / 'config.ini')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        parser.write(f)
+    service = configservice.ConfigService(config_path)
+    server = daemon.serve(service, port=0, workers=1, backlog=1)
+    yield server
+    server.shutdown()
+    server.server_close()
+    backends.BACKENDS.pop('test_daemon_stub', None)
+    backends._instances.pop('test_daemon_stub', None)
+
+
+def post(server, path, body, content_type):
+    request = Request(server.url + path, data=body, headers={'Content-Type': content_type})
+    try:
+        with urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read().decode('utf-8'))
+    except HTTPError as exc:
+        return exc.code, json.loads(exc.read().decode('utf-8'))
+
+
+def test_translate_json(server):
+    status, result = post(server, '/translate', json.dumps({'text': 'hello', 'source': 'en', 'target': 'fr'}).encode('utf-8'), 'application/json')
+    assert status == 200
+    assert result['translation'] == '[en>fr] olleh'
+    assert daemon.DaemonClient(server.url).translate('hello', 'en', 'fr') == ('[en>fr] olleh', None)
+
+
+@pytest.mark.parametrize('path, content_type', [
+    ('/translate', 'text/plain'),
+    ('/translate', 'application/x-www-form-urlencoded'),
+    ('/pipeline', 'text/plain'),
+    ('/ocr', 'multipart/form-data; boundary=x'),
+    ])
+def test_rejects_cross_origin_content_types(server, path, content_type):
+    # The content types that a web page can send to localhost without a CORS preflight
+    status, result = post(server, path, b'hello', content_type)
+    assert status == 415
+    assert server.requests == 1
+
+
+@pytest.mark.parametrize('body', [b'[1, 2]', b'"hello"', b'{"text": '])
+def test_rejects_invalid_json(server, body):
+    status, result = post(server, '/translate', body, 'application/json')
+    assert status == 400
+    assert 'JSON' in result['error']
@@ -0,0 +1,78 @@
+import pytest
+
+import backends
+import stubs
+
+pytest.importorskip('deepl')
+
+
+@pytest.fixture
+def server():
+    server = stubs.serve_deepl()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_config(server, authkey='key-1:fx', **params):
+    config = {'translator_lib': 'deepl', 'translator_lib_deepl_authkey': authkey, 'translator_lib_deepl_server_url': server.url}
+    config.update((key, str(value)) for key, value in params.items())
+    return config
+
+
+def make_backend():
+    backend = backends.DeepLBackend()
+    # Do not check the usage in the background, so that it does not open its own connections while they are counted
+    backend.check_usage_later = lambda client, config: None
+    return backend
+
+
+def test_client_reused_per_authkey(server):
+    backend = make_backend()
+    config = make_config(server)
+    for i in range(3):
+        assert backend.translate('hello', 'ja', 'fr', config) == '[ja>fr] olleh'
+    client = backend.client
+    assert server.requests == 3
+    # A single client and a single kept-alive connection
+    assert server.connections == 1
+    backend.translate('hello', 'ja', 'fr', dict(config))
+    assert backend.client is client
+    # Changing the authkey rebuilds the client, with a new connection
+    config = make_config(server, authkey='key-2:fx')
+    backend.translate('hello', 'ja', 'fr', config)
+    assert backend.client is not client
+    assert server.connections == 2
+    backend.translate('hello', 'ja', 'fr', config)
+    assert server.connections == 2
+    assert server.requests == 6
+
+
+def test_batch_in_one_request(server):
+    backend = make_backend()
+    texts = ['first', 'second', 'third']
+    assert backend.translate_batch(texts, 'ja', 'fr', make_config(server)) == ['[ja>fr] %s' % text[::-1] for text in texts]
+    assert server.requests == 1
+    assert server.character_count == sum(len(text) for text in texts)
+
+
+def test_usage_warning_near_limit(server, capsys):
+    server.character_limit = 100
+    server.character_count = 85
+    backend = make_backend()
+    config = make_config(server, translator_lib_deepl_usage_warning=0.9)
+    backend.translate('hello', 'ja', 'fr', config)
+    assert backend.check_usage(backend.client, config) == (90, 100)
+    assert 'WARNING: 90 of the 100 characters of the DeepL quota are used (90%)' in capsys.readouterr().out
+    # Warned only once
+    backend.check_usage(backend.client, config)
+    assert 'WARNING' not in capsys.readouterr().out
+
+
+def test_no_usage_warning_below_limit(server, capsys):
+    server.character_limit = 100
+    backend = make_backend()
+    config = make_config(server)
+    backend.translate('hello', 'ja', 'fr', config)
+    assert backend.check_usage(backend.client, config) == (5, 100)
+    assert 'WARNING' not in capsys.readouterr().out
@@ -0,0 +1,36 @@
+import threading
+import time
+
+import pipeline
+
+
+def make_pipeline(translate_delay, delivered, **kwargs):
+    def translate_stage(job):
+        time.sleep(translate_delay)
+        job.transtext = job.ocrtext.upper()
+    def ocr_stage(job):
+        job.ocrtext = job.text
+    def deliver(job):
+        delivered.append(job.transtext)
+        done.set()
+    done = threading.Event()
+    return pipeline.TranslationPipeline(ocr_stage, translate_stage, deliver, **kwargs), done
+
+
+def test_slow_translation_older_than_max_age_is_delivered():
+    delivered = []
+    pipe, done = make_pipeline(0.3, delivered, max_age=0.1)
+    pipe.submit(pipeline.Job(text='hello'))
+    assert done.wait(2)
+    assert delivered == ['HELLO']
+
+
+def test_superseded_translation_is_not_delivered():
+    delivered = []
+    pipe, done = make_pipeline(0.2, delivered, translate_workers=2, supersede=True)
+    pipe.submit(pipeline.Job(text='old'))
+    time.sleep(0.05)
+    pipe.submit(pipeline.Job(text='new'))
+    assert done.wait(2)
+    time.sleep(0.3)
+    assert delivered == ['NEW']
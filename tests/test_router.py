@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+import backends
+import router
+import stubs
+
+
+@pytest.fixture
+def register():
+    """Register fresh stub backend instances under unique names, so that their counters and throttling are not shared between tests"""
+    names = []
+    def register(backend):
+        name = 'test_%s_%i' % (type(backend).__name__, len(names))
+        backends.register_backend(name, lambda: backend)
+        names.append(name)
+        return name
+    yield register
+    for name in names:
+        backends.BACKENDS.pop(name, None)
+        backends._instances.pop(name, None)
+
+
+def make_config(primary, fallback, **params):
+    config = {'translator_lib': primary, 'translator_lib_fallback': fallback, 'translator_hedge_delay': '0.1', 'translator_timeout': '3', 'translator_breaker_failures': '2', 'translator_breaker_reset': '30'}
+    config.update((key, str(value)) for key, value in params.items())
+    return config
+
+
+def test_hedging_wins_over_slow_primary(register):
+    slow = register(stubs.SlowStubBackend(latency=1.0))
+    fast = register(stubs.StubBackend())
+    start = time.monotonic()
+    translation, name = router.BackendRouter().translate(make_config(slow, fast), 'hello', 'en', 'fr')
+    assert name == fast
+    assert translation == '[en>fr] olleh'
+    # Answered by the hedge soon after the hedge delay, without waiting for the slow primary
+    assert time.monotonic() - start < 0.8
+
+
+def test_breaker_opens_after_failures(register):
+    failing = register(stubs.FlakyStubBackend(latency=0, jitter=0, failure_rate=1.0))
+    fast = register(stubs.StubBackend())
+    config = make_config(failing, fast, translator_breaker_failures=2)
+    backend_router = router.BackendRouter()
+    for i in range(2):
+        assert backend_router.translate(config, 'hello', 'en', 'fr')[1] == fast
+    breaker = backend_router.breakers[failing]
+    assert breaker.state == router.CircuitBreaker.OPEN
+    # The open circuit skips the failing backend
+    assert backend_router.translate(config, 'hello', 'en', 'fr')[1] == fast
+    assert backends.get_backend(failing).calls == 2
+
+
+def test_breaker_half_open_recovery(register):
+    throttled = register(stubs.ThrottledStubBackend(latency=0, max_requests=1, window=0.3))
+    fast = register(stubs.StubBackend())
+    config = make_config(throttled, fast, translator_breaker_failures=1, translator_breaker_reset=0.3)
+    backend_router = router.BackendRouter()
+    assert backend_router.translate(config, 'hello', 'en', 'fr')[1] == throttled
+    # Throttled: the circuit opens and the fallback answers
+    assert backend_router.translate(config, 'hello', 'en', 'fr')[1] == fast
+    breaker = backend_router.breakers[throttled]
+    assert breaker.state == router.CircuitBreaker.OPEN
+    assert backend_router.translate(config, 'hello', 'en', 'fr')[1] == fast
+    assert backends.get_backend(throttled).calls == 2
+    # After the reset timeout, a trial request goes through and closes the circuit
+    time.sleep(0.4)
+    assert backend_router.translate(config, 'hello', 'en', 'fr')[1] == throttled
+    assert breaker.state == router.CircuitBreaker.CLOSED
+
+
+def test_timeout_bounds_total_wait(register):
+    slow = register(stubs.SlowStubBackend(latency=1.5))
+    slow_fallback = register(stubs.SlowStubBackend(latency=1.5))
+    config = make_config(slow, slow_fallback, translator_timeout=0.5)
+    start = time.monotonic()
+    with pytest.raises(router.AllBackendsFailed):
+        router.BackendRouter().translate(config, 'hello', 'en', 'fr')
+    elapsed = time.monotonic() - start
+    assert 0.5 <= elapsed < 1.0
+
+
+def test_timeout_opens_breaker(register):
+    hung = register(stubs.SlowStubBackend(latency=0.8))
+    config = make_config(hung, 'None', translator_timeout=0.2, translator_breaker_failures=1)
+    backend_router = router.BackendRouter()
+    with pytest.raises(router.AllBackendsFailed):
+        backend_router.translate(config, 'hello', 'en', 'fr')
+    breaker = backend_router.breakers[hung]
+    assert breaker.state == router.CircuitBreaker.OPEN
+    # The late answer of the abandoned request does not close the circuit
+    time.sleep(0.8)
+    assert breaker.state == router.CircuitBreaker.OPEN
+
+
+def test_hung_requests_do_not_starve_fallback(register):
+    hung = register(stubs.SlowStubBackend(latency=1.0))
+    fast = register(stubs.StubBackend())
+    config = make_config(hung, fast, translator_hedge_delay=0.05, translator_breaker_failures=100)
+    backend_router = router.BackendRouter(max_inflight=2)
+    start = time.monotonic()
+    for i in range(6):
+        assert backend_router.translate(config, 'hello', 'en', 'fr')[1] == fast
+    # Once the hung backend has max_inflight requests running, it is skipped without waiting for the hedge delay
+    assert backends.get_backend(hung).calls == 2
+    assert time.monotonic() - start < 0.5
+
+
+def test_registered_stubs():
+    assert 'stub' not in backends.BACKENDS
+    stubs.register_stubs()
+    try:
+        config = make_config('stub_slow', 'stub', translator_hedge_delay=0.05)
+        assert router.BackendRouter().translate(config, 'hello', 'en', 'fr') == ('[en>fr] olleh', 'stub')
+    finally:
+        for name in stubs.STUBS:
+            backends.BACKENDS.pop(name, None)
+            backends._instances.pop(name, None)
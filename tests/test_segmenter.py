@@ -0,0 +1,28 @@
+import pytest
+
+import segmenter
+
+
+def sentences(text):
+    return [sentence for sentence, separator in segmenter.split_sentences(text)]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Mr. Smith went home.', ['Mr. Smith went home.']),
+    ('"Really?" he said.', ['"Really?" he said.']),
+    ('Dr. Watson, e.g. the doctor, came. Mrs. Hudson left.', ['Dr. Watson, e.g. the doctor, came.', 'Mrs. Hudson left.']),
+    ('Wait... what? No way!', ['Wait... what?', 'No way!']),
+    ('It costs 3.5 gold. Buy it?', ['It costs 3.5 gold.', 'Buy it?']),
+    ('"Really?" She left.', ['"Really?"', 'She left.']),
+    ('勇者よ、よくぞ戻った。魔王の城は北にある！', ['勇者よ、よくぞ戻った。', '魔王の城は北にある！']),
+    ('He left.\n\nshe came', ['He left.', 'she came']),
+    ])
+def test_split_sentences(text, expected):
+    assert sentences(text) == expected
+
+
+def test_split_sentences_rebuilds_text():
+    text = 'Mr. Smith went home.  "Really?" he said.\nYes. 勇者よ。戻った！'
+    segments = segmenter.split_sentences(text)
+    assert ''.join(sentence + separator for sentence, separator in segments) == text
+    assert segmenter.join_sentences(segments, [sentence for sentence, separator in segments], 'ja') == text
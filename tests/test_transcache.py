@@ -0,0 +1,64 @@
+import sqlite3
+
+import transcache
+
+
+def read_atimes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return dict(conn.execute('SELECT key, atime FROM translations'))
+    finally:
+        conn.close()
+
+
+def test_disk_hits_defer_atime_updates(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = transcache.SQLiteCache(path, flush_hits=3)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    stored = read_atimes(path)
+    # The hits do not write to the database until flush_hits keys were hit
+    assert cache.get('a') == 'A'
+    assert cache.get('b') == 'B'
+    assert read_atimes(path) == stored
+    assert cache.get('missing') is None
+    cache.put('c', 'C')
+    # The insertion flushed the pending access times
+    atimes = read_atimes(path)
+    assert atimes['a'] > stored['a'] and atimes['b'] > stored['b']
+    assert cache.get('a') == 'A'
+    assert cache.get('b') == 'B'
+    assert cache.get('c') == 'C'
+    flushed = read_atimes(path)
+    assert flushed['c'] > atimes['c']
+    assert cache.get('a') == 'A'
+    cache.close()
+    # Closing flushes the remaining access times
+    assert read_atimes(path)['a'] > flushed['a']
+
+
+def test_eviction_uses_pending_atimes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = transcache.SQLiteCache(path, max_bytes=35)
+    cache.put('old', 'x' * 10)
+    cache.put('new', 'y' * 10)
+    # The oldest entry is hit, so it is the most recently used when the next insertion evicts
+    assert cache.get('old') == 'x' * 10
+    cache.put('more', 'z' * 10)
+    assert cache.get('old') == 'x' * 10
+    assert cache.get('new') is None
+    cache.close()
+
+
+def test_closed_cache_misses_instead_of_raising(tmp_path):
+    cache = transcache.TranslationCache(maxsize=0, path=str(tmp_path / 'cache.sqlite'))
+    cache.put('hello', 'en', 'fr', 'deepl', 'bonjour')
+    cache.close()
+    # A translation still in progress with a cache replaced after a config change
+    assert cache.get('hello', 'en', 'fr', 'deepl') is None
+    cache.put('bye', 'en', 'fr', 'deepl', 'au revoir')
+    cache.close()
+    reopened = transcache.TranslationCache(path=str(tmp_path / 'cache.sqlite'))
+    assert reopened.get('hello', 'en', 'fr', 'deepl') == 'bonjour'
+    assert reopened.get('bye', 'en', 'fr', 'deepl') is None
+    reopened.close()
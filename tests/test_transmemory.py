@@ -0,0 +1,38 @@
+import codecs
+
+import transmemory
+
+
+def write_baseline_log(path, title, stamp, text):
+    """Append an entry the way the text logs were written before the log store, with a BOM at each append"""
+    with codecs.open(path, 'a', 'utf-8-sig') as f:
+        f.write("-> %s at %s:\n" % (title, stamp))
+        f.write(text)
+        f.write("\n---------------------\n")
+
+
+def test_seed_from_baseline_text_logs(tmp_path):
+    log_ocr = str(tmp_path / 'log_ocr.txt')
+    log_translation = str(tmp_path / 'log_trans.txt')
+    entries = [('2020-05-01 10:00:0%i' % i, 'こんにちは、勇者さま%i。' % i, 'Hello, hero %i.' % i) for i in range(5)]
+    for stamp, ocrtext, transtext in entries:
+        write_baseline_log(log_ocr, 'OCR', stamp, ocrtext)
+        write_baseline_log(log_translation, 'Translation', stamp, transtext)
+
+    assert len(transmemory.read_text_log(log_ocr)) == len(entries)
+    config = {'USER': {'lang_source_trans': 'ja', 'lang_target': 'en', 'remove_line_returns': 'True', 'log_ocr': log_ocr, 'log_translation': log_translation, 'log_store': 'None'}}
+    memory = transmemory.TranslationMemory()
+    assert transmemory.seed(memory, config) == len(entries)
+    for stamp, ocrtext, transtext in entries:
+        assert memory.lookup(ocrtext, 'ja', 'en')[0] == transtext
+
+
+def test_fuzzy_lookup():
+    memory = transmemory.TranslationMemory()
+    memory.add('The dragon appeared in the castle!', 'en', 'fr', 'Le dragon est apparu dans le château !')
+    translation, score, matched = memory.lookup('The dragcn appeared in the castle!', 'en', 'fr')
+    assert translation == 'Le dragon est apparu dans le château !'
+    assert 0.9 <= score < 1.0
+    # Different numbers never match
+    memory.add('You found 120 gold coins in the chest.', 'en', 'fr', 'Vous avez trouvé 120 pièces.')
+    assert memory.lookup('You found 150 gold coins in the chest.', 'en', 'fr') is None